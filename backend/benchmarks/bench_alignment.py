@@ -0,0 +1,108 @@
+"""
+Alignment DP benchmark: nested Python lists vs alignment_kernel
+
+Usage (from backend/):
+    python benchmarks/bench_alignment.py [sizes...]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.alignment_kernel import HAS_NUMPY, weighted_alignment
+
+
+def legacy_alignment(rows, n2):
+    """Previous DiffEngine DP: dense similarity matrix, float dp and tuple parents"""
+    n1 = len(rows)
+    sim_matrix = []
+    for cols, vals in rows:
+        row = [0] * n2
+        for col, val in zip(cols, vals):
+            row[col] = val
+        sim_matrix.append(row)
+
+    dp = [[0.0] * (n2 + 1) for _ in range(n1 + 1)]
+    parent = [[None] * (n2 + 1) for _ in range(n1 + 1)]
+    for i in range(1, n1 + 1):
+        for j in range(1, n2 + 1):
+            skip1_score = dp[i-1][j] - 0.01
+            if skip1_score > dp[i][j]:
+                dp[i][j] = skip1_score
+                parent[i][j] = (i-1, j, 'skip1')
+            skip2_score = dp[i][j-1] - 0.01
+            if skip2_score > dp[i][j]:
+                dp[i][j] = skip2_score
+                parent[i][j] = (i, j-1, 'skip2')
+            sim = sim_matrix[i-1][j-1]
+            if sim > 0:
+                score = dp[i-1][j-1] + sim
+                if score > dp[i][j]:
+                    dp[i][j] = score
+                    parent[i][j] = (i-1, j-1, 'match')
+
+    matches = []
+    i, j = n1, n2
+    while i > 0 and j > 0:
+        if parent[i][j] is None:
+            break
+        pi, pj, action = parent[i][j]
+        if action == 'match':
+            matches.append((i-1, j-1))
+        i, j = pi, pj
+    matches.reverse()
+    return matches
+
+
+def make_rows(n1, n2, seed=0):
+    """Sparse scores of a revised document: a shifted diagonal plus random noise"""
+    rnd = random.Random(seed)
+    rows = []
+    shift = 0
+    for i in range(n1):
+        if rnd.random() < 0.05:
+            shift += rnd.choice((-1, 1, 2))
+        cols, vals = [], []
+        j = i + shift
+        if 0 <= j < n2 and rnd.random() < 0.9:
+            cols.append(j)
+            vals.append(2.0 if rnd.random() < 0.7 else round(rnd.uniform(0.7, 1.0), 3))
+        for _ in range(rnd.randint(0, 3)):
+            col = rnd.randrange(n2)
+            if col not in cols:
+                cols.append(col)
+                vals.append(round(rnd.uniform(0.7, 1.0), 3))
+        rows.append((cols, vals))
+    return rows
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [500, 1000, 2000]
+    print(f"NumPy kernel: {'yes' if HAS_NUMPY else 'no (pure Python fallback)'}")
+    print(f"{'lines':>7} | {'legacy s':>9} | {'kernel s':>9} | {'speedup':>7} | "
+          f"{'legacy MB':>9} | {'kernel MB':>9} | {'mem cut':>7} | same")
+    for n in sizes:
+        rows = make_rows(n, n + n // 20, seed=n)
+        n2 = n + n // 20
+        legacy, legacy_time, legacy_peak = measure(legacy_alignment, rows, n2)
+        kernel, kernel_time, kernel_peak = measure(weighted_alignment, rows, n2)
+        print(f"{n:>7} | {legacy_time:>9.2f} | {kernel_time:>9.3f} | {legacy_time / kernel_time:>6.1f}x | "
+              f"{legacy_peak / 2**20:>9.1f} | {kernel_peak / 2**20:>9.1f} | "
+              f"{legacy_peak / max(kernel_peak, 1):>6.1f}x | {legacy == kernel}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Change classification benchmark: per-classifier regex scans vs change_features
+
+Usage (from backend/):
+    python benchmarks/bench_classification.py [changes...]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.change_features import extract_features
+from services.diff_engine import DiffEngine
+
+
+def legacy_classify(old, new):
+    """Previous DiffEngine classifiers: every one re-scans old and new"""
+    old_raw = re.findall(r'\d+[.,]?\d*', old)
+    new_raw = re.findall(r'\d+[.,]?\d*', new)
+    if old_raw != new_raw:
+        classification = "NUMERICAL_CHANGE"
+    elif re.search(r'\d{1,2}[./]\d{1,2}[./]\d{2,4}', old + new):
+        classification = "TEMPORAL_CHANGE"
+    else:
+        classification = "TEXT_CHANGE"
+
+    combined = (old + new).lower()
+    semantic = "GENERAL"
+    for kws, kind in ((["сумм", "рубл", "платеж", "цен"], "FINANCIAL"),
+                      (["срок", "дат", "период"], "TEMPORAL"),
+                      (["ответственност", "штраф", "обязательств"], "LEGAL")):
+        if any(kw in combined for kw in kws):
+            semantic = kind
+            break
+
+    old_nums = [float(n.replace(',', '.')) for n in re.findall(r'\d+[.,]?\d*', old) if n]
+    new_nums = [float(n.replace(',', '.')) for n in re.findall(r'\d+[.,]?\d*', new) if n]
+    shift = None
+    if old_nums and new_nums and old_nums != new_nums and new_nums[0] - old_nums[0] != 0:
+        shift = f"Числовое значение изменилось: {old_nums[0]} → {new_nums[0]}"
+
+    combined = (old + new).lower()
+    old_nums = [float(n.replace(',', '.')) for n in re.findall(r'\d+[.,]?\d*', old) if n]
+    new_nums = [float(n.replace(',', '.')) for n in re.findall(r'\d+[.,]?\d*', new) if n]
+    if old_nums and new_nums and old_nums != new_nums:
+        severity = "CRITICAL" if abs(new_nums[0] - old_nums[0]) / max(old_nums[0], 1) > 0.1 else "MAJOR"
+    elif any(kw in combined for kw in ["ответственност", "штраф", "неустойк", "расторж"]):
+        severity = "CRITICAL"
+    elif any(kw in combined for kw in ["сумм", "рубл", "платеж", "срок"]):
+        severity = "MAJOR"
+    else:
+        severity = "MINOR"
+
+    score = 20
+    numbers = re.findall(r'\d+', old + new)
+    if numbers:
+        max_num = max((int(n) for n in numbers if len(n) < 10), default=0)
+        score += 40 if max_num > 10000 else (25 if max_num > 1000 else 0)
+
+    # _generate_summary
+    re.findall(r'\d+[.,]?\d*', old)
+    re.findall(r'\d+[.,]?\d*', new)
+    return classification, semantic, shift, severity, min(100, score)
+
+
+def current_classify(engine, old, new):
+    features = extract_features(old, new)
+    return (engine._classify_change(features), engine._classify_semantic_change(features),
+            engine._detect_meaning_shift(features), engine._calculate_severity(features),
+            engine._calculate_impact(features))
+
+
+WORDS = ["договор", "стороны", "обязуются", "исполнить", "условия", "настоящего", "пункта",
+         "сумма", "рублей", "срок", "оплаты", "штраф", "неустойка", "ответственность",
+         "период", "поставки", "товара", "цена", "дата", "расторжение", "гарантии"]
+
+
+def make_changes(count, seed=0):
+    """Clause-like old/new line pairs: word swaps, number edits and dates"""
+    rnd = random.Random(seed)
+    changes = []
+    for _ in range(count):
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(8, 30))]
+        if rnd.random() < 0.5:
+            words.insert(rnd.randrange(len(words)), f"{rnd.randint(1, 500000)},{rnd.randint(0, 99):02d}")
+        if rnd.random() < 0.2:
+            words.insert(rnd.randrange(len(words)), f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.2025")
+        old = " ".join(words)
+        edited = list(words)
+        edited[rnd.randrange(len(edited))] = rnd.choice(WORDS + [str(rnd.randint(1, 90000))])
+        changes.append((old, " ".join(edited)))
+    return changes
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    engine = DiffEngine()
+    print(f"{'changes':>8} | {'legacy s':>9} | {'features s':>10} | {'speedup':>7} | same")
+    for count in counts:
+        changes = make_changes(count, seed=count)
+        start = time.perf_counter()
+        legacy = [legacy_classify(old, new) for old, new in changes]
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        current = [current_classify(engine, old, new) for old, new in changes]
+        current_time = time.perf_counter() - start
+        print(f"{count:>8} | {legacy_time:>9.3f} | {current_time:>10.3f} | "
+              f"{legacy_time / current_time:>6.1f}x | {legacy == current}")
+
+
+if __name__ == "__main__":
+    main()
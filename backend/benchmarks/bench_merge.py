@@ -0,0 +1,52 @@
+"""
+Three-way merge benchmark: diff3 hunks on two independently edited revisions
+
+Usage (from backend/):
+    python benchmarks/bench_merge.py [lines...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.merge_engine import MergeEngine
+
+
+def make_base(n):
+    return [f"{i}. Сторона обязуется исполнить условие {i} в срок до {i % 28 + 1}.05.2025" for i in range(n)]
+
+
+def edit(lines, edits, max_span, seed):
+    """Replace `edits` random spans of up to max_span lines with new text"""
+    rnd = random.Random(seed)
+    lines = list(lines)
+    for _ in range(edits):
+        k = rnd.randrange(len(lines) - max_span)
+        lines[k:k + rnd.randint(1, max_span)] = [f"Правка {seed}-{k}-{q}" for q in range(rnd.randint(0, max_span))]
+    return lines
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    engine = MergeEngine()
+    print(f"{'lines':>7} | {'edits':>5} | {'ms':>7} | {'conflicts':>9} | {'auto':>5} | {'unchanged':>9}")
+    for n in sizes:
+        base = make_base(n)
+        for edits, span in ((n // 250, 5), (n // 80, 40)):
+            ours, theirs = edit(base, edits, span, 1), edit(base, edits, span, 2)
+            start = time.perf_counter()
+            result = engine.merge([
+                {"id": "base", "name": "Base", "content": "\n".join(base)},
+                {"id": "ours", "name": "Ours", "content": "\n".join(ours)},
+                {"id": "theirs", "name": "Theirs", "content": "\n".join(theirs)},
+            ], "MOST_RECENT", "base")
+            elapsed = (time.perf_counter() - start) * 1000
+            stats = result["merge_stats"]
+            print(f"{n:>7} | {edits:>5} | {elapsed:>7.1f} | {stats['conflicts']:>9} | "
+                  f"{stats['merged']:>5} | {stats['unchanged']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Version content storage benchmark: full text per version vs snapshots + forward deltas
+
+Reports the storage ratio and the read latency of a version against its
+depth (number of deltas since the last full snapshot), cold and cached.
+
+Usage (from backend/):
+    python benchmarks/bench_version_store.py [versions] [lines]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.myers_diff import blocks_from_opcodes, get_opcodes
+from services.version_store import VersionStore, encode_delta
+
+
+class Version:
+    """Stand-in for DocumentVersion: id, stored_content and parent_version"""
+
+    def __init__(self, version_id, stored_content, parent_version):
+        self.id = version_id
+        self.stored_content = stored_content
+        self.parent_version = parent_version
+
+
+def make_revisions(versions, lines, seed=0):
+    """Texts of a contract revised versions - 1 times, ~1% of the lines touched per revision"""
+    rnd = random.Random(seed)
+    current = [f"{i // 10 + 1}.{i % 10 + 1}. Сторона обязуется исполнить обязательство {i} "
+               f"в срок {rnd.randint(5, 90)} дней с даты подписания." for i in range(lines)]
+    texts = ["\n".join(current)]
+    for revision in range(versions - 1):
+        for _ in range(max(1, lines // 100)):
+            k = rnd.randrange(len(current))
+            action = rnd.random()
+            if action < 0.6:
+                current[k] = current[k].replace("дней", f"рабочих дней (ред. {revision})", 1)
+            elif action < 0.8:
+                current.insert(k, f"Дополнительное условие редакции {revision}.")
+            elif len(current) > 1:
+                del current[k]
+        texts.append("\n".join(current))
+    return texts
+
+
+def build_chain(texts, store):
+    """Versions as the service stores them: compact() each one against its parent"""
+    chain = [Version("v1", texts[0], None)]
+    for number, text in enumerate(texts[1:], start=2):
+        parent = chain[-1]
+        parent_text = texts[number - 2]
+        blocks = blocks_from_opcodes(get_opcodes(parent_text.splitlines(), text.splitlines()))
+        version = Version(f"v{number}", text, parent)
+        store.compact(version, text, encode_delta(parent_text, text, blocks))
+        chain.append(version)
+    return chain
+
+
+def timed_read(store, version, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        text = store.read(version)
+    return text, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    versions = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    texts = make_revisions(versions, lines)
+    full_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    print(f"{versions} versions x ~{lines} lines, full text total {full_bytes / 2**20:.1f} MB")
+    print(f"{'interval':>8} | {'stored MB':>9} | {'ratio':>6} | {'max depth':>9} | "
+          f"{'cold max ms':>11} | {'cold latest ms':>14} | {'cached ms':>9} | exact")
+
+    for interval in (1, 5, 10, 20, versions):
+        store = VersionStore(snapshot_interval=interval, cache_chars=256 * 2**20)
+        chain = build_chain(texts, store)
+        stored_bytes = sum(len(v.stored_content.encode("utf-8")) for v in chain)
+        depths = [store.depth(v) for v in chain]
+
+        # Cold reads: empty cache, every delta from the snapshot is applied
+        deepest = chain[max(range(len(chain)), key=lambda idx: depths[idx])]
+        store.clear()
+        _, cold_max = timed_read(store, deepest, 1)
+        store.clear()
+        _, cold_latest = timed_read(store, chain[-1], 1)
+        _, cached = timed_read(store, chain[-1], 100)
+
+        store.clear()
+        exact = all(store.read(v) == text for v, text in zip(chain, texts))
+        print(f"{interval:>8} | {stored_bytes / 2**20:>9.2f} | {stored_bytes / full_bytes:>6.3f} | "
+              f"{max(depths):>9} | {cold_max:>11.2f} | {cold_latest:>14.2f} | {cached:>9.4f} | {exact}")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,11 +33,37 @@ class Settings(BaseSettings):
     ML_MODEL_VISION: str = os.getenv("ML_MODEL_VISION", "/model")
     ML_TIMEOUT: int = int(os.getenv("ML_TIMEOUT", "120"))
     
+    # Diff engine: line opcode generator ("myers" or "difflib")
+    DIFF_ALGORITHM: str = os.getenv("DIFF_ALGORITHM", "myers")
+    # Latency budget for one comparison in seconds (0 = unlimited)
+    DIFF_TIME_BUDGET: float = float(os.getenv("DIFF_TIME_BUDGET", "15"))
+    # Line normalization profile for matching: exact, whitespace, typography or loose
+    DIFF_NORMALIZATION: str = os.getenv("DIFF_NORMALIZATION", "exact")
+    # Comparison result cache: in-process LRU entries (DB tier expires with FILE_RETENTION_DAYS)
+    COMPARE_CACHE_SIZE: int = int(os.getenv("COMPARE_CACHE_SIZE", "128"))
+    # Comparison jobs: how long finished jobs stay queryable (seconds)
+    COMPARE_JOB_TTL: int = int(os.getenv("COMPARE_JOB_TTL", "3600"))
+    # Merge previews reused by the following create-merge call: seconds they stay valid, max entries
+    MERGE_PREVIEW_TTL: int = int(os.getenv("MERGE_PREVIEW_TTL", "300"))
+    MERGE_PREVIEW_CACHE_SIZE: int = int(os.getenv("MERGE_PREVIEW_CACHE_SIZE", "32"))
+    # Process pool for diff/merge work (0 = run on a thread instead) and per-task timeout in seconds
+    COMPUTE_WORKERS: int = int(os.getenv("COMPUTE_WORKERS", str(os.cpu_count() or 2)))
+    COMPUTE_TASK_TIMEOUT: float = float(os.getenv("COMPUTE_TASK_TIMEOUT", "300"))
+    # Longest chain of stored version deltas composed to diff two versions of a document
+    VERSION_DELTA_MAX_CHAIN: int = int(os.getenv("VERSION_DELTA_MAX_CHAIN", "50"))
+    # Version content: full snapshot every N versions of a chain, deltas in between;
+    # materialized texts kept in memory up to this many characters
+    VERSION_SNAPSHOT_INTERVAL: int = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", "10"))
+    VERSION_CACHE_CHARS: int = int(os.getenv("VERSION_CACHE_CHARS", str(32 * 1024 * 1024)))
+    
     # File storage
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
     MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50 MB
     ALLOWED_EXTENSIONS: list = ["pdf", "docx", "txt"]
     FILE_RETENTION_DAYS: int = int(os.getenv("FILE_RETENTION_DAYS", "7"))  # Files auto-delete after 7 days
+    # Compressed storage of large comparison/merge payloads (smaller ones stay in the DB row)
+    BLOB_DIR: str = os.getenv("BLOB_DIR", "./blobs")
+    BLOB_MIN_BYTES: int = int(os.getenv("BLOB_MIN_BYTES", "4096"))
     
     # Anonymizer settings
     ANONYMIZER_UPLOAD_DIR: str = os.getenv("ANONYMIZER_UPLOAD_DIR", "./anonymizer_uploads")
@@ -50,6 +76,7 @@ settings = Settings()
 
 # Create upload directory if not exists
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+os.makedirs(settings.BLOB_DIR, exist_ok=True)
 os.makedirs(settings.ANONYMIZER_UPLOAD_DIR, exist_ok=True)
 
 # ML Configuration (as specified in requirements)
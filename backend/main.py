@@ -19,7 +19,9 @@ logging.basicConfig(
 from config import settings
 from database import engine, Base
 from routers import auth, documents, compare, merge, extract, anonymizer, docanalysis
-from services.cleanup_service import cleanup_old_files
+from services.cleanup_service import cleanup_old_files, cleanup_comparison_cache, cleanup_blobs
+from services.comparison_jobs import comparison_jobs
+from services.compute_pool import compute_pool
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,9 @@ async def cleanup_scheduler():
             deleted = cleanup_old_files()
             if deleted > 0:
                 logger.info(f"Cleanup scheduler: deleted {deleted} old files")
+            cleanup_comparison_cache()
+            cleanup_blobs()
+            comparison_jobs.evict_expired()
         except Exception as e:
             logger.error(f"Cleanup scheduler error: {e}")
         # Запуск каждый час
@@ -47,9 +52,12 @@ async def lifespan(app: FastAPI):
     logger.info(f"Starting cleanup scheduler (retention: {settings.FILE_RETENTION_DAYS} days)")
     # Запускаем очистку при старте
     cleanup_old_files()
+    cleanup_comparison_cache()
     # Очистка файлов anonymizer
     from anonymizer_utils.file_utils import cleanup_old_files as anon_cleanup
     anon_cleanup()
+    # Поднимаем процессы для diff/merge заранее
+    compute_pool.start()
     # Создаём фоновую задачу
     cleanup_task = asyncio.create_task(cleanup_scheduler())
     yield
@@ -59,6 +67,7 @@ async def lifespan(app: FastAPI):
         await cleanup_task
     except asyncio.CancelledError:
         logger.info("Cleanup scheduler stopped")
+    compute_pool.shutdown()
 
 app = FastAPI(
     title="Документы Про",
@@ -1,5 +1,5 @@
 from models.user import User, Tenant
-from models.document import Document, DocumentVersion
-from models.comparison import DocumentComparison, DocumentMerge
+from models.document import Document, DocumentVersion, VersionDelta
+from models.comparison import DocumentComparison, DocumentMerge, ComparisonCacheEntry, MergeConflictState, MergeProgress
 from models.extraction import ExtractedEntity, RiskAssessment
 from models.audit import AuditLog
@@ -1,10 +1,11 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Boolean, Column, String, Integer, DateTime, Text, ForeignKey, JSON
 from sqlalchemy.dialects.postgresql import ARRAY
 from datetime import datetime
 import uuid
 import enum
 
 from database import Base
+from services.blob_store import blob_store
 
 class MergeStatus(str, enum.Enum):
     IN_PROGRESS = "IN_PROGRESS"
@@ -19,7 +20,7 @@ class DocumentComparison(Base):
     version1_id = Column(String, ForeignKey("document_versions.id"), nullable=False)
     version2_id = Column(String, ForeignKey("document_versions.id"), nullable=False)
     comparison_mode = Column(String(50), nullable=False)  # line-by-line, semantic, impact, clause, legal, timeline
-    result = Column(JSON, nullable=True)  # Full comparison result
+    stored_result = Column("result", JSON, nullable=True)  # Comparison result; large sections are blob pointers
     summary = Column(JSON, nullable=True)  # Quick summary stats
     created_at = Column(DateTime, default=datetime.utcnow)
     created_by = Column(String, ForeignKey("users.id"), nullable=True)
@@ -30,6 +31,30 @@ class DocumentComparison(Base):
     major_changes = Column(Integer, default=0)
     minor_changes = Column(Integer, default=0)
     similarity_score = Column(String(10), nullable=True)  # 0.0 - 1.0
+    
+    @property
+    def result(self):
+        """Full comparison result (loads every section from the blob store)"""
+        return self.load_result()
+    
+    @result.setter
+    def result(self, value):
+        self.stored_result = blob_store.pack_sections(value)
+    
+    def load_result(self, sections=None):
+        """Comparison result with only the given top-level sections (all when None)"""
+        return blob_store.unpack_sections(self.stored_result, sections)
+
+class ComparisonCacheEntry(Base):
+    """Cached DiffEngine result keyed by content hashes and comparison options"""
+    __tablename__ = "comparison_cache"
+    
+    key = Column(String(64), primary_key=True)  # sha256 of texts + options + engine version
+    comparison_mode = Column(String(50), nullable=False)
+    result = Column(JSON, nullable=False)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 class DocumentMerge(Base):
     __tablename__ = "document_merges"
@@ -41,9 +66,51 @@ class DocumentMerge(Base):
     merge_strategy = Column(String(50), nullable=False)  # CONSENSUS, MOST_RECENT, MANUAL
     status = Column(String(20), default=MergeStatus.IN_PROGRESS.value)
     result_version_id = Column(String, ForeignKey("document_versions.id"), nullable=True)
-    conflicts = Column(JSON, nullable=True)  # List of conflicts
+    stored_conflicts = Column("conflicts", JSON, nullable=True)  # List of conflicts or a blob pointer
     conflicts_count = Column(Integer, default=0)
-    resolved_conflicts = Column(JSON, nullable=True)  # Resolved decisions
-    merged_content = Column(Text, nullable=True)
+    resolved_conflicts = Column(JSON, nullable=True)  # Resolved decisions (written once on completion; see MergeConflictState)
+    stored_merged_content = Column("merged_content", Text, nullable=True)  # Text or a blob:// pointer
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
+    
+    @property
+    def conflicts(self):
+        """Conflict list (loaded from the blob store once per instance)"""
+        if "_conflicts" not in self.__dict__:
+            self.__dict__["_conflicts"] = blob_store.unpack(self.stored_conflicts)
+        return self.__dict__["_conflicts"]
+    
+    @conflicts.setter
+    def conflicts(self, value):
+        self.__dict__["_conflicts"] = value
+        self.stored_conflicts = blob_store.pack(value)
+    
+    @property
+    def merged_content(self):
+        """Merged text (loaded from the blob store once per instance)"""
+        if "_merged_content" not in self.__dict__:
+            self.__dict__["_merged_content"] = blob_store.unpack_text(self.stored_merged_content)
+        return self.__dict__["_merged_content"]
+    
+    @merged_content.setter
+    def merged_content(self, value):
+        self.__dict__["_merged_content"] = value
+        self.stored_merged_content = blob_store.pack_text(value)
+
+class MergeConflictState(Base):
+    """Resolution of one merge conflict (the conflict itself stays in DocumentMerge.conflicts)"""
+    __tablename__ = "merge_conflict_states"
+    
+    merge_id = Column(String, ForeignKey("document_merges.id"), primary_key=True)
+    conflict_index = Column(Integer, primary_key=True)
+    needs_resolution = Column(Boolean, nullable=False)  # No consensus variant
+    chosen_variant_index = Column(Integer, nullable=True)  # None until resolved
+    resolved_at = Column(DateTime, nullable=True)
+
+class MergeProgress(Base):
+    """Resolution counters of a merge, updated with every resolution"""
+    __tablename__ = "merge_progress"
+    
+    merge_id = Column(String, ForeignKey("document_merges.id"), primary_key=True)
+    open_conflicts = Column(Integer, nullable=False)  # Needing resolution and not resolved yet
+    resolved_count = Column(Integer, nullable=False, default=0)
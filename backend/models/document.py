@@ -1,10 +1,11 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Float
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Float, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
 import enum
 
 from database import Base
+from services.version_store import version_store
 
 class DocumentStatus(str, enum.Enum):
     DRAFT = "DRAFT"
@@ -42,7 +43,7 @@ class DocumentVersion(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     document_id = Column(String, ForeignKey("documents.id"), nullable=False)
     version_number = Column(Integer, nullable=False, default=1)
-    content = Column(Text, nullable=True)
+    stored_content = Column("content", Text, nullable=True)  # Full text or a delta against the parent (version_store)
     file_path = Column(String(512), nullable=True)
     created_by = Column(String, ForeignKey("users.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -58,3 +59,24 @@ class DocumentVersion(Base):
     parent_version = relationship("DocumentVersion", remote_side=[id])
     comparisons_as_v1 = relationship("DocumentComparison", foreign_keys="DocumentComparison.version1_id")
     comparisons_as_v2 = relationship("DocumentComparison", foreign_keys="DocumentComparison.version2_id")
+    
+    @property
+    def content(self):
+        """Full text of the version (deltas are applied on read)"""
+        return version_store.read(self)
+    
+    @content.setter
+    def content(self, text):
+        self.stored_content = text
+
+class VersionDelta(Base):
+    """Line delta of a version against its parent version (computed in the background)"""
+    __tablename__ = "version_deltas"
+    
+    version_id = Column(String, ForeignKey("document_versions.id"), primary_key=True)
+    parent_version_id = Column(String, ForeignKey("document_versions.id"), nullable=False, index=True)
+    document_id = Column(String, ForeignKey("documents.id"), nullable=False, index=True)
+    parent_lines = Column(Integer, nullable=False)
+    child_lines = Column(Integer, nullable=False)
+    blocks = Column(JSON, nullable=False)  # Matching blocks [parent_line, child_line, size] of identical lines
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,26 +1,57 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Set, Tuple
+import asyncio
+import json
+import logging
 import uuid
 
-from database import get_db
+from config import settings
+from database import get_db, SessionLocal
 from models.document import Document, DocumentVersion
 from models.user import User
 from models.comparison import DocumentComparison
-from services.diff_engine import DiffEngine
+from services.diff_view import DIFF_FORMATS, expand_compact_diff
 from services.ai_service import ai_service
+from services.comparison_cache import comparison_cache
+from services.comparison_jobs import comparison_jobs
+from services.compute_pool import ComputeUnavailableError, compute_pool
+from services import compute_tasks
+from services.version_deltas import version_deltas
+from services.line_normalization import NORMALIZATION_PROFILES
 from services.auth_service import get_current_user
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# Only 2 comparison modes
-COMPARISON_MODES = ["line-by-line", "semantic"]
+# Seconds between job state checks of an event stream
+JOB_POLL_INTERVAL = 0.25
+
+# Background coroutines (jobs, deferred AI summaries), kept referenced until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+# Comparison modes (hierarchical = section-first diff for long structured documents)
+COMPARISON_MODES = ["line-by-line", "semantic", "hierarchical"]
+
+# Line normalization profiles (services.line_normalization); default settings.DIFF_NORMALIZATION
+NORMALIZATION_QUERY = Query(None, enum=list(NORMALIZATION_PROFILES),
+                            description="Line matching profile: exact, whitespace, typography or loose")
+
+# One-to-many comparison limits
+MAX_BATCH_TARGETS = 20
+MAX_MATRIX_VERSIONS = 20
 
 class CompareRequest(BaseModel):
     custom_prompt: Optional[str] = None
 
+class BatchCompareRequest(BaseModel):
+    base_id: str
+    target_ids: List[str]
+
 class ChangeItem(BaseModel):
     id: str
     type: str
@@ -42,99 +73,190 @@ class ComparisonSummary(BaseModel):
     minor_changes: int
     similarity_score: float
 
-@router.post("/{id1}/vs/{id2}")
-async def compare_documents(
-    id1: str,
-    id2: str,
-    mode: str = Query("line-by-line", enum=COMPARISON_MODES),
-    show_full: bool = Query(False, description="Show full document with highlighted differences"),
-    request_body: Optional[CompareRequest] = Body(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Compare two documents with optional AI enhancement for semantic mode (auth required)"""
-    # Get documents (validate ownership)
-    doc1 = db.query(Document).filter(
-        Document.id == id1,
-        Document.uploaded_by == current_user.id
-    ).first()
-    doc2 = db.query(Document).filter(
-        Document.id == id2,
+def _load_text(doc_id: str, current_user: User, db: Session) -> Tuple[str, Optional[DocumentVersion]]:
+    """Text of a document (latest version) or of a specific version, with ownership check"""
+    doc = db.query(Document).filter(
+        Document.id == doc_id,
         Document.uploaded_by == current_user.id
     ).first()
     
-    version1 = None
-    version2 = None
-    
-    if doc1:
-        version1 = db.query(DocumentVersion).filter(
-            DocumentVersion.document_id == doc1.id
-        ).order_by(DocumentVersion.version_number.desc()).first()
-        text1 = doc1.extracted_text or ""
-    else:
-        version1 = db.query(DocumentVersion).filter(DocumentVersion.id == id1).first()
-        if version1:
-            # Check ownership via parent document
-            parent_doc1 = db.query(Document).filter(
-                Document.id == version1.document_id,
-                Document.uploaded_by == current_user.id
-            ).first()
-            if parent_doc1:
-                text1 = version1.content or ""
-            else:
-                raise HTTPException(status_code=404, detail=f"Document/version {id1} not found or access denied")
-        else:
-            raise HTTPException(status_code=404, detail=f"Document/version {id1} not found or access denied")
-    
-    if doc2:
-        version2 = db.query(DocumentVersion).filter(
-            DocumentVersion.document_id == doc2.id
+    if doc:
+        version = db.query(DocumentVersion).filter(
+            DocumentVersion.document_id == doc.id
         ).order_by(DocumentVersion.version_number.desc()).first()
-        text2 = doc2.extracted_text or ""
-    else:
-        version2 = db.query(DocumentVersion).filter(DocumentVersion.id == id2).first()
-        if version2:
-            parent_doc2 = db.query(Document).filter(
-                Document.id == version2.document_id,
-                Document.uploaded_by == current_user.id
-            ).first()
-            if parent_doc2:
-                text2 = version2.content or ""
-            else:
-                raise HTTPException(status_code=404, detail=f"Document/version {id2} not found or access denied")
-        else:
-            raise HTTPException(status_code=404, detail=f"Document/version {id2} not found or access denied")
-    
-    # Perform diff comparison
-    diff_engine = DiffEngine()
-    comparison_result = diff_engine.compare(text1, text2, mode, show_full=show_full)
-    
-    # For semantic mode - call AI for summary
-    ai_enhanced = False
-    ai_summary = None
+        return doc.extracted_text or "", version
+    
+    version = db.query(DocumentVersion).filter(DocumentVersion.id == doc_id).first()
+    if version:
+        # Check ownership via parent document
+        parent_doc = db.query(Document).filter(
+            Document.id == version.document_id,
+            Document.uploaded_by == current_user.id
+        ).first()
+        if parent_doc:
+            return version.content or "", version
+    raise HTTPException(status_code=404, detail=f"Document/version {doc_id} not found or access denied")
+
+def _stored_alignment(text1: str, text2: str, version1: Optional[DocumentVersion],
+                      version2: Optional[DocumentVersion], mode: str, normalization: str,
+                      db: Session) -> Optional[List[Tuple[int, int, int]]]:
+    """Line alignment composed from stored version deltas (line-by-line mode, two versions of one chain)"""
+    # Stored deltas match lines exactly
+    if mode != "line-by-line" or normalization != "exact" or version1 is None or version2 is None:
+        return None
+    # A document id resolves to its text, which must still be the latest version's content
+    if text1 != (version1.content or "") or text2 != (version2.content or ""):
+        return None
+    return version_deltas.alignment(db, version1, version2)
+
+async def _run_comparison(
+    text1: str,
+    text2: str,
+    mode: str,
+    show_full: bool,
+    exact_similarity: bool,
+    time_budget: Optional[float],
+    diff_format: str,
+    custom_prompt: Optional[str],
+    db: Session,
+    progress: Optional[Callable[[str], None]] = None,
+    defer_ai: bool = False,
+    alignment: Optional[List[Tuple[int, int, int]]] = None,
+    normalization: str = "exact"
+) -> Tuple[Dict[str, Any], bool]:
+    """Diff (on the compute pool) plus AI summary for semantic mode; returns (result, cached)
+    
+    alignment (from _stored_alignment) is passed on to the diff engine.
+    
+    With defer_ai the semantic result comes back with ai_summary_status
+    "pending" and is not cached yet - the caller stores it and then runs
+    _complete_ai_summary.
+    """
+    cache_key = _cache_key(text1, text2, mode, show_full, exact_similarity, diff_format, custom_prompt,
+                           alignment is not None, normalization)
+    comparison_result = comparison_cache.get(db, cache_key)
+    if comparison_result is not None:
+        return comparison_result, True
+    
+    # Perform diff comparison in a worker process
+    options = {
+        "show_full": show_full,
+        "exact_similarity": exact_similarity,
+        "time_budget": time_budget,
+        "diff_format": diff_format,
+        "alignment": alignment,
+        "normalization": normalization
+    }
+    try:
+        comparison_result = await compute_pool.run(
+            compute_tasks.compare_texts, text1, text2, mode, options, progress=progress
+        )
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ComputeUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
+    comparison_result["ai_enhanced"] = False
+    
+    # For semantic mode - call AI for summary (now or after the diff is delivered)
     if mode == "semantic":
-        custom_prompt = request_body.custom_prompt if request_body else None
-        try:
-            ai_result = await ai_service.generate_semantic_summary(
-                text1, text2, 
-                comparison_result.get("changes", []),
-                custom_prompt
-            )
-            ai_summary = ai_result.get("summary")
-            ai_enhanced = ai_result.get("ai_used", False)  # Use actual flag
-            comparison_result["ai_summary"] = ai_summary
-        except Exception as e:
-            print(f"AI analysis failed: {e}")
-            # Use rule-based fallback
-            ai_summary = ai_service.generate_fallback_summary(comparison_result.get("changes", []))
-            comparison_result["ai_summary"] = ai_summary
-            ai_enhanced = False
-    
-    comparison_result["ai_enhanced"] = ai_enhanced
+        if defer_ai:
+            comparison_result["ai_summary_status"] = "pending"
+            return comparison_result, False
+        if progress:
+            progress("ai_summary")
+        await _add_ai_summary(comparison_result, text1, text2, custom_prompt)
+    
+    if _is_cacheable(comparison_result, mode):
+        comparison_cache.put(db, cache_key, mode, comparison_result)
+    
+    return comparison_result, False
+
+async def _add_ai_summary(comparison_result: Dict[str, Any], text1: str, text2: str,
+                          custom_prompt: Optional[str]) -> None:
+    """Set ai_summary / ai_enhanced on a semantic result (rule-based fallback if the LLM fails)"""
+    try:
+        ai_result = await ai_service.generate_semantic_summary(
+            text1, text2, 
+            comparison_result.get("changes", []),
+            custom_prompt
+        )
+        comparison_result["ai_summary"] = ai_result.get("summary")
+        comparison_result["ai_enhanced"] = ai_result.get("ai_used", False)  # Use actual flag
+    except Exception as e:
+        print(f"AI analysis failed: {e}")
+        # Use rule-based fallback
+        comparison_result["ai_summary"] = ai_service.generate_fallback_summary(comparison_result.get("changes", []))
+        comparison_result["ai_enhanced"] = False
+    comparison_result["ai_summary_status"] = "done"
+
+async def _complete_ai_summary(comparison_id: str, comparison_result: Dict[str, Any],
+                               text1: str, text2: str, mode: str, custom_prompt: Optional[str],
+                               cache_key: str) -> None:
+    """Deferred AI summary: generate it, update the stored comparison and cache the full result"""
+    await _add_ai_summary(comparison_result, text1, text2, custom_prompt)
+    db = SessionLocal()
+    try:
+        comparison = db.query(DocumentComparison).filter(DocumentComparison.id == comparison_id).first()
+        if comparison:
+            comparison.result = comparison_result
+            flag_modified(comparison, "stored_result")
+            db.commit()
+        if _is_cacheable(comparison_result, mode):
+            comparison_cache.put(db, cache_key, mode, comparison_result)
+    except Exception as e:
+        logger.error(f"Storing AI summary of {comparison_id} failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+def _start_background(coro) -> asyncio.Task:
+    """Run a coroutine after the response is sent (kept referenced until it finishes)"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def _cache_key(text1: str, text2: str, mode: str, show_full: bool, exact_similarity: bool,
+               diff_format: str, custom_prompt: Optional[str] = None, composed: bool = False,
+               normalization: str = "exact") -> str:
+    """Same texts + same options -> cached result (diff and AI summary)"""
+    options = {
+        "show_full": show_full,
+        "exact_similarity": exact_similarity,
+        "diff_format": diff_format,
+        "algorithm": settings.DIFF_ALGORITHM,
+        "custom_prompt": custom_prompt if mode == "semantic" else None
+    }
+    # A composed alignment may differ from a fresh one
+    if composed:
+        options["alignment"] = "version-deltas"
+    if normalization != "exact":
+        options["normalization"] = normalization
+    return comparison_cache.make_key(text1, text2, mode, **options)
+
+def _is_cacheable(comparison_result: Dict[str, Any], mode: str) -> bool:
+    """Degraded diffs and semantic results without AI are not cached - a retry may do better"""
+    degraded = comparison_result.get("mode_info", {}).get("fidelity", {}).get("degraded", False)
+    return not degraded and (mode != "semantic" or comparison_result.get("ai_enhanced", False))
+
+def _chunks(items: List[Any], parts: int) -> List[List[Any]]:
+    """Split items into at most `parts` contiguous chunks of near-equal size"""
+    parts = max(1, min(parts, len(items)))
+    size, extra = divmod(len(items), parts)
+    chunks, start = [], 0
+    for idx in range(parts):
+        end = start + size + (1 if idx < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+def _save_comparison(db: Session, id1: str, id2: str,
+                     version1: Optional[DocumentVersion], version2: Optional[DocumentVersion],
+                     mode: str, comparison_result: Dict[str, Any]) -> str:
+    """Store a comparison result and return its id"""
     comparison_id = str(uuid.uuid4())
     
-    # Save comparison
     db_comparison = DocumentComparison(
         id=comparison_id,
         tenant_id="default",
@@ -158,8 +280,12 @@ async def compare_documents(
     )
     db.add(db_comparison)
     db.commit()
-    
-    # Build response
+    return comparison_id
+
+def _build_response(comparison_id: str, id1: str, id2: str, mode: str,
+                    comparison_result: Dict[str, Any], changes: List[Dict[str, Any]],
+                    include_view: bool = True) -> Dict[str, Any]:
+    """API response for a comparison (changes may be one page of the result)"""
     response = {
         "id": comparison_id,
         "document_id_v1": id1,
@@ -167,21 +293,367 @@ async def compare_documents(
         "comparison_mode": mode,
         "generated_at": datetime.utcnow().isoformat(),
         "summary": comparison_result["summary"],
-        "changes": comparison_result["changes"],
-        "ai_enhanced": ai_enhanced
+        "changes": changes,
+        "ai_enhanced": comparison_result.get("ai_enhanced", False)
     }
     
-    if ai_summary:
-        response["ai_summary"] = ai_summary
+    if comparison_result.get("ai_summary"):
+        response["ai_summary"] = comparison_result["ai_summary"]
     
-    if "diff_lines" in comparison_result:
+    if "ai_summary_status" in comparison_result:
+        response["ai_summary_status"] = comparison_result["ai_summary_status"]
+    
+    if include_view and "diff_lines" in comparison_result:
         response["diff_lines"] = comparison_result["diff_lines"]
     
+    if include_view and "diff" in comparison_result:
+        response["diff"] = comparison_result["diff"]
+    
     if "mode_info" in comparison_result:
         response["mode_info"] = comparison_result["mode_info"]
     
     return response
 
+@router.post("/{id1}/vs/{id2}")
+async def compare_documents(
+    id1: str,
+    id2: str,
+    mode: str = Query("line-by-line", enum=COMPARISON_MODES),
+    show_full: bool = Query(False, description="Show full document with highlighted differences"),
+    exact_similarity: bool = Query(False, description="Compute character-level similarity score (slow on large documents)"),
+    time_budget: Optional[float] = Query(None, gt=0, le=300, description="Diff latency budget in seconds (default DIFF_TIME_BUDGET)"),
+    diff_format: str = Query("compact", enum=DIFF_FORMATS, description="Side-by-side payload: compact ops or legacy per-line HTML rows"),
+    wait_for_ai: bool = Query(False, description="Semantic mode: wait for the AI summary instead of polling /{id}/ai-summary"),
+    normalization: Optional[str] = NORMALIZATION_QUERY,
+    request_body: Optional[CompareRequest] = Body(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Compare two documents with optional AI enhancement for semantic mode (auth required)
+    
+    The diff is returned as soon as it is ready; in semantic mode the AI
+    summary follows via GET /{comparison_id}/ai-summary (ai_summary_status
+    "pending") unless wait_for_ai is set.
+    """
+    # Get documents (validate ownership)
+    text1, version1 = _load_text(id1, current_user, db)
+    text2, version2 = _load_text(id2, current_user, db)
+    
+    custom_prompt = request_body.custom_prompt if request_body else None
+    normalization = normalization or settings.DIFF_NORMALIZATION
+    comparison_result, cached = await _run_comparison(
+        text1, text2, mode, show_full, exact_similarity, time_budget, diff_format, custom_prompt, db,
+        defer_ai=not wait_for_ai,
+        alignment=_stored_alignment(text1, text2, version1, version2, mode, normalization, db),
+        normalization=normalization
+    )
+    
+    comparison_id = _save_comparison(db, id1, id2, version1, version2, mode, comparison_result)
+    
+    if comparison_result.get("ai_summary_status") == "pending":
+        cache_key = _cache_key(text1, text2, mode, show_full, exact_similarity, diff_format, custom_prompt,
+                               normalization=normalization)
+        _start_background(_complete_ai_summary(
+            comparison_id, comparison_result, text1, text2, mode, custom_prompt, cache_key
+        ))
+    
+    response = _build_response(comparison_id, id1, id2, mode, comparison_result, comparison_result["changes"])
+    response["cached"] = cached
+    return response
+
+# ==================== ONE-TO-MANY ====================
+
+@router.post("/batch")
+async def compare_batch(
+    request: BatchCompareRequest,
+    mode: str = Query("line-by-line", enum=COMPARISON_MODES),
+    show_full: bool = Query(False, description="Show full document with highlighted differences"),
+    exact_similarity: bool = Query(False, description="Compute character-level similarity score (slow on large documents)"),
+    time_budget: Optional[float] = Query(None, gt=0, le=300, description="Diff latency budget in seconds per target (default DIFF_TIME_BUDGET)"),
+    diff_format: str = Query("compact", enum=DIFF_FORMATS, description="Side-by-side payload: compact ops or legacy per-line HTML rows"),
+    normalization: Optional[str] = NORMALIZATION_QUERY,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Compare one base document against several targets (auth required).
+    
+    The base is preprocessed once per worker and the targets are diffed
+    concurrently. Each comparison is stored; the response carries per-target
+    summaries, full results are fetched via GET /{comparison_id}. Semantic
+    mode runs without the AI summary.
+    """
+    if not request.target_ids:
+        raise HTTPException(status_code=400, detail="At least 1 target document required")
+    if len(request.target_ids) > MAX_BATCH_TARGETS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BATCH_TARGETS} targets can be compared at once")
+    
+    base_text, base_version = _load_text(request.base_id, current_user, db)
+    targets = [(target_id, *_load_text(target_id, current_user, db)) for target_id in request.target_ids]
+    
+    # Cached pairs are served as is, the rest is split across the workers
+    normalization = normalization or settings.DIFF_NORMALIZATION
+    cache_keys = [_cache_key(base_text, text, mode, show_full, exact_similarity, diff_format,
+                             normalization=normalization)
+                  for _, text, _ in targets]
+    results: List[Optional[Dict[str, Any]]] = [comparison_cache.get(db, key) for key in cache_keys]
+    cached = [result is not None for result in results]
+    
+    pending = [idx for idx, result in enumerate(results) if result is None]
+    options = {
+        "show_full": show_full,
+        "exact_similarity": exact_similarity,
+        "time_budget": time_budget,
+        "diff_format": diff_format,
+        "normalization": normalization
+    }
+    chunks = _chunks(pending, compute_pool.max_workers)
+    try:
+        chunk_results = await asyncio.gather(*(
+            compute_pool.run(compute_tasks.compare_batch, base_text, [targets[idx][1] for idx in chunk], mode, options)
+            for chunk in chunks
+        ))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ComputeUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        for idx, comparison_result in zip(chunk, chunk_result):
+            comparison_result["ai_enhanced"] = False
+            if _is_cacheable(comparison_result, mode):
+                comparison_cache.put(db, cache_keys[idx], mode, comparison_result)
+            results[idx] = comparison_result
+    
+    items = []
+    for (target_id, _, target_version), comparison_result, was_cached in zip(targets, results, cached):
+        comparison_id = _save_comparison(db, request.base_id, target_id, base_version, target_version,
+                                         mode, comparison_result)
+        items.append({
+            "target_id": target_id,
+            "comparison_id": comparison_id,
+            "summary": comparison_result["summary"],
+            "fidelity": comparison_result.get("mode_info", {}).get("fidelity"),
+            "cached": was_cached
+        })
+    
+    return {
+        "base_id": request.base_id,
+        "comparison_mode": mode,
+        "generated_at": datetime.utcnow().isoformat(),
+        "results": items
+    }
+
+@router.get("/documents/{document_id}/matrix")
+async def compare_version_matrix(
+    document_id: str,
+    mode: str = Query("line-by-line", enum=COMPARISON_MODES),
+    time_budget: Optional[float] = Query(None, gt=0, le=300, description="Diff latency budget in seconds per pair (default DIFF_TIME_BUDGET)"),
+    normalization: Optional[str] = NORMALIZATION_QUERY,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Pairwise change counts and similarity across all versions of a document (auth required)"""
+    doc = db.query(Document).filter(
+        Document.id == document_id,
+        Document.uploaded_by == current_user.id
+    ).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    versions = db.query(DocumentVersion).filter(
+        DocumentVersion.document_id == document_id
+    ).order_by(DocumentVersion.version_number).all()
+    if len(versions) < 2:
+        raise HTTPException(status_code=400, detail="At least 2 versions required")
+    if len(versions) > MAX_MATRIX_VERSIONS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_MATRIX_VERSIONS} versions supported")
+    
+    # Row i diffs version i (prepared once) against every later version
+    texts = [version.content or "" for version in versions]
+    options = {"show_full": False, "time_budget": time_budget, "normalization": normalization}
+    try:
+        rows = await asyncio.gather(*(
+            compute_pool.run(compute_tasks.compare_batch, texts[i], texts[i + 1:], mode, options, True)
+            for i in range(len(texts) - 1)
+        ))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ComputeUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    size = len(versions)
+    changes = [[0] * size for _ in range(size)]
+    similarity = [[1.0] * size for _ in range(size)]
+    degraded = False
+    for i, row in enumerate(rows):
+        for offset, pair in enumerate(row):
+            j = i + 1 + offset
+            changes[i][j] = changes[j][i] = pair["summary"]["total_changes"]
+            similarity[i][j] = similarity[j][i] = pair["summary"]["similarity_score"]
+            degraded = degraded or pair["mode_info"].get("fidelity", {}).get("degraded", False)
+    
+    return {
+        "document_id": document_id,
+        "comparison_mode": mode,
+        "versions": [
+            {"id": v.id, "version_number": v.version_number, "created_at": v.created_at}
+            for v in versions
+        ],
+        "changes": changes,
+        "similarity": similarity,
+        "normalization": normalization or settings.DIFF_NORMALIZATION,
+        "degraded": degraded
+    }
+
+# ==================== ASYNC JOBS ====================
+
+async def _run_job(job_id: str, id1: str, id2: str,
+                   version1_id: Optional[str], version2_id: Optional[str],
+                   text1: str, text2: str, mode: str, options: Dict[str, Any]) -> None:
+    """Run a comparison job to completion with its own DB session"""
+    db = SessionLocal()
+    try:
+        comparison_result, cached = await _run_comparison(
+            text1, text2, mode, db=db,
+            progress=lambda phase: comparison_jobs.set_phase(job_id, phase),
+            defer_ai=True, **options
+        )
+        comparison_result["cached"] = cached
+        version1 = db.query(DocumentVersion).filter(DocumentVersion.id == version1_id).first() if version1_id else None
+        version2 = db.query(DocumentVersion).filter(DocumentVersion.id == version2_id).first() if version2_id else None
+        comparison_id = _save_comparison(db, id1, id2, version1, version2, mode, comparison_result)
+        
+        # Deliver the diff first, the AI summary follows on the same stream
+        if comparison_result.get("ai_summary_status") == "pending":
+            comparison_jobs.set_diff_ready(job_id, comparison_id, comparison_result)
+            comparison_jobs.set_phase(job_id, "ai_summary")
+            cache_key = _cache_key(text1, text2, mode, options["show_full"], options["exact_similarity"],
+                                   options["diff_format"], options["custom_prompt"],
+                                   options["alignment"] is not None, options["normalization"])
+            await _complete_ai_summary(comparison_id, comparison_result, text1, text2, mode,
+                                       options["custom_prompt"], cache_key)
+        comparison_jobs.finish(job_id, comparison_id, comparison_result)
+    except Exception as e:
+        logger.error(f"Comparison job {job_id} failed: {e}")
+        db.rollback()
+        comparison_jobs.fail(job_id, str(e))
+    finally:
+        db.close()
+
+def _get_job(job_id: str, current_user: User) -> Dict[str, Any]:
+    job = comparison_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача сравнения не найдена")
+    return job
+
+@router.post("/jobs/{id1}/vs/{id2}", status_code=202)
+async def submit_comparison_job(
+    id1: str,
+    id2: str,
+    mode: str = Query("line-by-line", enum=COMPARISON_MODES),
+    show_full: bool = Query(False, description="Show full document with highlighted differences"),
+    exact_similarity: bool = Query(False, description="Compute character-level similarity score (slow on large documents)"),
+    time_budget: Optional[float] = Query(None, gt=0, le=300, description="Diff latency budget in seconds (default DIFF_TIME_BUDGET)"),
+    diff_format: str = Query("compact", enum=DIFF_FORMATS, description="Side-by-side payload: compact ops or legacy per-line HTML rows"),
+    normalization: Optional[str] = NORMALIZATION_QUERY,
+    request_body: Optional[CompareRequest] = Body(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Start a comparison in the background; follow it via /jobs/{job_id} or /jobs/{job_id}/events (auth required)"""
+    text1, version1 = _load_text(id1, current_user, db)
+    text2, version2 = _load_text(id2, current_user, db)
+    
+    job = comparison_jobs.create(current_user.id, id1, id2, mode)
+    normalization = normalization or settings.DIFF_NORMALIZATION
+    options = {
+        "show_full": show_full,
+        "exact_similarity": exact_similarity,
+        "time_budget": time_budget,
+        "diff_format": diff_format,
+        "custom_prompt": request_body.custom_prompt if request_body else None,
+        "alignment": _stored_alignment(text1, text2, version1, version2, mode, normalization, db),
+        "normalization": normalization
+    }
+    _start_background(_run_job(
+        job["id"], id1, id2,
+        version1.id if version1 else None, version2.id if version2 else None,
+        text1, text2, mode, options
+    ))
+    
+    return comparison_jobs.status(job)
+
+@router.get("/jobs/{job_id}")
+async def get_comparison_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Status and progress phase of a comparison job"""
+    return comparison_jobs.status(_get_job(job_id, current_user))
+
+@router.get("/jobs/{job_id}/events")
+async def stream_comparison_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Server-sent events with job progress.
+    
+    A "diff" event is sent once the diff is stored (result pages are
+    available, the AI summary is still pending); the stream ends with a
+    "done" or "error" event.
+    """
+    job = _get_job(job_id, current_user)
+    
+    async def events():
+        seq = -1
+        diff_sent = False
+        while True:
+            if job["seq"] != seq:
+                seq = job["seq"]
+                status = comparison_jobs.status(job)
+                if status["status"] in ("done", "error"):
+                    event = status["status"]
+                elif status["diff_ready"] and not diff_sent:
+                    event = "diff"
+                    diff_sent = True
+                else:
+                    event = "progress"
+                yield f"event: {event}\ndata: {json.dumps(status, ensure_ascii=False)}\n\n"
+                if event in ("done", "error"):
+                    return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/jobs/{job_id}/result")
+async def get_comparison_job_result(
+    job_id: str,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    """Job result with changes paged; the side-by-side view comes with page 1.
+    
+    Available once the diff is ready - in semantic mode ai_summary_status
+    stays "pending" until the job is done.
+    """
+    job = _get_job(job_id, current_user)
+    if job["status"] == "error":
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["result"] is None:
+        raise HTTPException(status_code=400, detail="Сравнение ещё не завершено")
+    
+    comparison_result = job["result"]
+    changes = comparison_result["changes"]
+    offset = (page - 1) * page_size
+    response = _build_response(
+        job["comparison_id"], job["id1"], job["id2"], job["mode"], comparison_result,
+        changes[offset:offset + page_size], include_view=page == 1
+    )
+    response["cached"] = comparison_result.get("cached", False)
+    response["total"] = len(changes)
+    response["page"] = page
+    response["page_size"] = page_size
+    response["pages"] = (len(changes) + page_size - 1) // page_size
+    return response
+
 @router.get("/history")
 async def get_comparison_history(
     page: int = Query(1, ge=1),
@@ -211,19 +683,58 @@ async def get_comparison_history(
         "page_size": page_size
     }
 
+@router.get("/cache/stats")
+async def get_comparison_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit/miss counters of the comparison result cache"""
+    return comparison_cache.stats()
+
+@router.get("/{comparison_id}/ai-summary")
+async def get_comparison_ai_summary(comparison_id: str, db: Session = Depends(get_db)):
+    """AI summary of a semantic comparison; status "pending" while it is being generated"""
+    comparison = db.query(DocumentComparison).filter(DocumentComparison.id == comparison_id).first()
+    if not comparison:
+        raise HTTPException(status_code=404, detail="Comparison not found")
+    
+    result = comparison.load_result(["ai_summary", "ai_summary_status", "ai_enhanced"]) or {}
+    return {
+        "comparison_id": comparison_id,
+        "status": result.get("ai_summary_status", "done" if result.get("ai_summary") else "none"),
+        "ai_summary": result.get("ai_summary"),
+        "ai_enhanced": result.get("ai_enhanced", False)
+    }
+
+@router.get("/{comparison_id}/diff-lines")
+async def get_comparison_diff_lines(comparison_id: str, db: Session = Depends(get_db)):
+    """Side-by-side rows with rendered HTML (legacy diff_lines) for a stored comparison"""
+    comparison = db.query(DocumentComparison).filter(DocumentComparison.id == comparison_id).first()
+    if not comparison:
+        raise HTTPException(status_code=404, detail="Comparison not found")
+    
+    result = comparison.load_result(["diff_lines", "diff"]) or {}
+    if "diff_lines" in result:
+        return result["diff_lines"]
+    if "diff" in result:
+        return expand_compact_diff(result["diff"])
+    raise HTTPException(status_code=404, detail="Comparison has no side-by-side view")
+
 @router.get("/{comparison_id}")
-async def get_comparison(comparison_id: str, db: Session = Depends(get_db)):
-    """Get a specific comparison result"""
+async def get_comparison(
+    comparison_id: str,
+    sections: Optional[str] = Query(None, description="Comma-separated result sections to load, e.g. summary,changes (default: all)"),
+    db: Session = Depends(get_db)
+):
+    """Get a specific comparison result (large sections are read from the blob store only when requested)"""
     comparison = db.query(DocumentComparison).filter(DocumentComparison.id == comparison_id).first()
     if not comparison:
         raise HTTPException(status_code=404, detail="Comparison not found")
     
+    requested = [section.strip() for section in sections.split(",") if section.strip()] if sections else None
     return {
         "id": comparison.id,
         "version1_id": comparison.version1_id,
         "version2_id": comparison.version2_id,
         "comparison_mode": comparison.comparison_mode,
-        "result": comparison.result,
+        "result": comparison.load_result(requested),
         "summary": comparison.summary,
         "created_at": comparison.created_at
     }
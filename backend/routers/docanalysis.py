@@ -27,6 +27,8 @@ except ImportError:
 from config import ML_CONFIG
 
 from anonymizer_core.ml_integration import MLIntegration
+from services.compute_pool import compute_pool
+from services import compute_tasks
 
 try:
     ml_integration = MLIntegration()
@@ -1282,36 +1284,8 @@ async def edit_document(task_id: str, request: EditRequest):
         
         processing_time = time.time() - start_time
         
-        # Generate diff
-        import difflib
-        
-        def _generate_inline_diff(old, new):
-            """Generate inline HTML diff."""
-            # Helper to tokenize by words but keep whitespace
-            def tokenize(text):
-                return re.findall(r'\S+|\s+', text)
-
-            a = tokenize(old)
-            b = tokenize(new)
-            
-            matcher = difflib.SequenceMatcher(None, a, b)
-            html = []
-            
-            for opcode, a0, a1, b0, b1 in matcher.get_opcodes():
-                if opcode == 'equal':
-                    html.append("".join(a[a0:a1]))
-                elif opcode == 'insert':
-                    html.append(f'<span style="background-color: #d4edda; color: #155724; text-decoration: none;">{"".join(b[b0:b1])}</span>')
-                elif opcode == 'delete':
-                    html.append(f'<span style="background-color: #f8d7da; color: #721c24; text-decoration: line-through; opacity: 0.7;">{"".join(a[a0:a1])}</span>')
-                elif opcode == 'replace':
-                    # show del then ins
-                    html.append(f'<span style="background-color: #f8d7da; color: #721c24; text-decoration: line-through; opacity: 0.7;">{"".join(a[a0:a1])}</span>')
-                    html.append(f'<span style="background-color: #d4edda; color: #155724; text-decoration: none;">{"".join(b[b0:b1])}</span>')
-            
-            return "".join(html)
-
-        diff_html = _generate_inline_diff(content, updated_text)
+        # Generate diff (in a worker process)
+        diff_html = await compute_pool.run(compute_tasks.edit_diff_html, content, updated_text)
         
         return {
             "status": "success",
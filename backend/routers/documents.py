@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional, List
@@ -14,6 +14,7 @@ from models.document import Document, DocumentVersion, DocumentStatus
 from models.user import User
 from services.document_processor import DocumentProcessor
 from services.auth_service import get_current_user
+from services.version_deltas import version_deltas
 from config import settings
 
 router = APIRouter()
@@ -54,16 +55,8 @@ class DocumentListResponse(BaseModel):
     page_size: int
 
 
-@router.post("/upload", response_model=DocumentResponse)
-async def upload_document(
-    file: UploadFile = File(...),
-    name: Optional[str] = None,
-    description: Optional[str] = None,
-    folder: Optional[str] = None,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Upload a new document (auth required)"""
+async def _save_upload(file: UploadFile):
+    """Validate and store an uploaded file; returns (file_id, ext, file_path, content)"""
     # Validate file extension
     ext = file.filename.split(".")[-1].lower() if "." in file.filename else ""
     if ext not in settings.ALLOWED_EXTENSIONS:
@@ -83,6 +76,39 @@ async def upload_document(
     with open(file_path, "wb") as f:
         f.write(content)
     
+    return file_id, ext, file_path, content
+
+def _version_response(v: DocumentVersion) -> DocumentVersionResponse:
+    return DocumentVersionResponse(
+        id=v.id,
+        version_number=v.version_number,
+        created_at=v.created_at,
+        change_summary=v.change_summary,
+        change_count=v.change_count or 0,
+        critical_changes=v.critical_changes or 0,
+        major_changes=v.major_changes or 0,
+        minor_changes=v.minor_changes or 0
+    )
+
+def _version_list(db: Session, document_id: str) -> List[DocumentVersion]:
+    """Versions of a document without their content (change counts are stored by version_deltas)"""
+    return db.query(DocumentVersion).options(defer(DocumentVersion.stored_content)).filter(
+        DocumentVersion.document_id == document_id
+    ).order_by(DocumentVersion.version_number).all()
+
+
+@router.post("/upload", response_model=DocumentResponse)
+async def upload_document(
+    file: UploadFile = File(...),
+    name: Optional[str] = None,
+    description: Optional[str] = None,
+    folder: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload a new document (auth required)"""
+    file_id, ext, file_path, content = await _save_upload(file)
+    
     # Calculate hash
     content_hash = hashlib.sha256(content).hexdigest()
     
@@ -251,19 +277,66 @@ async def get_versions(
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    return [
-        DocumentVersionResponse(
-            id=v.id,
-            version_number=v.version_number,
-            created_at=v.created_at,
-            change_summary=v.change_summary,
-            change_count=v.change_count or 0,
-            critical_changes=v.critical_changes or 0,
-            major_changes=v.major_changes or 0,
-            minor_changes=v.minor_changes or 0
-        )
-        for v in (doc.versions or [])
-    ]
+    return [_version_response(v) for v in _version_list(db, document_id)]
+
+@router.post("/{document_id}/versions", response_model=DocumentVersionResponse)
+async def upload_version(
+    document_id: str,
+    file: UploadFile = File(...),
+    change_summary: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload a new version of a document (auth required, owner only)
+    
+    The version becomes the child of the latest version. The document's
+    file_path, original_filename, file_size, page_count, content_hash and
+    extracted_text are replaced with the new file's, so the document always
+    describes its latest version; earlier files stay reachable through their
+    versions. The version's delta to its parent and its change counts are
+    computed in the background and show up in /versions and /timeline when ready.
+    """
+    doc = db.query(Document).filter(
+        Document.id == document_id,
+        Document.uploaded_by == current_user.id
+    ).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    file_id, ext, file_path, content = await _save_upload(file)
+    processor = DocumentProcessor()
+    extracted_text, page_count = processor.extract_text(file_path, ext)
+    
+    parent = db.query(DocumentVersion).options(defer(DocumentVersion.stored_content)).filter(
+        DocumentVersion.document_id == document_id
+    ).order_by(DocumentVersion.version_number.desc()).first()
+    
+    version = DocumentVersion(
+        id=str(uuid.uuid4()),
+        document_id=document_id,
+        version_number=parent.version_number + 1 if parent else 1,
+        content=extracted_text,
+        file_path=file_path,
+        created_by=current_user.id,
+        created_at=datetime.utcnow(),
+        parent_version_id=parent.id if parent else None,
+        change_summary=change_summary
+    )
+    db.add(version)
+    
+    # The document always shows its latest version (its previous metadata is overwritten)
+    doc.file_path = file_path
+    doc.original_filename = file.filename
+    doc.file_size = len(content)
+    doc.page_count = page_count
+    doc.content_hash = hashlib.sha256(content).hexdigest()
+    doc.extracted_text = extracted_text
+    db.commit()
+    
+    if version.parent_version_id:
+        version_deltas.schedule(version.id)
+    
+    return _version_response(version)
 
 @router.get("/{document_id}/timeline", response_model=TimelineResponse)
 async def get_timeline(
@@ -282,19 +355,7 @@ async def get_timeline(
     return TimelineResponse(
         document_id=doc.id,
         document_name=doc.name,
-        versions=[
-            DocumentVersionResponse(
-                id=v.id,
-                version_number=v.version_number,
-                created_at=v.created_at,
-                change_summary=v.change_summary,
-                change_count=v.change_count or 0,
-                critical_changes=v.critical_changes or 0,
-                major_changes=v.major_changes or 0,
-                minor_changes=v.minor_changes or 0
-            )
-            for v in (doc.versions or [])
-        ]
+        versions=[_version_response(v) for v in _version_list(db, document_id)]
     )
 
 @router.get("/{document_id}/content")
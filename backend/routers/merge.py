@@ -6,7 +6,8 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
+import asyncio
 import uuid
 
 from database import get_db
@@ -14,12 +15,17 @@ from models.document import Document, DocumentVersion
 from models.user import User
 from models.comparison import DocumentMerge, MergeStatus
 from services.merge_engine import MergeEngine
+from services.compute_pool import ComputeUnavailableError, compute_pool
+from services import compute_tasks
+from services.merge_preview_cache import merge_preview_cache
+from services.merge_resolutions import merge_resolutions
 from services.audit_service import get_audit_service
 from services.auth_service import get_current_user
 
 router = APIRouter()
 
-MERGE_STRATEGIES = ["MOST_RECENT", "MANUAL"]
+# CONSENSUS: N-way merges take the variant of a strict majority of documents per hunk
+MERGE_STRATEGIES = ["MOST_RECENT", "MANUAL", "CONSENSUS"]
 
 
 class MergeRequest(BaseModel):
@@ -65,6 +71,18 @@ class BulkResolveRequest(BaseModel):
     resolutions: List[ResolveConflictRequest]
 
 
+async def _merge_alignments(contents: List[Dict[str, Any]],
+                            base_version_id: Optional[str] = None) -> Optional[List[List[List[int]]]]:
+    """N-way merges: align every document to the base concurrently on the compute pool"""
+    plan = MergeEngine().alignment_plan(contents, base_version_id)
+    if plan is None:
+        return None
+    base_text, texts = plan
+    return list(await asyncio.gather(*(
+        compute_pool.run(compute_tasks.merge_alignment, base_text, text) for text in texts
+    )))
+
+
 @router.post("/", response_model=MergeResponse)
 async def create_merge(
     request: MergeRequest, 
@@ -122,13 +140,23 @@ async def create_merge(
             else:
                 raise HTTPException(status_code=404, detail=f"Document {doc_id} not found or access denied")
     
-    # Perform merge
+    # Perform merge (in a worker process) unless a fresh preview of the same sources has it
     merge_engine = MergeEngine()
-    merge_result = merge_engine.merge(
-        contents, 
-        request.merge_strategy,
-        request.base_version_id
-    )
+    preview_key = merge_preview_cache.make_key(contents, request.merge_strategy, request.base_version_id)
+    merge_result = merge_preview_cache.get(preview_key)
+    if merge_result is None:
+        try:
+            merge_result = await compute_pool.run(
+                compute_tasks.merge_documents,
+                contents, 
+                request.merge_strategy,
+                request.base_version_id,
+                await _merge_alignments(contents, request.base_version_id)
+            )
+        except TimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except ComputeUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
     
     merge_id = str(uuid.uuid4())
     
@@ -150,6 +178,7 @@ async def create_merge(
         created_at=datetime.utcnow()
     )
     db.add(db_merge)
+    merge_resolutions.create(db, merge_id, merge_result["conflicts"])
     db.commit()
     
     # Log audit
@@ -227,8 +256,18 @@ async def preview_merge(
             else:
                 raise HTTPException(status_code=404, detail=f"Document {doc_id} not found or access denied")
     
-    merge_engine = MergeEngine()
-    result = merge_engine.preview_merge(contents, request.merge_strategy)
+    try:
+        result = await compute_pool.run(compute_tasks.preview_merge, contents, request.merge_strategy,
+                                        request.base_version_id,
+                                        await _merge_alignments(contents, request.base_version_id))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ComputeUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    # Kept briefly for the create-merge call that usually follows
+    merge_preview_cache.put(
+        merge_preview_cache.make_key(contents, request.merge_strategy, request.base_version_id), result
+    )
     
     return {
         "preview": True,
@@ -247,7 +286,8 @@ async def get_merge_status(merge_id: str, db: Session = Depends(get_db)):
     if not merge:
         raise HTTPException(status_code=404, detail="Merge not found")
     
-    resolved_count = len(merge.resolved_conflicts or [])
+    progress = merge_resolutions.progress(db, merge)
+    resolved_count = progress.resolved_count
     unresolved_count = merge.conflicts_count - resolved_count
     
     return {
@@ -269,28 +309,36 @@ async def get_merge_conflicts(merge_id: str, db: Session = Depends(get_db)):
     if not merge:
         raise HTTPException(status_code=404, detail="Merge not found")
     
-    resolved_indices = {r["conflict_index"] for r in (merge.resolved_conflicts or [])}
+    resolutions = merge_resolutions.resolutions(db, merge)
+    resolved = {r["conflict_index"]: r["chosen_variant_index"] for r in resolutions}
     
     conflicts_with_status = []
     for c in (merge.conflicts or []):
         c_copy = dict(c)
-        c_copy["is_resolved"] = c["index"] in resolved_indices
+        c_copy["is_resolved"] = c["index"] in resolved
         if c_copy["is_resolved"]:
-            resolution = next((r for r in merge.resolved_conflicts if r["conflict_index"] == c["index"]), None)
-            if resolution:
-                c_copy["chosen_variant_index"] = resolution["chosen_variant_index"]
+            c_copy["chosen_variant_index"] = resolved[c["index"]]
         conflicts_with_status.append(c_copy)
     
     return {
         "merge_id": merge.id,
         "conflicts": conflicts_with_status,
-        "resolved_conflicts": merge.resolved_conflicts or [],
+        "resolved_conflicts": resolutions,
         "status": merge.status,
         "total_conflicts": merge.conflicts_count,
-        "resolved_count": len(resolved_indices)
+        "resolved_count": len(resolved)
     }
 
 
+def _complete_merge(db: Session, merge: DocumentMerge) -> None:
+    """All conflicts resolved: apply the resolutions and record them on the merge"""
+    resolutions = merge_resolutions.resolutions(db, merge)
+    merge.merged_content = MergeEngine().apply_resolutions(merge.merged_content, merge.conflicts, resolutions)
+    merge.resolved_conflicts = resolutions
+    merge.status = MergeStatus.COMPLETED.value
+    merge.completed_at = datetime.utcnow()
+
+
 @router.post("/{merge_id}/resolve-conflict")
 async def resolve_conflict(
     merge_id: str, 
@@ -309,35 +357,12 @@ async def resolve_conflict(
     if request.conflict_index >= merge.conflicts_count:
         raise HTTPException(status_code=400, detail="Invalid conflict index")
     
-    # Check if already resolved
-    resolved = merge.resolved_conflicts or []
-    if any(r["conflict_index"] == request.conflict_index for r in resolved):
-        # Update existing resolution
-        for r in resolved:
-            if r["conflict_index"] == request.conflict_index:
-                r["chosen_variant_index"] = request.chosen_variant_index
-                break
-    else:
-        resolved.append({
-            "conflict_index": request.conflict_index, 
-            "chosen_variant_index": request.chosen_variant_index
-        })
-    
-    merge.resolved_conflicts = resolved
+    # Upsert the resolution row; counters are adjusted in place
+    progress = merge_resolutions.resolve(db, merge, [(request.conflict_index, request.chosen_variant_index)])
     
     # Check if all conflicts resolved
-    unresolved = [c for c in merge.conflicts if c.get("consensus_variant") is None]
-    if len(resolved) >= len(unresolved):
-        # Apply resolutions
-        merge_engine = MergeEngine()
-        final_content = merge_engine.apply_resolutions(
-            merge.merged_content, 
-            merge.conflicts, 
-            resolved
-        )
-        merge.merged_content = final_content
-        merge.status = MergeStatus.COMPLETED.value
-        merge.completed_at = datetime.utcnow()
+    if progress.open_conflicts <= 0:
+        _complete_merge(db, merge)
         
         # Log completion
         audit = get_audit_service(db)
@@ -350,11 +375,10 @@ async def resolve_conflict(
     
     db.commit()
     
-    remaining = len(unresolved) - len(resolved)
     return {
         "message": "Conflict resolved",
         "conflict_index": request.conflict_index,
-        "remaining_conflicts": max(0, remaining),
+        "remaining_conflicts": max(0, progress.open_conflicts),
         "status": merge.status,
         "is_complete": merge.status == MergeStatus.COMPLETED.value
     }
@@ -374,39 +398,19 @@ async def resolve_conflicts_bulk(
     if merge.status == MergeStatus.COMPLETED.value:
         raise HTTPException(status_code=400, detail="Merge already completed")
     
-    resolved = merge.resolved_conflicts or []
-    
-    for resolution in request.resolutions:
-        # Update or add resolution
-        existing = next((r for r in resolved if r["conflict_index"] == resolution.conflict_index), None)
-        if existing:
-            existing["chosen_variant_index"] = resolution.chosen_variant_index
-        else:
-            resolved.append({
-                "conflict_index": resolution.conflict_index,
-                "chosen_variant_index": resolution.chosen_variant_index
-            })
-    
-    merge.resolved_conflicts = resolved
+    progress = merge_resolutions.resolve(db, merge, [
+        (resolution.conflict_index, resolution.chosen_variant_index) for resolution in request.resolutions
+    ])
     
     # Check completion
-    unresolved = [c for c in merge.conflicts if c.get("consensus_variant") is None]
-    if len(resolved) >= len(unresolved):
-        merge_engine = MergeEngine()
-        final_content = merge_engine.apply_resolutions(
-            merge.merged_content, 
-            merge.conflicts, 
-            resolved
-        )
-        merge.merged_content = final_content
-        merge.status = MergeStatus.COMPLETED.value
-        merge.completed_at = datetime.utcnow()
+    if progress.open_conflicts <= 0:
+        _complete_merge(db, merge)
     
     db.commit()
     
     return {
         "message": f"Resolved {len(request.resolutions)} conflicts",
-        "remaining_conflicts": max(0, len(unresolved) - len(resolved)),
+        "remaining_conflicts": max(0, progress.open_conflicts),
         "status": merge.status
     }
 
@@ -422,40 +426,25 @@ async def finalize_merge(
     if not merge:
         raise HTTPException(status_code=404, detail="Merge not found")
     
-    # Count truly unresolved conflicts (those without consensus_variant and not manually resolved)
-    resolved_indices = {r["conflict_index"] for r in (merge.resolved_conflicts or [])}
-    unresolved = [
-        c for c in (merge.conflicts or []) 
-        if c.get("consensus_variant") is None and c["index"] not in resolved_indices
-    ]
-    
-    if unresolved:
+    # Truly unresolved conflicts (without consensus_variant and not manually resolved)
+    progress = merge_resolutions.progress(db, merge)
+    if progress.open_conflicts > 0:
         raise HTTPException(
             status_code=400, 
-            detail=f"Merge not completed. {len(unresolved)} conflicts remaining"
+            detail=f"Merge not completed. {progress.open_conflicts} conflicts remaining"
         )
     
-    # Apply all resolutions to get final content
-    merge_engine = MergeEngine()
-    final_content = merge.merged_content or ""
-    
-    # First apply consensus variants
-    for conflict in (merge.conflicts or []):
-        if conflict.get("consensus_variant") is not None:
-            variant_idx = conflict["consensus_variant"]
-            if variant_idx < len(conflict.get("variants", [])):
-                replacement = conflict["variants"][variant_idx].get("content", "")
-                if replacement in ["(deleted)", "(absent)"]:
-                    replacement = ""
-                final_content = final_content.replace(f"<<<CONFLICT_{conflict['index']}>>>", replacement)
-    
-    # Then apply manual resolutions
-    if merge.resolved_conflicts:
-        final_content = merge_engine.apply_resolutions(
-            final_content, 
-            merge.conflicts or [], 
-            merge.resolved_conflicts
-        )
+    # Apply manual resolutions and consensus variants in one pass
+    # (consensus variants are applied last, so they take precedence as before)
+    consensus = [
+        {"conflict_index": c["index"], "chosen_variant_index": c["consensus_variant"]}
+        for c in (merge.conflicts or []) if c.get("consensus_variant") is not None
+    ]
+    final_content = MergeEngine().apply_resolutions(
+        merge.merged_content or "",
+        merge.conflicts or [],
+        merge_resolutions.resolutions(db, merge) + consensus
+    )
     
     # Create merged document
     doc_name = name or f"Merged Document {datetime.now().strftime('%Y-%m-%d %H:%M')}"
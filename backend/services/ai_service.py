@@ -59,6 +59,8 @@ class AIService:
             result_parts.append(f"ДОБАВЛЕНО: \"{new}\"")
             if new_nums:
                 result_parts.append(f"(содержит числа: {', '.join(new_nums)})")
+        elif change_type == "MOVED" and old:
+            result_parts.append(f"ПЕРЕМЕЩЕНО: \"{old}\"")
         
         return "\n".join(result_parts)
     
@@ -188,6 +190,8 @@ class AIService:
                 parts.append(f"{i}. Добавлено: `{new[:80]}...`")
             elif c.get("type") == "DELETED":
                 parts.append(f"{i}. Удалено: `{old[:80]}...`")
+            elif c.get("type") == "MOVED":
+                parts.append(f"{i}. Перемещено ({c.get('location', '')}): `{old[:60]}...`")
         
         parts.append("\n⚠️ *AI недоступен — автоматическое резюме.*")
         
@@ -0,0 +1,244 @@
+"""
+Line Alignment Kernel
+Integer-encoded lines and a row-wise vectorized weighted LCS for DiffEngine
+"""
+from typing import Dict, List, Sequence, Tuple
+
+from services.line_signatures import LineSignatures, line_ratio, may_reach, passes_trigram_floor
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+# Backtracking directions (one int8/byte per DP cell)
+DIR_NONE = 0
+DIR_UP = 1      # skip line from lines1 (deletion)
+DIR_LEFT = 2    # skip line from lines2 (addition)
+DIR_DIAG = 3    # match lines
+
+# Scores are kept as fixed-point integers so that ties are decided exactly
+SCALE = 10000
+
+# Sparse similarity row: (column indices, scores) of the cells with a positive score
+SparseRow = Tuple[List[int], List[float]]
+
+
+def intern_lines(lines1: Sequence[str], lines2: Sequence[str]) -> Tuple[List[int], List[int]]:
+    """Map every distinct line to an integer ID shared by both documents"""
+    ids: Dict[str, int] = {}
+    ids1 = [ids.setdefault(line, len(ids)) for line in lines1]
+    ids2 = [ids.setdefault(line, len(ids)) for line in lines2]
+    return ids1, ids2
+
+
+def gap_similarity_rows(lines1: Sequence[str], lines2: Sequence[str],
+                        ids1: Sequence[int], ids2: Sequence[int],
+                        sigs1: LineSignatures, sigs2: LineSignatures,
+                        lo1: int, hi1: int, lo2: int, hi2: int,
+                        threshold: float, exact_score: float = 2.0,
+                        blank_score: float = 1.5) -> List[SparseRow]:
+    """Sparse similarity rows for the gap [lo1, hi1) x [lo2, hi2).
+
+    Identical lines score exact_score, two blank lines score blank_score and
+    other non-blank pairs score their SequenceMatcher ratio (sentence-level
+    for long lines, see line_ratio) when it reaches threshold. Length and character-histogram bounds are applied to whole
+    rows at once; only the survivors go through the trigram floor and the
+    exact ratio.
+    """
+    if HAS_NUMPY:
+        return _rows_numpy(lines1, lines2, ids1, ids2, sigs1, sigs2,
+                           lo1, hi1, lo2, hi2, threshold, exact_score, blank_score)
+    return _rows_python(lines1, lines2, ids1, ids2, sigs1, sigs2,
+                        lo1, hi1, lo2, hi2, threshold, exact_score, blank_score)
+
+
+def _rows_numpy(lines1, lines2, ids1, ids2, sigs1, sigs2,
+                lo1, hi1, lo2, hi2, threshold, exact_score, blank_score) -> List[SparseRow]:
+    n2 = hi2 - lo2
+    gap_ids2 = np.asarray(ids2[lo2:hi2], dtype=np.int64)
+    blank2 = np.fromiter((not lines2[j].strip() for j in range(lo2, hi2)), dtype=bool, count=n2)
+    lengths2 = np.fromiter((len(lines2[j]) for j in range(lo2, hi2)), dtype=np.int64, count=n2)
+
+    # Character histograms over the gap alphabet (quick_ratio bound)
+    alphabet: Dict[str, int] = {}
+    for idx in range(lo1, hi1):
+        for ch in sigs1[idx].chars:
+            alphabet.setdefault(ch, len(alphabet))
+    for idx in range(lo2, hi2):
+        for ch in sigs2[idx].chars:
+            alphabet.setdefault(ch, len(alphabet))
+    hist2 = np.zeros((n2, len(alphabet)), dtype=np.int32)
+    for row, idx in enumerate(range(lo2, hi2)):
+        for ch, count in sigs2[idx].chars.items():
+            hist2[row, alphabet[ch]] = count
+    hist1 = np.zeros(len(alphabet), dtype=np.int32)
+
+    rows: List[SparseRow] = []
+    for i in range(lo1, hi1):
+        line1 = lines1[i]
+        exact = gap_ids2 == ids1[i]
+        cols: List[int] = np.flatnonzero(exact).tolist()
+        vals: List[float] = [exact_score] * len(cols)
+
+        if not line1.strip():
+            blanks = np.flatnonzero(blank2 & ~exact).tolist()
+            cols.extend(blanks)
+            vals.extend([blank_score] * len(blanks))
+        else:
+            sig1 = sigs1[i]
+            total = lengths2 + sig1.length
+            candidates = ~exact & ~blank2 & (2 * np.minimum(lengths2, sig1.length) >= threshold * total)
+            if candidates.any():
+                hist1[:] = 0
+                for ch, count in sig1.chars.items():
+                    hist1[alphabet[ch]] = count
+                shared = np.minimum(hist2[candidates], hist1).sum(axis=1)
+                survivors = np.flatnonzero(candidates)[2 * shared >= threshold * total[candidates]]
+                for col in survivors.tolist():
+                    j = lo2 + col
+                    if not passes_trigram_floor(sig1, sigs2[j]):
+                        continue
+                    sim = line_ratio(line1, lines2[j])
+                    if sim >= threshold:
+                        cols.append(col)
+                        vals.append(sim)
+
+        rows.append((cols, vals))
+    return rows
+
+
+def _rows_python(lines1, lines2, ids1, ids2, sigs1, sigs2,
+                 lo1, hi1, lo2, hi2, threshold, exact_score, blank_score) -> List[SparseRow]:
+    rows: List[SparseRow] = []
+    for i in range(lo1, hi1):
+        line1 = lines1[i]
+        blank1 = not line1.strip()
+        cols: List[int] = []
+        vals: List[float] = []
+        for j in range(lo2, hi2):
+            line2 = lines2[j]
+            if ids1[i] == ids2[j]:
+                cols.append(j - lo2)
+                vals.append(exact_score)
+            elif blank1 or not line2.strip():
+                if blank1 and not line2.strip():
+                    cols.append(j - lo2)
+                    vals.append(blank_score)
+            elif may_reach(sigs1[i], sigs2[j], threshold):
+                sim = line_ratio(line1, line2)
+                if sim >= threshold:
+                    cols.append(j - lo2)
+                    vals.append(sim)
+        rows.append((cols, vals))
+    return rows
+
+
+def weighted_alignment(rows: List[SparseRow], n2: int, skip_penalty: float = 0.01) -> List[Tuple[int, int]]:
+    """Order-preserving alignment that maximizes total similarity.
+
+    rows[i] holds the positive scores of line i of the first document against
+    the second one. Recurrence (dp never drops below zero):
+
+        dp[i][j] = max(0, dp[i-1][j] - p, dp[i][j-1] - p, dp[i-1][j-1] + sim[i-1][j-1])
+
+    Ties are resolved in the order none, skip1, skip2, match. Returns the
+    matched (i, j) pairs in increasing order.
+    """
+    n1 = len(rows)
+    if n1 == 0 or n2 == 0:
+        return []
+    if HAS_NUMPY:
+        directions = _fill_numpy(rows, n2, skip_penalty)
+    else:
+        directions = _fill_python(rows, n2, skip_penalty)
+    return _backtrack(directions, n1, n2)
+
+
+def _fill_numpy(rows: List[SparseRow], n2: int, skip_penalty: float):
+    """Row-wise DP: the in-row skip chain is a running maximum of c[k] - p*(j-k)"""
+    penalty = int(round(skip_penalty * SCALE))
+    ramp = np.arange(n2 + 1, dtype=np.int64) * penalty
+    prev = np.zeros(n2 + 1, dtype=np.int64)
+    directions = np.zeros((len(rows), n2), dtype=np.int8)
+    sim = np.zeros(n2, dtype=np.int64)
+
+    for i, (cols, vals) in enumerate(rows):
+        up = prev[1:] - penalty
+        if cols:
+            sim[cols] = np.rint(np.asarray(vals) * SCALE).astype(np.int64)
+            diag = np.where(sim > 0, prev[:-1] + sim, np.iinfo(np.int64).min)
+            sim[cols] = 0
+        else:
+            diag = None
+
+        # Best value without the in-row skip, then propagate skips along the row
+        base = np.zeros(n2 + 1, dtype=np.int64)
+        base[1:] = np.maximum(up, 0)
+        if diag is not None:
+            base[1:] = np.maximum(base[1:], diag)
+        cur = np.maximum.accumulate(base + ramp) - ramp
+
+        left = cur[:-1] - penalty
+        best_up = np.maximum(up, 0)
+        row_dirs = np.where(up > 0, DIR_UP, DIR_NONE)
+        row_dirs = np.where(left > best_up, DIR_LEFT, row_dirs)
+        if diag is not None:
+            row_dirs = np.where(diag > np.maximum(best_up, left), DIR_DIAG, row_dirs)
+        directions[i] = row_dirs
+        prev = cur
+
+    return directions
+
+
+def _fill_python(rows: List[SparseRow], n2: int, skip_penalty: float):
+    """Pure Python fallback with the same fixed-point scores and a bytearray of directions"""
+    penalty = int(round(skip_penalty * SCALE))
+    prev = [0] * (n2 + 1)
+    directions = []
+
+    for cols, vals in rows:
+        sim = dict(zip(cols, (int(round(v * SCALE)) for v in vals)))
+        cur = [0] * (n2 + 1)
+        row_dirs = bytearray(n2)
+        for j in range(1, n2 + 1):
+            best, direction = 0, DIR_NONE
+            score = prev[j] - penalty
+            if score > best:
+                best, direction = score, DIR_UP
+            score = cur[j - 1] - penalty
+            if score > best:
+                best, direction = score, DIR_LEFT
+            s = sim.get(j - 1)
+            if s and s > 0:
+                score = prev[j - 1] + s
+                if score > best:
+                    best, direction = score, DIR_DIAG
+            cur[j] = best
+            row_dirs[j - 1] = direction
+        directions.append(row_dirs)
+        prev = cur
+
+    return directions
+
+
+def _backtrack(directions, n1: int, n2: int) -> List[Tuple[int, int]]:
+    """Follow direction codes from the bottom-right corner back to the start"""
+    matches = []
+    i, j = n1, n2
+    while i > 0 and j > 0:
+        direction = directions[i - 1][j - 1]
+        if direction == DIR_NONE:
+            break
+        if direction == DIR_DIAG:
+            matches.append((i - 1, j - 1))
+            i -= 1
+            j -= 1
+        elif direction == DIR_UP:
+            i -= 1
+        else:
+            j -= 1
+    matches.reverse()
+    return matches
@@ -0,0 +1,190 @@
+"""
+Blob Store
+Content-addressed compressed files for large comparison and merge payloads
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from config import settings
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+logger = logging.getLogger(__name__)
+
+# Key of a blob pointer inside a JSON column: {"$blob": sha256, "codec": ..., "size": ...}
+POINTER_KEY = "$blob"
+# Prefix of a blob pointer stored in a text column
+TEXT_POINTER_PREFIX = "blob://"
+
+CODEC_EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+
+# blob://<codec>/<sha256>; anything else is plain text
+_TEXT_POINTER_RE = re.compile(
+    re.escape(TEXT_POINTER_PREFIX) + r"(" + "|".join(CODEC_EXTENSIONS) + r")/([0-9a-f]{64})\Z"
+)
+
+
+class BlobStore:
+    """Compressed blobs on disk addressed by the sha256 of their content.
+
+    Payloads below min_bytes stay inline; larger ones are written once
+    (identical payloads share a file) and replaced by a small pointer.
+    Rows written before the store existed hold plain values, which
+    unpack() returns unchanged.
+    """
+
+    def __init__(self, root: str = settings.BLOB_DIR, min_bytes: int = settings.BLOB_MIN_BYTES):
+        self.root = root
+        self.min_bytes = min_bytes
+        self.codec = "zstd" if HAS_ZSTD else "gzip"
+
+    # ==================== RAW BLOBS ====================
+    def put(self, data: bytes) -> Dict[str, Any]:
+        """Store data (if not stored yet) and return its pointer"""
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key, self.codec)
+        pointer = {POINTER_KEY: key, "codec": self.codec, "size": len(data)}
+        if os.path.exists(path):
+            # Touch the reused blob, so collect_garbage() treats it as new until the row is committed
+            try:
+                os.utime(path)
+                return pointer
+            except FileNotFoundError:
+                pass  # Collected in between: write it again
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._compress(data))
+        os.replace(tmp_path, path)
+        return pointer
+
+    def get(self, pointer: Dict[str, Any]) -> bytes:
+        """Decompressed content of a pointer"""
+        codec = pointer.get("codec", "gzip")
+        with open(self._path(pointer[POINTER_KEY], codec), "rb") as f:
+            return self._decompress(f.read(), codec)
+
+    # ==================== JSON VALUES ====================
+    def pack(self, value: Any) -> Any:
+        """value, or a pointer to it when its JSON form reaches min_bytes"""
+        if value is None or is_pointer(value):
+            return value
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(data) < self.min_bytes:
+            return value
+        return self.put(data)
+
+    def unpack(self, value: Any) -> Any:
+        """Inverse of pack()"""
+        if is_pointer(value):
+            return json.loads(self.get(value))
+        return value
+
+    def pack_sections(self, obj: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """pack() every top-level value, so sections can be loaded independently"""
+        if obj is None:
+            return None
+        return {key: self.pack(value) for key, value in obj.items()}
+
+    def unpack_sections(self, obj: Optional[Dict[str, Any]],
+                        sections: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """unpack() the requested top-level values (all when sections is None); others are left out"""
+        if obj is None:
+            return None
+        keys = obj.keys() if sections is None else [key for key in sections if key in obj]
+        return {key: self.unpack(obj[key]) for key in keys}
+
+    # ==================== TEXT VALUES ====================
+    def pack_text(self, text: Optional[str]) -> Optional[str]:
+        """text, or a blob:// pointer string when it reaches min_bytes.
+
+        Text starting with blob:// is always stored as a blob, so a stored
+        value with that prefix is never the text itself.
+        """
+        if text is None:
+            return text
+        data = text.encode("utf-8")
+        if len(data) < self.min_bytes and not text.startswith(TEXT_POINTER_PREFIX):
+            return text
+        pointer = self.put(data)
+        return f"{TEXT_POINTER_PREFIX}{pointer['codec']}/{pointer[POINTER_KEY]}"
+
+    def unpack_text(self, value: Optional[str]) -> Optional[str]:
+        """Inverse of pack_text()"""
+        pointer = _text_pointer(value)
+        if pointer is None:
+            return value
+        return self.get(pointer).decode("utf-8")
+
+    # ==================== GARBAGE COLLECTION ====================
+    def collect_garbage(self, referenced: Set[str], min_age_seconds: int = 86400) -> int:
+        """Delete blobs not in referenced and older than min_age_seconds (newer ones may not be committed yet)"""
+        if not os.path.isdir(self.root):
+            return 0
+        cutoff = time.time() - min_age_seconds
+        deleted = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                key = filename.split(".", 1)[0]
+                path = os.path.join(dirpath, filename)
+                if key in referenced:
+                    continue
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        deleted += 1
+                except OSError as e:
+                    logger.error(f"Blob cleanup error for {path}: {e}")
+        return deleted
+
+    def _path(self, key: str, codec: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json" + CODEC_EXTENSIONS[codec])
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    def _decompress(self, data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            if not HAS_ZSTD:
+                raise RuntimeError("zstandard is required to read this blob")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+
+def is_pointer(value: Any) -> bool:
+    return isinstance(value, dict) and POINTER_KEY in value
+
+
+def _text_pointer(value: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Pointer of a blob://<codec>/<sha256> string; None for plain text (including legacy rows)"""
+    match = _TEXT_POINTER_RE.match(value) if value else None
+    if match is None:
+        return None
+    return {POINTER_KEY: match.group(2), "codec": match.group(1)}
+
+
+def referenced_keys(value: Any) -> Set[str]:
+    """Blob keys referenced by a packed JSON value or text column"""
+    if isinstance(value, str):
+        pointer = _text_pointer(value)
+        return {pointer[POINTER_KEY]} if pointer else set()
+    if is_pointer(value):
+        return {value[POINTER_KEY]}
+    if isinstance(value, dict):
+        return {key for item in value.values() if is_pointer(item) for key in [item[POINTER_KEY]]}
+    return set()
+
+
+blob_store = BlobStore()
@@ -0,0 +1,76 @@
+"""
+Change Features
+Numbers, dates and keyword hits of one change, extracted once for all classifiers
+"""
+import re
+from typing import Dict, FrozenSet, List, NamedTuple, Tuple
+
+
+# Keyword stems (matched in lower case anywhere in old + new) by classifier group
+KEYWORD_GROUPS: Dict[str, Tuple[str, ...]] = {
+    "financial": ("сумм", "рубл", "платеж", "цен"),
+    "temporal": ("срок", "дат", "период"),
+    "legal": ("ответственност", "штраф", "обязательств"),
+    "critical": ("ответственност", "штраф", "неустойк", "расторж"),
+    "major": ("сумм", "рубл", "платеж", "срок"),
+}
+
+_NUMBER_RE = re.compile(r'\d+[.,]?\d*')
+_DATE_RE = re.compile(r'\d{1,2}[./]\d{1,2}[./]\d{2,4}')
+
+# Stem -> groups it belongs to
+_STEM_GROUPS: Dict[str, FrozenSet[str]] = {
+    stem: frozenset(group for group, stems in KEYWORD_GROUPS.items() if stem in stems)
+    for stems in KEYWORD_GROUPS.values() for stem in stems
+}
+# Each distinct stem is looked up once per change. For this handful of stems
+# str.__contains__ beats a single regex alternation (or an automaton) over the text.
+_STEMS = tuple(_STEM_GROUPS)
+
+# Digit runs this long are ignored by the impact score
+MAX_IMPACT_DIGITS = 10
+
+
+class ChangeFeatures(NamedTuple):
+    """Everything the change classifiers read from the old and new text"""
+    old_numbers: List[str]  # Number tokens as written ("1 500,00" -> "1", "500,00")
+    new_numbers: List[str]
+    old_values: List[float]
+    new_values: List[float]
+    has_date: bool  # dd.mm.yyyy-like date in old + new
+    groups: FrozenSet[str]  # KEYWORD_GROUPS names with at least one stem hit
+    max_integer: int  # Largest digit run (below MAX_IMPACT_DIGITS digits), 0 if none
+
+
+def extract_features(old: str, new: str) -> ChangeFeatures:
+    """Scan the old and new text of a change once with the precompiled patterns"""
+    old_numbers = _NUMBER_RE.findall(old)
+    new_numbers = _NUMBER_RE.findall(new)
+    combined = old + new
+
+    lowered = combined.lower()
+    groups: FrozenSet[str] = frozenset()
+    for stem in _STEMS:
+        if stem in lowered:
+            groups |= _STEM_GROUPS[stem]
+
+    max_integer = 0
+    for token in old_numbers + new_numbers:
+        for run in token.replace(',', '.').split('.'):
+            if run and len(run) < MAX_IMPACT_DIGITS and int(run) > max_integer:
+                max_integer = int(run)
+
+    return ChangeFeatures(
+        old_numbers=old_numbers,
+        new_numbers=new_numbers,
+        old_values=_values(old_numbers),
+        new_values=_values(new_numbers),
+        # A date needs digits, so number-free changes skip the search
+        has_date=bool(old_numbers or new_numbers) and _DATE_RE.search(combined) is not None,
+        groups=groups,
+        max_integer=max_integer,
+    )
+
+
+def _values(tokens: List[str]) -> List[float]:
+    return [float(token.replace(',', '.')) for token in tokens]
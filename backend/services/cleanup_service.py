@@ -11,6 +11,9 @@ from sqlalchemy.orm import Session
 from config import settings
 from database import SessionLocal
 from models.document import Document
+from models.comparison import ComparisonCacheEntry, DocumentComparison, DocumentMerge
+from services.blob_store import blob_store, referenced_keys
+from services.comparison_cache import comparison_cache
 
 logger = logging.getLogger(__name__)
 
@@ -57,3 +60,46 @@ def cleanup_old_files():
         return 0
     finally:
         db.close()
+
+
+def cleanup_comparison_cache():
+    """
+    Удаляет кэшированные результаты сравнений, не использованные FILE_RETENTION_DAYS дней.
+    """
+    db: Session = SessionLocal()
+    try:
+        evicted = comparison_cache.evict_expired(db)
+        if evicted > 0:
+            logger.info(f"Comparison cache cleanup: {evicted} entries evicted")
+        return evicted
+    except Exception as e:
+        logger.error(f"Comparison cache cleanup error: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+
+def cleanup_blobs():
+    """
+    Удаляет файлы blob-хранилища, на которые не ссылается ни одна запись.
+    """
+    db: Session = SessionLocal()
+    try:
+        referenced = set()
+        for (result,) in db.query(DocumentComparison.stored_result):
+            referenced |= referenced_keys(result)
+        for (result,) in db.query(ComparisonCacheEntry.result):
+            referenced |= referenced_keys(result)
+        for conflicts, merged_content in db.query(DocumentMerge.stored_conflicts, DocumentMerge.stored_merged_content):
+            referenced |= referenced_keys(conflicts) | referenced_keys(merged_content)
+        
+        deleted = blob_store.collect_garbage(referenced)
+        if deleted > 0:
+            logger.info(f"Blob cleanup: {deleted} unreferenced blobs deleted")
+        return deleted
+    except Exception as e:
+        logger.error(f"Blob cleanup error: {e}")
+        return 0
+    finally:
+        db.close()
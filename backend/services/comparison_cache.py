@@ -0,0 +1,129 @@
+"""
+Comparison Result Cache
+Two-tier (in-process LRU + database) cache of comparison results keyed by content hashes
+"""
+import copy
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.comparison import ComparisonCacheEntry
+from services.blob_store import blob_store
+from services.diff_engine import ENGINE_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    """sha256 of the extracted text (Document.content_hash covers the file bytes instead)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ComparisonCache:
+    """LRU of recent results in front of the comparison_cache table.
+
+    Results are deep-copied on the way in and out, so callers may annotate
+    the returned dict (ai_summary, ids) without touching the cached copy.
+    """
+
+    def __init__(self, capacity: int = settings.COMPARE_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def make_key(self, text1: str, text2: str, mode: str, **options: Any) -> str:
+        """Cache key from both text hashes, the mode, every option that affects the result and the engine version"""
+        payload = json.dumps({
+            "text1": text_hash(text1),
+            "text2": text_hash(text2),
+            "mode": mode,
+            "options": options,
+            "engine": ENGINE_VERSION,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, db: Session, key: str) -> Optional[Dict[str, Any]]:
+        """Cached result or None; DB hits are promoted into the LRU"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(result)
+
+        entry = db.query(ComparisonCacheEntry).filter(ComparisonCacheEntry.key == key).first()
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        entry.hits = (entry.hits or 0) + 1
+        entry.last_used_at = datetime.utcnow()
+        db.commit()
+        result = blob_store.unpack_sections(entry.result)
+        with self._lock:
+            self.db_hits += 1
+            self._remember(key, result)
+        return copy.deepcopy(result)
+
+    def put(self, db: Session, key: str, mode: str, result: Dict[str, Any]) -> None:
+        """Store a result in both tiers (large sections of the DB row go to the blob store)"""
+        stored = copy.deepcopy(result)
+        with self._lock:
+            self._remember(key, stored)
+
+        packed = blob_store.pack_sections(stored)
+        entry = db.query(ComparisonCacheEntry).filter(ComparisonCacheEntry.key == key).first()
+        if entry is None:
+            db.add(ComparisonCacheEntry(key=key, comparison_mode=mode, result=packed))
+        else:
+            entry.result = packed
+            entry.last_used_at = datetime.utcnow()
+        db.commit()
+
+    def evict_expired(self, db: Session) -> int:
+        """Drop DB entries unused for FILE_RETENTION_DAYS (the source documents are gone by then)"""
+        cutoff = datetime.utcnow() - timedelta(days=settings.FILE_RETENTION_DAYS)
+        expired = db.query(ComparisonCacheEntry).filter(ComparisonCacheEntry.last_used_at < cutoff)
+        keys = [key for (key,) in expired.with_entities(ComparisonCacheEntry.key).all()]
+        if not keys:
+            return 0
+        expired.delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this process"""
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._entries),
+                "capacity": self.capacity,
+                "engine_version": ENGINE_VERSION,
+            }
+
+    def _remember(self, key: str, result: Dict[str, Any]) -> None:
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+
+comparison_cache = ComparisonCache()
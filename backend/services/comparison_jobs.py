@@ -0,0 +1,170 @@
+"""
+Comparison Jobs
+Background comparison jobs with progress phases
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Job phases in order with the progress percentage reached at their start
+JOB_PHASES = {
+    "queued": 0,
+    "align": 10,
+    "inline": 40,
+    "classify": 60,
+    "ai_summary": 80,
+    "done": 100,
+}
+
+PHASE_MESSAGES = {
+    "queued": "В очереди...",
+    "align": "Выравнивание строк...",
+    "inline": "Построчное выделение изменений...",
+    "classify": "Классификация изменений...",
+    "ai_summary": "Формирование AI-резюме...",
+    "done": "Сравнение завершено",
+}
+
+
+class ComparisonJobs:
+    """In-memory registry of comparison jobs (the diffs run on the compute pool).
+
+    A job is a plain dict; every update bumps job["seq"] so event streams
+    can tell whether anything changed since they last looked.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, user_id: str, id1: str, id2: str, mode: str) -> Dict[str, Any]:
+        """Register a queued comparison of id1 vs id2"""
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow().isoformat()
+        job = {
+            "id": job_id,
+            "user_id": user_id,
+            "id1": id1,
+            "id2": id2,
+            "mode": mode,
+            "status": "queued",
+            "phase": "queued",
+            "progress": 0,
+            "message": PHASE_MESSAGES["queued"],
+            "seq": 0,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "comparison_id": None,
+            "diff_ready": False,
+            "result": None,
+            "error": None,
+            "_touched": time.time(),
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Job by id; with user_id, only if it belongs to that user"""
+        job = self._jobs.get(job_id)
+        if job is None or (user_id is not None and job["user_id"] != user_id):
+            return None
+        return job
+
+    def set_phase(self, job_id: str, phase: str) -> None:
+        """Advance a job to a phase (safe to call from worker threads)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            # Progress forwarded from a worker may arrive after the job has finished
+            if job is None or job["status"] in ("done", "error"):
+                return
+            job["phase"] = phase
+            job["status"] = "done" if phase == "done" else "running"
+            # Modes report phases in different orders; progress never goes back
+            job["progress"] = max(job["progress"], JOB_PHASES[phase])
+            job["message"] = PHASE_MESSAGES[phase]
+            self._touch(job)
+
+    def set_diff_ready(self, job_id: str, comparison_id: str, result: Dict[str, Any]) -> None:
+        """Publish the stored diff while the AI summary is still being generated"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["comparison_id"] = comparison_id
+            job["result"] = result
+            job["diff_ready"] = True
+            self._touch(job)
+
+    def finish(self, job_id: str, comparison_id: str, result: Dict[str, Any]) -> None:
+        """Store the result and mark the job done"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["comparison_id"] = comparison_id
+            job["result"] = result
+            job["diff_ready"] = True
+        self.set_phase(job_id, "done")
+        with self._lock:
+            job["finished_at"] = job["updated_at"]
+
+    def fail(self, job_id: str, error: str) -> None:
+        """Mark the job failed"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in ("done", "error"):
+                return
+            job["status"] = "error"
+            job["error"] = error
+            job["message"] = f"Ошибка сравнения: {error}"
+            job["finished_at"] = datetime.utcnow().isoformat()
+            self._touch(job)
+
+    def status(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Public view of a job (without the result payload)"""
+        return {
+            "job_id": job["id"],
+            "document_id_v1": job["id1"],
+            "document_id_v2": job["id2"],
+            "comparison_mode": job["mode"],
+            "status": job["status"],
+            "phase": job["phase"],
+            "progress": job["progress"],
+            "message": job["message"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "finished_at": job["finished_at"],
+            "comparison_id": job["comparison_id"],
+            "diff_ready": job["diff_ready"],
+            "total_changes": len(job["result"]["changes"]) if job["result"] else None,
+            "error": job["error"],
+        }
+
+    def evict_expired(self) -> int:
+        """Forget finished jobs older than COMPARE_JOB_TTL seconds (results stay in the DB)"""
+        cutoff = time.time() - settings.COMPARE_JOB_TTL
+        with self._lock:
+            expired: List[str] = [
+                job_id for job_id, job in self._jobs.items()
+                if job["finished_at"] and job["_touched"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def _touch(self, job: Dict[str, Any]) -> None:
+        job["seq"] += 1
+        job["updated_at"] = datetime.utcnow().isoformat()
+        job["_touched"] = time.time()
+
+
+comparison_jobs = ComparisonJobs()
@@ -0,0 +1,185 @@
+"""
+Compute Pool
+Managed process pool for CPU-bound diff and merge work, off the event loop
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Times a task is resubmitted after its pool broke under it (e.g. recycled for another task's timeout)
+BROKEN_POOL_RETRIES = 2
+
+
+class ComputeUnavailableError(RuntimeError):
+    """The pool broke under a task again and again (a crashing worker, not a timeout)"""
+
+
+# Set in each worker by _init_worker: where progress callbacks of tasks report to
+_worker_progress_queue = None
+
+
+def _init_worker(progress_queue) -> None:
+    """Worker initializer: keep the progress queue and import the engines once"""
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+    import services.compute_tasks  # noqa: F401 - warm the engine imports
+
+
+def _warm_up() -> bool:
+    return True
+
+
+def _invoke(fn: Callable, args: tuple, token: Optional[str]) -> Any:
+    """Run fn in a worker; with a token, fn gets a progress callback forwarding to the parent"""
+    if token is None:
+        return fn(*args)
+    return fn(*args, progress=lambda phase: _worker_progress_queue.put((token, phase)))
+
+
+class ComputePool:
+    """ProcessPoolExecutor with warm workers, per-task timeouts and progress forwarding.
+
+    Tasks are module-level functions of services.compute_tasks taking plain
+    texts and option dicts, so only the inputs and the result dict cross the
+    process boundary - never engine objects or DB state. With max_workers 0
+    tasks run on a thread of the event loop's default executor instead.
+    """
+
+    def __init__(self, max_workers: int = settings.COMPUTE_WORKERS,
+                 task_timeout: float = settings.COMPUTE_TASK_TIMEOUT):
+        self.max_workers = max_workers
+        self.task_timeout = task_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._progress_queue = None
+        self._listener: Optional[threading.Thread] = None
+        self._callbacks: Dict[str, Callable[[str], None]] = {}
+
+    def start(self) -> None:
+        """Create the pool and start every worker (imports happen now, not on the first request)"""
+        if self.max_workers <= 0:
+            return
+        pool = self._get_pool()
+        for _ in range(self.max_workers):
+            pool.submit(_warm_up)
+        logger.info(f"Compute pool started with {self.max_workers} workers")
+
+    def shutdown(self) -> None:
+        """Stop the workers and the progress listener"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._listener is not None:
+                self._progress_queue.put(None)
+                self._listener = None
+
+    async def run(self, fn: Callable, *args: Any, timeout: Optional[float] = None,
+                  progress: Optional[Callable[[str], None]] = None) -> Any:
+        """Run fn(*args) in a worker and await its result.
+
+        Raises TimeoutError after timeout seconds (default task_timeout); the
+        pool is then recycled so the stuck worker does not keep a core busy.
+        Tasks that were running or queued on a recycled (or otherwise broken)
+        pool are resubmitted to the fresh one within their own timeout, up to
+        BROKEN_POOL_RETRIES times, then ComputeUnavailableError is raised.
+        progress, if given, is passed to fn as a keyword argument and called
+        in this process (from the listener thread) with each reported phase.
+        """
+        timeout = self.task_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+
+        if self.max_workers <= 0:
+            call = partial(fn, *args, progress=progress) if progress else partial(fn, *args)
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(None, call), timeout)
+            except asyncio.TimeoutError:
+                # Not the builtin TimeoutError before Python 3.11
+                raise TimeoutError(f"Превышено время обработки ({timeout:g} с)")
+
+        token = None
+        if progress is not None:
+            token = str(uuid.uuid4())
+            self._callbacks[token] = progress
+        name = getattr(fn, '__name__', fn)
+        deadline = time.monotonic() + timeout
+        try:
+            for attempt in range(BROKEN_POOL_RETRIES + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Превышено время обработки ({timeout:g} с)")
+                pool = self._get_pool()
+                try:
+                    future = loop.run_in_executor(pool, _invoke, fn, args, token)
+                    return await asyncio.wait_for(future, remaining)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Compute task {name} exceeded {timeout}s, recycling pool")
+                    self._recycle(pool)
+                    raise TimeoutError(f"Превышено время обработки ({timeout:g} с)")
+                except BrokenProcessPool:
+                    self._recycle(pool)
+                    logger.warning(f"Compute pool broke under task {name} (attempt {attempt + 1})")
+            raise ComputeUnavailableError("Сервис вычислений временно недоступен, повторите запрос")
+        finally:
+            if token is not None:
+                self._callbacks.pop(token, None)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                if self._progress_queue is None:
+                    self._progress_queue = self._context.Queue()
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, args=(self._progress_queue,),
+                                                      name="compute-progress", daemon=True)
+                    self._listener.start()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=self._context,
+                    initializer=_init_worker,
+                    initargs=(self._progress_queue,)
+                )
+            return self._pool
+
+    def _recycle(self, pool: ProcessPoolExecutor) -> None:
+        """Kill the workers of pool and start afresh on next use.
+
+        Tasks running or queued on pool fail with BrokenProcessPool, which
+        run() resubmits; queued ones are not cancelled, as a cancelled
+        future would not be resubmitted.
+        """
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        # No public API terminates a running task; stop its processes directly
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False)
+
+    def _listen(self, progress_queue) -> None:
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            token, phase = message
+            callback = self._callbacks.get(token)
+            if callback is not None:
+                try:
+                    callback(phase)
+                except Exception as e:
+                    logger.error(f"Progress callback error: {e}")
+
+
+compute_pool = ComputePool()
@@ -0,0 +1,91 @@
+"""
+Compute Tasks
+CPU-bound entry points submitted to the compute pool (plain arguments in, plain dicts out)
+"""
+import difflib
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from config import settings
+from services.diff3 import side_blocks
+from services.diff_engine import DiffEngine
+from services.merge_engine import MergeEngine
+from services.myers_diff import blocks_from_opcodes, get_opcodes
+from services.version_store import encode_delta
+
+
+def compare_texts(text1: str, text2: str, mode: str, options: Dict[str, Any],
+                  progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """DiffEngine.compare with keyword options (show_full, time_budget, ...)"""
+    return DiffEngine().compare(text1, text2, mode, progress=progress, **options)
+
+
+def compare_batch(base_text: str, target_texts: List[str], mode: str, options: Dict[str, Any],
+                  summary_only: bool = False) -> List[Dict[str, Any]]:
+    """DiffEngine.compare_many; summary_only returns just summary and mode_info per target"""
+    results = DiffEngine().compare_many(base_text, target_texts, mode, **options)
+    if summary_only:
+        return [{"summary": result["summary"], "mode_info": result.get("mode_info", {})} for result in results]
+    return results
+
+
+def version_delta(parent_text: str, child_text: str) -> Dict[str, Any]:
+    """Line delta of a version against its parent: matching blocks, line-by-line change counts
+    and the encoded content delta (version_store)"""
+    parent_lines, child_lines = parent_text.splitlines(), child_text.splitlines()
+    blocks = blocks_from_opcodes(get_opcodes(parent_lines, child_lines, settings.DIFF_ALGORITHM))
+    result = DiffEngine().compare(parent_text, child_text, "line-by-line", show_full=False, alignment=blocks)
+    return {
+        "blocks": [list(block) for block in blocks],
+        "parent_lines": len(parent_lines),
+        "child_lines": len(child_lines),
+        "summary": result["summary"],
+        "content_delta": encode_delta(parent_text, child_text, blocks),
+    }
+
+
+def merge_alignment(base_text: str, text: str) -> List[List[int]]:
+    """Matching blocks of one document against the N-way merge base (MergeEngine.alignment_plan)"""
+    engine = MergeEngine()
+    blocks = side_blocks(engine._split_into_blocks(base_text), engine._split_into_blocks(text), engine.algorithm)
+    return [list(block) for block in blocks]
+
+
+def merge_documents(documents: List[Dict[str, Any]], strategy: str,
+                    base_version_id: Optional[str] = None,
+                    alignments: Optional[List[List[List[int]]]] = None) -> Dict[str, Any]:
+    """MergeEngine.merge"""
+    return MergeEngine().merge(documents, strategy, base_version_id, alignments)
+
+
+def preview_merge(documents: List[Dict[str, Any]], strategy: str, base_version_id: Optional[str] = None,
+                  alignments: Optional[List[List[List[int]]]] = None) -> Dict[str, Any]:
+    """MergeEngine.preview_merge"""
+    return MergeEngine().preview_merge(documents, strategy, base_version_id, alignments)
+
+
+def edit_diff_html(old: str, new: str) -> str:
+    """Word-level inline HTML diff of an edited document (docanalysis edit view)"""
+    # Tokenize by words but keep whitespace
+    def tokenize(text):
+        return re.findall(r'\S+|\s+', text)
+
+    a = tokenize(old)
+    b = tokenize(new)
+
+    matcher = difflib.SequenceMatcher(None, a, b)
+    html = []
+
+    for opcode, a0, a1, b0, b1 in matcher.get_opcodes():
+        if opcode == 'equal':
+            html.append("".join(a[a0:a1]))
+        elif opcode == 'insert':
+            html.append(f'<span style="background-color: #d4edda; color: #155724; text-decoration: none;">{"".join(b[b0:b1])}</span>')
+        elif opcode == 'delete':
+            html.append(f'<span style="background-color: #f8d7da; color: #721c24; text-decoration: line-through; opacity: 0.7;">{"".join(a[a0:a1])}</span>')
+        elif opcode == 'replace':
+            # show del then ins
+            html.append(f'<span style="background-color: #f8d7da; color: #721c24; text-decoration: line-through; opacity: 0.7;">{"".join(a[a0:a1])}</span>')
+            html.append(f'<span style="background-color: #d4edda; color: #155724; text-decoration: none;">{"".join(b[b0:b1])}</span>')
+
+    return "".join(html)
@@ -0,0 +1,89 @@
+"""
+Diff3 Merge Regions
+Stable and unstable hunks of several documents against their common base
+"""
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from services.myers_diff import blocks_from_opcodes, get_opcodes, unique_line_chain
+
+
+class MergeRegion(NamedTuple):
+    """Base lines [o1, o2) and the matching slice [start, end) of every side.
+
+    A stable region is unchanged in all sides (every slice equals the base).
+    An unstable region holds the edits between two stable ones; some sides
+    may still equal the base there.
+    """
+    o1: int
+    o2: int
+    sides: Tuple[Tuple[int, int], ...]
+    stable: bool
+
+
+def merge_regions(base: Sequence[str], sides: Sequence[Sequence[str]], algorithm: str = "myers",
+                  alignments: Optional[Sequence[Sequence[Sequence[int]]]] = None) -> List[MergeRegion]:
+    """Split base and sides into alternating stable and unstable regions (diff3).
+
+    Each side is diffed against the base once (between unique-line anchors,
+    so heavily edited sides stay cheap); base lines matched in every
+    side at the current offsets form stable regions, everything up to the
+    next base line matched in all sides forms one unstable region. After
+    the diffs the walk is linear in len(base) per side, and an edit
+    spanning many lines stays one region. Insertions before the first base
+    line come out as an unstable region with o1 == o2 == 0. alignments, the
+    side_blocks() of every side computed in advance (e.g. concurrently on
+    the compute pool), replace the diffs.
+    """
+    # matches[k][o] = line of side k matched to base line o, or -1
+    matches = []
+    for k, side in enumerate(sides):
+        match = [-1] * len(base)
+        blocks = alignments[k] if alignments is not None else side_blocks(base, side, algorithm)
+        for i, j, size in blocks:
+            match[i:i + size] = range(j, j + size)
+        matches.append(match)
+
+    regions: List[MergeRegion] = []
+    n = len(base)
+    o = 0
+    pos = [0] * len(sides)
+    while True:
+        # Stable run: every side continues in lockstep with the base
+        end = o
+        while end < n and all(match[end] == pos[k] + end - o for k, match in enumerate(matches)):
+            end += 1
+        if end > o:
+            regions.append(MergeRegion(o, end, tuple((p, p + end - o) for p in pos), True))
+            pos = [p + end - o for p in pos]
+            o = end
+            continue
+
+        # Unstable region up to the next base line that all sides keep
+        nxt = o
+        while nxt < n and any(match[nxt] < 0 for match in matches):
+            nxt += 1
+        if nxt < n:
+            ends = [match[nxt] for match in matches]
+        else:
+            ends = [len(side) for side in sides]
+        if nxt > o or any(e > p for p, e in zip(pos, ends)):
+            regions.append(MergeRegion(o, nxt, tuple(zip(pos, ends)), False))
+        if nxt == n:
+            break
+        o, pos = nxt, ends
+
+    return regions
+
+
+def side_blocks(base: Sequence[str], side: Sequence[str], algorithm: str) -> List[Tuple[int, int, int]]:
+    """Matching blocks of base -> side: lines unique in both anchor the diff, gaps get get_opcodes()"""
+    blocks: List[Tuple[int, int, int]] = []
+    prev1, prev2 = 0, 0
+    for idx1, idx2 in unique_line_chain(base, side, 0, len(base), 0, len(side)) + [(len(base), len(side))]:
+        if idx1 > prev1 and idx2 > prev2:
+            opcodes = get_opcodes(base[prev1:idx1], side[prev2:idx2], algorithm, autojunk=False)
+            blocks.extend((prev1 + i, prev2 + j, size) for i, j, size in blocks_from_opcodes(opcodes))
+        blocks.append((idx1, idx2, 1))
+        prev1, prev2 = idx1 + 1, idx2 + 1
+    blocks.pop()  # (len(base), len(side)) sentinel
+    return blocks
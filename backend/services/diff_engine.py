@@ -3,117 +3,378 @@ Enterprise Document Comparison Engine
 Multi-mode comparison with AI integration
 """
 import difflib
+import hashlib
 import re
+import time
 import uuid
-from typing import List, Dict, Any, Tuple, Optional
+import zlib
+from typing import List, Dict, Any, Tuple, Optional, Callable, Set
+
+from config import settings
+from services.alignment_kernel import gap_similarity_rows, intern_lines, weighted_alignment
+from services.change_features import ChangeFeatures, extract_features
+from services.diff_view import build_compact_diff, expand_compact_diff, mark_spans
+from services.line_normalization import NORMALIZATION_PROFILES, line_keys
+from services.line_signatures import LONG_LINE_CHARS, LineSignatures, trigram_similarity
+from services.move_detection import MovedBlock, find_moved_blocks
+from services.myers_diff import get_opcodes, opcodes_from_blocks, unique_line_chain
+from services.sentences import split_sentences
+
+# Bump when the result of compare() changes for the same input (invalidates cached results)
+ENGINE_VERSION = "2.2"
 
 
 class DiffEngine:
     """Enterprise-grade diff engine with multiple comparison modes"""
     
+    # Deepest clause numbering level used by the hierarchical mode ("5.1.2." = 3)
+    MAX_SECTION_DEPTH = 2
+    
+    # Fidelity levels, best first: fuzzy alignment, exact anchors only, paragraph diff
+    FIDELITY_LEVELS = ["full", "anchors", "coarse"]
+    # Input size (lines of both documents) above which a cheaper level is chosen up front
+    ANCHORS_ONLY_LINES = 20000
+    COARSE_LINES = 80000
+    # Largest gap between anchors (lines1 x lines2 cells) that gets fuzzy alignment
+    MAX_GAP_CELLS = 4_000_000
+    # Coarse mode: a line whose CRC is divisible by this also ends a paragraph
+    CHUNK_DIVISOR = 16
+    # Word-level inline diff is skipped for longer texts (per sentence)
+    MAX_INLINE_TOKENS = 3000
+    # Phases reported to the progress callback (semantic mode classifies before the inline view)
+    PROGRESS_PHASES = ["align", "inline", "classify"]
+    
     def __init__(self):
         self.mode = "line-by-line"
         self.show_full = True  # Show full document by default
+        self.algorithm = settings.DIFF_ALGORITHM  # Line opcode generator: myers or difflib
+        self.exact_similarity = False  # Character-level similarity score (slow on large texts)
+        self.normalization = settings.DIFF_NORMALIZATION  # Line match keys (services.line_normalization)
+        self._signature_cache: Dict[int, LineSignatures] = {}
+        self._key_cache: Dict[int, Tuple[List[str], List[str]]] = {}
+        # map()-compatible callable for independent section diffs (e.g. Executor.map)
+        self.section_map = map
+        self.diff_format = "compact"  # Side-by-side payload: compact or legacy
+        self.time_budget = settings.DIFF_TIME_BUDGET
+        self.fidelity = "full"
+        self._deadline: Optional[float] = None
+        self._degraded = False
+        self.progress: Optional[Callable[[str], None]] = None
+        # Precomputed matching blocks of the two texts (line-by-line mode)
+        self.alignment: Optional[List[Tuple[int, int, int]]] = None
+        # One-to-many comparisons: base text state kept across compare() calls
+        self._base_text: Optional[str] = None
+        self._base_lines: Optional[List[str]] = None
+        self._base_signatures: Optional[LineSignatures] = None
+        self._base_sections: Dict[Tuple[int, int, int], List[Dict[str, Any]]] = {}
     
-    def compare(self, text1: str, text2: str, mode: str = "line-by-line", show_full: bool = True) -> Dict[str, Any]:
-        """Main comparison entry point - dispatches to mode-specific methods"""
+    def compare(self, text1: str, text2: str, mode: str = "line-by-line", show_full: bool = True,
+                algorithm: Optional[str] = None, exact_similarity: bool = False,
+                time_budget: Optional[float] = None, diff_format: str = "compact",
+                progress: Optional[Callable[[str], None]] = None,
+                alignment: Optional[List[Tuple[int, int, int]]] = None,
+                normalization: Optional[str] = None) -> Dict[str, Any]:
+        """Main comparison entry point - dispatches to mode-specific methods
+        
+        algorithm selects the line opcode generator ("myers" or "difflib"),
+        defaulting to settings.DIFF_ALGORITHM. exact_similarity requests the
+        character-level SequenceMatcher ratio instead of the estimate derived
+        from the line diff. time_budget (seconds, default
+        settings.DIFF_TIME_BUDGET) bounds the refinement work: the fidelity
+        level is picked from the input size and lowered once the deadline
+        passes. The delivered level is reported in mode_info["fidelity"].
+        diff_format "compact" returns the side-by-side view as result["diff"]
+        (texts once plus alignment ops); "legacy" returns the pre-rendered
+        result["diff_lines"] rows. progress, if given, is called with each
+        of PROGRESS_PHASES as the comparison reaches it. alignment, matching
+        blocks (i, j, size) of identical lines known in advance (e.g. composed
+        from stored version deltas), replaces the line diff and the anchor
+        search of the line-by-line mode; other modes ignore it. normalization
+        (default settings.DIFF_NORMALIZATION) selects the profile whose line
+        keys decide which lines are equal; changes and the side-by-side view
+        still show the original text. It is reported in mode_info.
+        """
+        normalization = normalization or settings.DIFF_NORMALIZATION
+        if normalization not in NORMALIZATION_PROFILES:
+            raise ValueError(f"Unknown normalization profile: {normalization}. Allowed: {list(NORMALIZATION_PROFILES)}")
         self.mode = mode
         self.show_full = show_full
+        self.algorithm = algorithm or settings.DIFF_ALGORITHM
+        self.exact_similarity = exact_similarity
+        self.diff_format = diff_format
+        self.progress = progress
+        self.alignment = alignment
+        self.normalization = normalization
+        self._signature_cache = {}
+        self._key_cache = {}
+        if self._base_lines is not None:
+            self._signature_cache[id(self._base_lines)] = self._base_signatures
+        
+        self.time_budget = settings.DIFF_TIME_BUDGET if time_budget is None else time_budget
+        started = time.monotonic()
+        self._deadline = started + self.time_budget if self.time_budget > 0 else None
+        self._degraded = False
+        self.fidelity = self._choose_fidelity(text1, text2)
+        self._report("align")
         
         if mode == "line-by-line":
-            return self._line_by_line_diff(text1, text2)
+            result = self._line_by_line_diff(text1, text2)
         elif mode == "semantic":
-            return self._semantic_diff(text1, text2)
+            result = self._semantic_diff(text1, text2)
+        elif mode == "hierarchical":
+            result = self._hierarchical_diff(text1, text2)
         else:
-            return self._line_by_line_diff(text1, text2)
+            result = self._line_by_line_diff(text1, text2)
+        
+        result.setdefault("mode_info", {})["fidelity"] = {
+            "level": self.fidelity,
+            "degraded": self._degraded,
+            "elapsed_ms": int((time.monotonic() - started) * 1000),
+            "budget_ms": int(self.time_budget * 1000)
+        }
+        result["mode_info"]["normalization"] = normalization
+        if alignment is not None and mode == "line-by-line":
+            result["mode_info"]["alignment"] = "precomputed"
+        return result
+    
+    def compare_many(self, base_text: str, target_texts: List[str], mode: str = "line-by-line",
+                     **options: Any) -> List[Dict[str, Any]]:
+        """Compare one base text against several targets (compare() options apply to each).
+        
+        The base is split into lines once, and its line signatures and section
+        index are built at most once and shared by all target comparisons.
+        """
+        self._base_text = base_text
+        self._base_lines = base_text.splitlines()
+        self._base_signatures = LineSignatures(self._base_lines)
+        self._base_sections = {}
+        try:
+            return [self.compare(base_text, target, mode, **options) for target in target_texts]
+        finally:
+            self._base_text = self._base_lines = self._base_signatures = None
+            self._base_sections = {}
+    
+    def _split_lines(self, text: str) -> List[str]:
+        """text.splitlines(), reusing the prepared base lines in compare_many()"""
+        if self._base_lines is not None and (text is self._base_text or text == self._base_text):
+            return self._base_lines
+        return text.splitlines()
+    
+    def _report(self, phase: str) -> None:
+        """Notify the progress callback that a phase has started"""
+        if self.progress is not None:
+            self.progress(phase)
+    
+    # ==================== BUDGET / FIDELITY ====================
+    def _choose_fidelity(self, text1: str, text2: str) -> str:
+        """Pick the starting fidelity level from the input size"""
+        total_lines = text1.count("\n") + text2.count("\n") + 2
+        if total_lines > self.COARSE_LINES:
+            return "coarse"
+        if total_lines > self.ANCHORS_ONLY_LINES:
+            return "anchors"
+        return "full"
+    
+    def _out_of_time(self) -> bool:
+        """True once the deadline has passed; the caller is about to skip refinement"""
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self._degrade("anchors")
+            return True
+        return False
+    
+    def _degrade(self, level: str) -> None:
+        """Record that part of the result was produced at a lower fidelity"""
+        self._degraded = True
+        if self.FIDELITY_LEVELS.index(level) > self.FIDELITY_LEVELS.index(self.fidelity):
+            self.fidelity = level
+    
+    def _line_opcodes(self, lines1: List[str], lines2: List[str]) -> List[Tuple[str, int, int, int, int]]:
+        """Line opcodes at the current fidelity (paragraph granularity when coarse)"""
+        if self.fidelity == "coarse":
+            return self._paragraph_opcodes(lines1, lines2)
+        opcodes = get_opcodes(self._line_keys(lines1), self._line_keys(lines2), self.algorithm,
+                              deadline=self._deadline)
+        self._out_of_time()
+        return opcodes
+    
+    def _paragraph_opcodes(self, lines1: List[str], lines2: List[str]) -> List[Tuple[str, int, int, int, int]]:
+        """Diff paragraphs as units and expand the result to line opcodes.
+        
+        Paragraphs end at blank lines and, so that PDF text without blank lines
+        still splits, after content-defined boundary lines (CRC divisible by
+        CHUNK_DIVISOR) - those survive insertions upstream unlike fixed-size chunks.
+        """
+        lines1, lines2 = self._line_keys(lines1), self._line_keys(lines2)
+        bounds1 = self._paragraph_bounds(lines1)
+        bounds2 = self._paragraph_bounds(lines2)
+        keys1 = ["\n".join(lines1[bounds1[k]:bounds1[k + 1]]) for k in range(len(bounds1) - 1)]
+        keys2 = ["\n".join(lines2[bounds2[k]:bounds2[k + 1]]) for k in range(len(bounds2) - 1)]
+        
+        opcodes = []
+        for tag, a1, a2, b1, b2 in get_opcodes(keys1, keys2, self.algorithm, deadline=self._deadline):
+            opcodes.append((tag, bounds1[a1], bounds1[a2], bounds2[b1], bounds2[b2]))
+        return opcodes
+    
+    def _paragraph_bounds(self, lines: List[str]) -> List[int]:
+        """Start index of every paragraph followed by len(lines)"""
+        bounds = [0]
+        for idx in range(1, len(lines)):
+            prev = lines[idx - 1]
+            if (not prev.strip() and lines[idx].strip()) or \
+                    zlib.crc32(prev.encode("utf-8")) % self.CHUNK_DIVISOR == 0:
+                bounds.append(idx)
+        if lines:
+            bounds.append(len(lines))
+        return bounds
     
     # ==================== MODE: LINE-BY-LINE ====================
     def _line_by_line_diff(self, text1: str, text2: str) -> Dict[str, Any]:
         """Classic line-by-line diff with character highlighting"""
-        lines1 = text1.splitlines()
-        lines2 = text2.splitlines()
+        lines1 = self._split_lines(text1)
+        lines2 = self._split_lines(text2)
         
-        matcher = difflib.SequenceMatcher(None, lines1, lines2)
-        changes = []
+        anchors = None
+        if self.alignment is not None:
+            opcodes = opcodes_from_blocks(list(self.alignment), len(lines1), len(lines2))
+            anchors = [(i + k, j + k) for i, j, size in self.alignment for k in range(size)]
+        else:
+            opcodes = self._line_opcodes(lines1, lines2)
+        moves = find_moved_blocks(lines1, lines2, opcodes)
+        self._report("inline")
+        changes = self._collect_line_changes(lines1, lines2, opcodes, moves=moves)
         
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        self._report("classify")
+        result = self._build_result(changes, text1, text2, lines1, lines2, opcodes)
+        self._attach_diff_view(result, lines1, lines2, moves=moves, anchors=anchors)
+        result["mode_info"] = {
+            "name": "Построчный",
+            "description": "Классический diff — сравнение строка за строкой"
+        }
+        return result
+    
+    def _collect_line_changes(self, lines1: List[str], lines2: List[str],
+                              opcodes: List[Tuple[str, int, int, int, int]],
+                              offset1: int = 0, offset2: int = 0,
+                              moves: Optional[List[MovedBlock]] = None) -> List[Dict]:
+        """Turn line opcodes into change objects (offsets shift reported line numbers).
+        
+        Lines of moved blocks are reported once per block as MOVED changes
+        instead of separate deletions and additions.
+        """
+        moved1, moved2 = self._moved_lines(moves)
+        changes = self._opcode_changes(lines1, lines2, opcodes, offset1, offset2, moved1, moved2)
+        changes.extend(self._moved_changes(lines1, lines2, moves, offset1, offset2))
+        return changes
+    
+    def _opcode_changes(self, lines1: List[str], lines2: List[str],
+                        opcodes: List[Tuple[str, int, int, int, int]], offset1: int, offset2: int,
+                        moved1: Set[int], moved2: Set[int]) -> List[Dict]:
+        """ADDED / DELETED / MODIFIED changes of opcodes, skipping moved lines"""
+        changes = []
+        for tag, i1, i2, j1, j2 in opcodes:
             if tag == 'equal':
                 continue
             
             if tag == 'replace':
                 for idx in range(max(i2 - i1, j2 - j1)):
-                    old_line = lines1[i1 + idx] if i1 + idx < i2 else ""
-                    new_line = lines2[j1 + idx] if j1 + idx < j2 else ""
+                    old_line = lines1[i1 + idx] if i1 + idx < i2 and i1 + idx not in moved1 else ""
+                    new_line = lines2[j1 + idx] if j1 + idx < j2 and j1 + idx not in moved2 else ""
                     
                     if old_line and new_line:
                         inline_diff = self._compute_inline_diff(old_line, new_line)
                         changes.append(self._make_change(
                             "MODIFIED", old_line, new_line, 
-                            f"строка {i1 + idx + 1}",
+                            f"строка {offset1 + i1 + idx + 1}",
                             inline_diff
                         ))
                     elif old_line:
-                        changes.append(self._make_change("DELETED", old_line, None, f"строка {i1 + idx + 1}"))
+                        changes.append(self._make_change("DELETED", old_line, None, f"строка {offset1 + i1 + idx + 1}"))
                     elif new_line:
-                        changes.append(self._make_change("ADDED", None, new_line, f"строка {j1 + idx + 1}"))
+                        changes.append(self._make_change("ADDED", None, new_line, f"строка {offset2 + j1 + idx + 1}"))
             
             elif tag == 'delete':
                 for idx in range(i1, i2):
-                    if lines1[idx].strip():
-                        changes.append(self._make_change("DELETED", lines1[idx], None, f"строка {idx + 1}"))
+                    if lines1[idx].strip() and idx not in moved1:
+                        changes.append(self._make_change("DELETED", lines1[idx], None, f"строка {offset1 + idx + 1}"))
             
             elif tag == 'insert':
                 for idx in range(j1, j2):
-                    if lines2[idx].strip():
-                        changes.append(self._make_change("ADDED", None, lines2[idx], f"строка {idx + 1}"))
+                    if lines2[idx].strip() and idx not in moved2:
+                        changes.append(self._make_change("ADDED", None, lines2[idx], f"строка {offset2 + idx + 1}"))
         
-        result = self._build_result(changes, text1, text2)
-        result["diff_lines"] = self._build_side_by_side(lines1, lines2)
-        result["mode_info"] = {
-            "name": "Построчный",
-            "description": "Классический diff — сравнение строка за строкой"
-        }
-        return result
+        return changes
+    
+    def _moved_lines(self, moves: Optional[List[MovedBlock]]) -> Tuple[Set[int], Set[int]]:
+        """Line indices of moved blocks in the first and the second document"""
+        moved1 = {idx for block in moves or [] for idx in range(block.i1, block.i2)}
+        moved2 = {idx for block in moves or [] for idx in range(block.j1, block.j2)}
+        return moved1, moved2
+    
+    def _moved_changes(self, lines1: List[str], lines2: List[str], moves: Optional[List[MovedBlock]],
+                       offset1: int = 0, offset2: int = 0) -> List[Dict]:
+        """One MOVED change per moved block"""
+        changes = []
+        for block in moves or []:
+            old_text = "\n".join(line for line in lines1[block.i1:block.i2] if line.strip())
+            new_text = "\n".join(line for line in lines2[block.j1:block.j2] if line.strip())
+            change = self._make_change(
+                "MOVED", old_text, new_text,
+                f"строки {offset1 + block.i1 + 1}-{offset1 + block.i2} → {offset2 + block.j1 + 1}-{offset2 + block.j2}"
+            )
+            change["classification"] = "MOVED"
+            change["ai_summary"] = f"Перемещено: {old_text[:50]}..." if block.exact else f"Перемещено с правками: {old_text[:50]}..."
+            change["moved_from"] = offset1 + block.i1 + 1
+            change["moved_to"] = offset2 + block.j1 + 1
+            if block.exact:
+                change["severity"] = "MINOR"
+            changes.append(change)
+        return changes
     
     # ==================== MODE: SEMANTIC ====================
     def _semantic_diff(self, text1: str, text2: str) -> Dict[str, Any]:
         """Semantic analysis - groups related changes, identifies meaning shifts"""
-        lines1 = text1.splitlines()
-        lines2 = text2.splitlines()
+        lines1 = self._split_lines(text1)
+        lines2 = self._split_lines(text2)
         
-        # First, get line-level changes
-        matcher = difflib.SequenceMatcher(None, lines1, lines2)
+        # First, get line-level changes (moved blocks are reported as MOVED below)
+        opcodes = self._line_opcodes(lines1, lines2)
+        moves = find_moved_blocks(lines1, lines2, opcodes)
+        moved1, moved2 = self._moved_lines(moves)
         raw_changes = []
         
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for tag, i1, i2, j1, j2 in opcodes:
             if tag == 'equal':
                 continue
             if tag == 'replace':
                 for idx in range(max(i2 - i1, j2 - j1)):
-                    old_line = lines1[i1 + idx] if i1 + idx < i2 else ""
-                    new_line = lines2[j1 + idx] if j1 + idx < j2 else ""
+                    old_line = lines1[i1 + idx] if i1 + idx < i2 and i1 + idx not in moved1 else ""
+                    new_line = lines2[j1 + idx] if j1 + idx < j2 and j1 + idx not in moved2 else ""
                     if old_line or new_line:
                         raw_changes.append((old_line, new_line, i1 + idx))
             elif tag == 'delete':
                 for idx in range(i1, i2):
-                    raw_changes.append((lines1[idx], "", idx))
+                    if idx not in moved1:
+                        raw_changes.append((lines1[idx], "", idx))
             elif tag == 'insert':
                 for idx in range(j1, j2):
-                    raw_changes.append(("", lines2[idx], idx))
+                    if idx not in moved2:
+                        raw_changes.append(("", lines2[idx], idx))
         
         # Semantic grouping - combine related changes
+        self._report("classify")
         changes = []
         for old, new, line_num in raw_changes:
             if not old.strip() and not new.strip():
                 continue
             
-            # Semantic classification
-            semantic_type = self._classify_semantic_change(old, new)
-            meaning_shift = self._detect_meaning_shift(old, new)
+            # Semantic classification (features shared with _make_change)
+            features = extract_features(old, new)
+            semantic_type = self._classify_semantic_change(features)
+            meaning_shift = self._detect_meaning_shift(features)
             
             change = self._make_change(
                 "MODIFIED" if old and new else ("DELETED" if old else "ADDED"),
-                old or None, new or None, f"строка {line_num + 1}"
+                old or None, new or None, f"строка {line_num + 1}", features=features
             )
             change["semantic_type"] = semantic_type
             change["meaning_shift"] = meaning_shift
@@ -125,8 +386,16 @@ class DiffEngine:
             
             changes.append(change)
         
-        result = self._build_result(changes, text1, text2)
-        result["diff_lines"] = self._build_side_by_side(lines1, lines2)
+        for change in self._moved_changes(lines1, lines2, moves):
+            # Moving a clause keeps its meaning; edits inside the block are still classified
+            change["semantic_type"] = self._classify_semantic_change(
+                extract_features(change["original_text"], change["new_text"]))
+            change["meaning_shift"] = None
+            changes.append(change)
+        
+        self._report("inline")
+        result = self._build_result(changes, text1, text2, lines1, lines2, opcodes)
+        self._attach_diff_view(result, lines1, lines2, moves=moves)
         result["mode_info"] = {
             "name": "Семантический",
             "description": "Анализ смысловых изменений — выявляет изменения значения"
@@ -136,8 +405,8 @@ class DiffEngine:
     # ==================== MODE: IMPACT ====================
     def _impact_diff(self, text1: str, text2: str) -> Dict[str, Any]:
         """Financial/business impact analysis - focuses on numbers and obligations"""
-        lines1 = text1.splitlines()
-        lines2 = text2.splitlines()
+        lines1 = self._split_lines(text1)
+        lines2 = self._split_lines(text2)
         
         changes = []
         financial_impact = []
@@ -183,19 +452,24 @@ class DiffEngine:
                     "business_context": f"Финансовое изменение на {abs(change_pct):.1f}%"
                 })
         
-        # Also get regular line changes
-        matcher = difflib.SequenceMatcher(None, lines1, lines2)
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        # Also get regular line changes (moved lines are not paired with their neighbours)
+        opcodes = self._line_opcodes(lines1, lines2)
+        moves = find_moved_blocks(lines1, lines2, opcodes)
+        moved1, moved2 = self._moved_lines(moves)
+        for tag, i1, i2, j1, j2 in opcodes:
             if tag == 'replace':
                 for idx in range(max(i2 - i1, j2 - j1)):
-                    old_line = lines1[i1 + idx] if i1 + idx < i2 else ""
-                    new_line = lines2[j1 + idx] if j1 + idx < j2 else ""
+                    old_line = lines1[i1 + idx] if i1 + idx < i2 and i1 + idx not in moved1 else ""
+                    new_line = lines2[j1 + idx] if j1 + idx < j2 and j1 + idx not in moved2 else ""
                     if old_line and new_line and self._has_numbers(old_line + new_line):
                         inline = self._compute_inline_diff(old_line, new_line)
                         changes.append(self._make_change("MODIFIED", old_line, new_line, f"строка {i1+idx+1}", inline))
+        # Moved blocks matter here only when numbers changed on the way
+        changes.extend(change for change, block in zip(self._moved_changes(lines1, lines2, moves), moves)
+                       if not block.exact and self._has_numbers(change["original_text"] + change["new_text"]))
         
-        result = self._build_result(changes, text1, text2)
-        result["diff_lines"] = self._build_side_by_side(lines1, lines2)
+        result = self._build_result(changes, text1, text2, lines1, lines2, opcodes)
+        self._attach_diff_view(result, lines1, lines2, moves=moves)
         result["financial_impact"] = financial_impact
         result["mode_info"] = {
             "name": "Влияние",
@@ -206,8 +480,8 @@ class DiffEngine:
     # ==================== MODE: CLAUSE ====================
     def _clause_diff(self, text1: str, text2: str) -> Dict[str, Any]:
         """Clause-by-clause analysis - groups changes by document sections"""
-        lines1 = text1.splitlines()
-        lines2 = text2.splitlines()
+        lines1 = self._split_lines(text1)
+        lines2 = self._split_lines(text2)
         
         # Extract clauses from both documents
         clauses1 = self._extract_clauses(text1)
@@ -267,7 +541,7 @@ class DiffEngine:
                 })
         
         result = self._build_result(changes, text1, text2)
-        result["diff_lines"] = self._build_side_by_side(lines1, lines2)
+        self._attach_diff_view(result, lines1, lines2)
         result["mode_info"] = {
             "name": "По пунктам",
             "description": "Анализ по разделам — группировка изменений по пунктам договора"
@@ -277,11 +551,13 @@ class DiffEngine:
     # ==================== MODE: LEGAL ====================
     def _legal_diff(self, text1: str, text2: str) -> Dict[str, Any]:
         """Legal analysis - focuses on legal terms and risks"""
-        lines1 = text1.splitlines()
-        lines2 = text2.splitlines()
+        lines1 = self._split_lines(text1)
+        lines2 = self._split_lines(text2)
         
-        # Get base line changes
-        matcher = difflib.SequenceMatcher(None, lines1, lines2)
+        # Get base line changes (moved blocks are reported as MOVED below)
+        opcodes = self._line_opcodes(lines1, lines2)
+        moves = find_moved_blocks(lines1, lines2, opcodes)
+        moved1, moved2 = self._moved_lines(moves)
         changes = []
         
         legal_keywords = {
@@ -296,14 +572,14 @@ class DiffEngine:
             "форс-мажор": ("FORCE_MAJEURE", "Форс-мажор", "MAJOR"),
         }
         
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for tag, i1, i2, j1, j2 in opcodes:
             if tag == 'equal':
                 continue
             
             if tag in ('replace', 'delete', 'insert'):
                 for idx in range(max(i2 - i1 if tag != 'insert' else 0, j2 - j1 if tag != 'delete' else 0)):
-                    old_line = lines1[i1 + idx] if tag != 'insert' and i1 + idx < i2 else ""
-                    new_line = lines2[j1 + idx] if tag != 'delete' and j1 + idx < j2 else ""
+                    old_line = lines1[i1 + idx] if tag != 'insert' and i1 + idx < i2 and i1 + idx not in moved1 else ""
+                    new_line = lines2[j1 + idx] if tag != 'delete' and j1 + idx < j2 and j1 + idx not in moved2 else ""
                     
                     if not old_line.strip() and not new_line.strip():
                         continue
@@ -343,14 +619,244 @@ class DiffEngine:
                     
                     changes.append(change)
         
-        result = self._build_result(changes, text1, text2)
-        result["diff_lines"] = self._build_side_by_side(lines1, lines2)
+        for change, block in zip(self._moved_changes(lines1, lines2, moves), moves):
+            change["legal_type"] = "MOVED"
+            change["legal_risk"] = {
+                "level": "LOW" if block.exact else "MEDIUM",
+                "description": "Пункт перемещён" if block.exact else "Пункт перемещён с правками",
+                "recommendation": None
+            }
+            changes.append(change)
+        
+        result = self._build_result(changes, text1, text2, lines1, lines2, opcodes)
+        self._attach_diff_view(result, lines1, lines2, moves=moves)
         result["mode_info"] = {
             "name": "Юридический",
             "description": "Правовой анализ — фокус на юридических терминах и рисках"
         }
         return result
     
+    # ==================== MODE: HIERARCHICAL ====================
+    def _hierarchical_diff(self, text1: str, text2: str) -> Dict[str, Any]:
+        """Section-first diff for long structured contracts.
+        
+        Both texts are split into numbered sections (and sub-sections inside
+        changed ones). Sections are aligned by heading and number; sections
+        with equal content hashes are emitted as unchanged without any line
+        diff, and each remaining section pair is diffed independently. Moved
+        blocks are then detected on the document-wide opcodes, so a clause
+        moved to another section is one MOVED change.
+        """
+        lines1 = self._split_lines(text1)
+        lines2 = self._split_lines(text2)
+        
+        # Step 1: Walk the section trees, collecting unchanged pairs and leaf tasks
+        blocks = []  # (lo1, hi1, lo2, hi2, heading, unchanged)
+        stats = {"total": 0, "unchanged": 0, "changed": 0, "added": 0, "deleted": 0}
+        self._align_section_tree(lines1, lines2, 0, len(lines1), 0, len(lines2), 1, blocks, stats)
+        
+        # Step 2: Diff changed sections independently (section_map may run them in parallel)
+        self._report("inline")
+        changed = [(lo1, hi1, lo2, hi2, heading) for lo1, hi1, lo2, hi2, heading, unchanged in blocks if not unchanged]
+        section_opcodes = list(self.section_map(
+            self._section_opcodes, [(lines1[lo1:hi1], lines2[lo2:hi2]) for lo1, hi1, lo2, hi2, _ in changed]
+        ))
+        
+        # Step 3: Moves across sections (a clause moved from section 5 to 9) on document-wide opcodes
+        opcodes = []
+        local_opcodes = iter(section_opcodes)
+        for lo1, hi1, lo2, hi2, _, unchanged in blocks:
+            if not unchanged:
+                opcodes.extend((tag, i1 + lo1, i2 + lo1, j1 + lo2, j2 + lo2)
+                               for tag, i1, i2, j1, j2 in next(local_opcodes))
+            elif hi1 > lo1:
+                opcodes.append(('equal', lo1, hi1, lo2, hi2))
+        moves = find_moved_blocks(lines1, lines2, opcodes)
+        moved1, moved2 = self._moved_lines(moves)
+        
+        # Step 4: Changes and matches of each section without its moved lines
+        tasks = [
+            (lines1[lo1:hi1], lines2[lo2:hi2], local, lo1, lo2,
+             {i - lo1 for i in moved1 if lo1 <= i < hi1}, {j - lo2 for j in moved2 if lo2 <= j < hi2})
+            for (lo1, hi1, lo2, hi2, _), local in zip(changed, section_opcodes)
+        ]
+        results = iter(self.section_map(self._diff_section, tasks))
+        
+        # Step 5: Stitch section results back into document-wide matches/changes
+        matches, changes = [], []
+        for lo1, hi1, lo2, hi2, heading, unchanged in blocks:
+            if unchanged:
+                matches.extend(zip(range(lo1, hi1), range(lo2, hi2)))
+                continue
+            section_matches, section_changes = next(results)
+            matches.extend(section_matches)
+            for change in section_changes:
+                change["section"] = heading
+            changes.extend(section_changes)
+        moved_changes = self._moved_changes(lines1, lines2, moves)
+        for change, block in zip(moved_changes, moves):
+            change["section"] = next(heading for lo1, hi1, _, _, heading in changed if lo1 <= block.i1 < hi1)
+        changes.extend(moved_changes)
+        
+        self._report("classify")
+        result = self._build_result(changes, text1, text2, lines1, lines2, opcodes)
+        self._attach_diff_view(result, lines1, lines2, matches, moves)
+        result["mode_info"] = {
+            "name": "Иерархический",
+            "description": "Сравнение по разделам — построчный diff только внутри изменённых разделов",
+            "sections": stats
+        }
+        return result
+    
+    def _align_section_tree(self, lines1: List[str], lines2: List[str],
+                            lo1: int, hi1: int, lo2: int, hi2: int, depth: int,
+                            blocks: List[Tuple], stats: Optional[Dict[str, int]], heading: str = "") -> None:
+        """Align sections of one numbering depth and descend into changed pairs.
+        
+        Appends (lo1, hi1, lo2, hi2, heading, unchanged) blocks that cover both
+        ranges in order; stats are counted for top-level sections only.
+        """
+        # Too deep or no structure at this depth - the whole range is one leaf
+        if depth > self.MAX_SECTION_DEPTH:
+            blocks.append((lo1, hi1, lo2, hi2, heading, lines1[lo1:hi1] == lines2[lo2:hi2]))
+            return
+        sections1 = self._split_sections(lines1, lo1, hi1, depth)
+        sections2 = self._split_sections(lines2, lo2, hi2, depth)
+        if len(sections1) <= 1 and len(sections2) <= 1:
+            blocks.append((lo1, hi1, lo2, hi2, heading, lines1[lo1:hi1] == lines2[lo2:hi2]))
+            return
+        
+        pos1, pos2 = lo1, lo2
+        for section1, section2 in self._align_sections(sections1, sections2):
+            if section1 and section2:
+                if section1["hash"] == section2["hash"]:
+                    status = "unchanged"
+                    blocks.append((section1["start"], section1["end"], section2["start"], section2["end"],
+                                   section1["heading"], True))
+                else:
+                    status = "changed"
+                    self._align_section_tree(lines1, lines2, section1["start"], section1["end"],
+                                             section2["start"], section2["end"], depth + 1, blocks, None,
+                                             section1["heading"] or heading)
+                pos1, pos2 = section1["end"], section2["end"]
+            elif section1:
+                status = "deleted"
+                blocks.append((section1["start"], section1["end"], pos2, pos2, section1["heading"], False))
+                pos1 = section1["end"]
+            else:
+                status = "added"
+                blocks.append((pos1, pos1, section2["start"], section2["end"], section2["heading"], False))
+                pos2 = section2["end"]
+            
+            if stats is not None:
+                stats["total"] += 1
+                stats[status] += 1
+    
+    def _split_sections(self, lines: List[str], lo: int, hi: int, depth: int) -> List[Dict[str, Any]]:
+        """Split lines[lo:hi] at numbered headings of the given depth (1 = "5.", 2 = "5.1.")"""
+        if lines is self._base_lines:
+            sections = self._base_sections.get((lo, hi, depth))
+            if sections is None:
+                sections = self._base_sections[(lo, hi, depth)] = self._scan_sections(lines, lo, hi, depth)
+            return sections
+        return self._scan_sections(lines, lo, hi, depth)
+    
+    def _scan_sections(self, lines: List[str], lo: int, hi: int, depth: int) -> List[Dict[str, Any]]:
+        pattern = self._section_pattern(depth)
+        sections = []
+        current = {"number": "", "heading": "", "start": lo}
+        
+        for idx in range(lo, hi):
+            match = pattern.match(lines[idx])
+            if match and idx > current["start"]:
+                current["end"] = idx
+                sections.append(current)
+                current = {"start": idx}
+            if match:
+                current["number"] = next(group for group in match.groups() if group)
+                current["heading"] = lines[idx].strip()[:100]
+        
+        current["end"] = hi
+        if hi > current["start"]:
+            sections.append(current)
+        
+        for section in sections:
+            content = "\n".join(lines[section["start"]:section["end"]])
+            section["hash"] = hashlib.sha1(content.encode("utf-8")).hexdigest()
+            heading = section["heading"]
+            if section["number"]:
+                heading = heading.split(section["number"], 1)[-1]
+            section["heading_key"] = " ".join(heading.lower().strip(" .").split())
+        return sections
+    
+    def _section_pattern(self, depth: int) -> "re.Pattern":
+        """Heading regex for numbering depth: top level needs "5." or "Раздел 5", deeper "5.1" / "5.1." """
+        number = r"\d{1,3}" + r"\.\d{1,3}" * (depth - 1)
+        if depth == 1:
+            return re.compile(rf"^\s*(?:(?:раздел|статья|глава)\s+({number})\.?|({number})\.)(?:\s+|$)",
+                              re.IGNORECASE)
+        return re.compile(rf"^\s*(?:(?:пункт|п\.)\s*)?({number})\.?(?:\s+|$)", re.IGNORECASE)
+    
+    def _align_sections(self, sections1: List[Dict], sections2: List[Dict]) -> List[Tuple[Optional[Dict], Optional[Dict]]]:
+        """Pair sections by heading text first, then by number inside changed runs"""
+        pairs = []
+        keys1 = [s["heading_key"] for s in sections1]
+        keys2 = [s["heading_key"] for s in sections2]
+        
+        for tag, i1, i2, j1, j2 in get_opcodes(keys1, keys2):
+            if tag == 'equal':
+                pairs.extend(zip(sections1[i1:i2], sections2[j1:j2]))
+                continue
+            
+            # Renamed sections keep their number
+            run1, run2 = sections1[i1:i2], sections2[j1:j2]
+            for ntag, a1, a2, b1, b2 in get_opcodes([s["number"] for s in run1], [s["number"] for s in run2]):
+                if ntag == 'equal':
+                    pairs.extend(zip(run1[a1:a2], run2[b1:b2]))
+                else:
+                    pairs.extend((section, None) for section in run1[a1:a2])
+                    pairs.extend((None, section) for section in run2[b1:b2])
+        
+        # Unpaired sections next to a changed region usually come from a heading
+        # that was edited or lost its numbering - diff them together with it
+        groups = []  # [sections1, sections2, changed, has_pair]
+        for section1, section2 in pairs:
+            paired = section1 is not None and section2 is not None
+            if paired and section1["hash"] == section2["hash"]:
+                groups.append([[section1], [section2], False, True])
+                continue
+            last = groups[-1] if groups else None
+            if last and last[2] and not (paired and last[3]):
+                if section1:
+                    last[0].append(section1)
+                if section2:
+                    last[1].append(section2)
+                last[3] = last[3] or paired
+            else:
+                groups.append([[section1] if section1 else [], [section2] if section2 else [], True, paired])
+        
+        return [(self._merge_sections(group1), self._merge_sections(group2)) for group1, group2, _, _ in groups]
+    
+    def _merge_sections(self, sections: List[Dict]) -> Optional[Dict[str, Any]]:
+        """Treat consecutive sections as one (None for an empty run)"""
+        if len(sections) <= 1:
+            return sections[0] if sections else None
+        return {**sections[0], "end": sections[-1]["end"],
+                "hash": "".join(section["hash"] for section in sections)}
+    
+    def _section_opcodes(self, task: Tuple[List[str], List[str]]) -> List[Tuple[str, int, int, int, int]]:
+        """Line opcodes of one section pair (section coordinates)"""
+        lines1, lines2 = task
+        return self._line_opcodes(lines1, lines2)
+    
+    def _diff_section(self, task: Tuple[List[str], List[str], List[Tuple[str, int, int, int, int]],
+                                        int, int, Set[int], Set[int]]) -> Tuple[List, List]:
+        """Changes and line matches of one section pair, skipping its moved lines (document coordinates)"""
+        lines1, lines2, opcodes, offset1, offset2, moved1, moved2 = task
+        changes = self._opcode_changes(lines1, lines2, opcodes, offset1, offset2, moved1, moved2)
+        matches = [(offset1 + i, offset2 + j) for i, j in self._find_unmoved_matches(lines1, lines2, moved1, moved2)]
+        return matches, changes
+    
     # ==================== MODE: TIMELINE ====================
     def _timeline_diff(self, text1: str, text2: str) -> Dict[str, Any]:
         """Timeline view - focuses on version changes summary"""
@@ -379,10 +885,13 @@ class DiffEngine:
     
     # ==================== HELPER METHODS ====================
     def _make_change(self, change_type: str, old_text: Optional[str], new_text: Optional[str], 
-                     location: str, inline_diff: Optional[Dict] = None) -> Dict:
-        """Create a change object"""
-        severity = self._calculate_severity(old_text or "", new_text or "")
-        classification = self._classify_change(old_text or "", new_text or "")
+                     location: str, inline_diff: Optional[Dict] = None,
+                     features: Optional[ChangeFeatures] = None) -> Dict:
+        """Create a change object (features of old/new text are extracted here unless given)"""
+        if features is None:
+            features = extract_features(old_text or "", new_text or "")
+        severity = self._calculate_severity(features)
+        classification = self._classify_change(features)
         
         change = {
             "id": f"change_{uuid.uuid4().hex[:8]}",
@@ -392,8 +901,8 @@ class DiffEngine:
             "location": location,
             "original_text": old_text,
             "new_text": new_text,
-            "ai_summary": self._generate_summary(old_text, new_text, classification),
-            "impact_score": self._calculate_impact(old_text or "", new_text or ""),
+            "ai_summary": self._generate_summary(old_text, new_text, classification, features),
+            "impact_score": self._calculate_impact(features),
         }
         
         if inline_diff:
@@ -403,36 +912,90 @@ class DiffEngine:
         return change
     
     def _compute_inline_diff(self, old_line: str, new_line: str) -> Dict[str, str]:
-        """Compute word-level inline diff"""
-        old_words = self._tokenize(old_line)
-        new_words = self._tokenize(new_line)
+        """Compute inline diff HTML (see _inline_spans)"""
+        left_spans, right_spans = self._inline_spans(old_line, new_line)
+        return {
+            "left_html": mark_spans(old_line, left_spans, "diff-del"),
+            "right_html": mark_spans(new_line, right_spans, "diff-add")
+        }
+    
+    def _inline_spans(self, old_line: str, new_line: str) -> Tuple[List[List[int]], List[List[int]]]:
+        """Highlighted [start, end) character ranges of both lines.
         
-        matcher = difflib.SequenceMatcher(None, old_words, new_words)
-        left_html = []
-        right_html = []
+        Words for ordinary lines, sentences then words for long ones.
+        Whole-line spans are used once refinement is off (coarse fidelity or
+        past the deadline).
+        """
+        if self.fidelity == "coarse" or self._out_of_time():
+            return [[0, len(old_line)]], [[0, len(new_line)]]
         
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-            old_part = ''.join(old_words[i1:i2])
-            new_part = ''.join(new_words[j1:j2])
-            
+        left_spans: List[List[int]] = []
+        right_spans: List[List[int]] = []
+        
+        if len(old_line) <= LONG_LINE_CHARS and len(new_line) <= LONG_LINE_CHARS:
+            self._word_spans(old_line, new_line, 0, 0, left_spans, right_spans)
+            return left_spans, right_spans
+        
+        # Level 1: align sentences, level 2: words inside replaced sentence pairs
+        old_sentences = split_sentences(old_line)
+        new_sentences = split_sentences(new_line)
+        old_starts = [0]
+        for sentence in old_sentences:
+            old_starts.append(old_starts[-1] + len(sentence))
+        new_starts = [0]
+        for sentence in new_sentences:
+            new_starts.append(new_starts[-1] + len(sentence))
+        
+        for tag, i1, i2, j1, j2 in get_opcodes(old_sentences, new_sentences):
             if tag == 'equal':
-                left_html.append(self._escape(old_part))
-                right_html.append(self._escape(new_part))
-            elif tag == 'replace':
-                left_html.append(f'<mark class="diff-del">{self._escape(old_part)}</mark>')
-                right_html.append(f'<mark class="diff-add">{self._escape(new_part)}</mark>')
-            elif tag == 'delete':
-                left_html.append(f'<mark class="diff-del">{self._escape(old_part)}</mark>')
-            elif tag == 'insert':
-                right_html.append(f'<mark class="diff-add">{self._escape(new_part)}</mark>')
+                continue
+            for idx in range(max(i2 - i1, j2 - j1)):
+                has_old, has_new = i1 + idx < i2, j1 + idx < j2
+                if has_old and has_new:
+                    self._word_spans(old_sentences[i1 + idx], new_sentences[j1 + idx],
+                                     old_starts[i1 + idx], new_starts[j1 + idx], left_spans, right_spans)
+                elif has_old:
+                    left_spans.append([old_starts[i1 + idx], old_starts[i1 + idx + 1]])
+                else:
+                    right_spans.append([new_starts[j1 + idx], new_starts[j1 + idx + 1]])
         
-        return {"left_html": ''.join(left_html), "right_html": ''.join(right_html)}
+        return left_spans, right_spans
+    
+    def _word_spans(self, old_text: str, new_text: str, base1: int, base2: int,
+                    left_spans: List[List[int]], right_spans: List[List[int]]) -> None:
+        """Append word-level highlight spans for one pair of texts (offset by base1/base2)"""
+        old_words = self._tokenize(old_text)
+        new_words = self._tokenize(new_text)
+        
+        # A single huge sentence is highlighted as a whole to keep the cost bounded
+        if len(old_words) > self.MAX_INLINE_TOKENS or len(new_words) > self.MAX_INLINE_TOKENS:
+            left_spans.append([base1, base1 + len(old_text)])
+            right_spans.append([base2, base2 + len(new_text)])
+            return
+        
+        old_offsets = [base1]
+        for word in old_words:
+            old_offsets.append(old_offsets[-1] + len(word))
+        new_offsets = [base2]
+        for word in new_words:
+            new_offsets.append(new_offsets[-1] + len(word))
+        
+        matcher = difflib.SequenceMatcher(None, old_words, new_words)
+        
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag in ('replace', 'delete'):
+                left_spans.append([old_offsets[i1], old_offsets[i2]])
+            if tag in ('replace', 'insert'):
+                right_spans.append([new_offsets[j1], new_offsets[j2]])
     
     def _tokenize(self, text: str) -> List[str]:
         """Tokenize text preserving numbers and words"""
         return re.findall(r'\d+[.,]?\d*|\w+|[^\w\s]+|\s+', text, re.UNICODE)
     
-    def _build_side_by_side(self, lines1: List[str], lines2: List[str]) -> Dict[str, List]:
+    def _build_side_by_side(self, lines1: List[str], lines2: List[str],
+                            matches: Optional[List[Tuple[int, int]]] = None,
+                            moves: Optional[List[MovedBlock]] = None,
+                            anchors: Optional[List[Tuple[int, int]]] = None) -> Dict[str, Any]:
         """Build side-by-side diff structure with proper alignment (ComparePlus style).
         
         Algorithm:
@@ -441,292 +1004,271 @@ class DiffEngine:
         3. Lines between anchors that don't match become additions/deletions with empty placeholders
         
         Key principle: Similar lines ALWAYS appear at the same row, opposite each other.
+        Lines of moved blocks stay out of the alignment and are shown as "moved".
+        
+        Returns the compact payload (services.diff_view), or the legacy
+        left/right row lists when diff_format is "legacy".
         """
-        print("=" * 50)
-        print("NEW DIFF ALGORITHM v2 RUNNING!")
-        print(f"Lines1: {len(lines1)}, Lines2: {len(lines2)}")
-        print("=" * 50)
-        
-        left, right = [], []
-        
-        # Step 1: Find matching line pairs using longest common subsequence approach
-        # A line "matches" if it's identical or very similar (>60%)
-        matches = self._find_line_matches(lines1, lines2)
-        print(f"Found {len(matches)} matches")
-        # Show matches around problematic area (lines 7-15) with similarity
-        for m in matches:
-            if 7 <= m[0] <= 15 or 7 <= m[1] <= 15:
-                sim = difflib.SequenceMatcher(None, lines1[m[0]], lines2[m[1]]).ratio()
-                print(f"  Match: line1[{m[0]}] <-> line2[{m[1]}] (sim={sim:.2f})")
-                print(f"    Left:  '{lines1[m[0]][:60]}'")
-                print(f"    Right: '{lines2[m[1]][:60]}'")
-        
-        # Step 2: Build aligned output
-        left_num, right_num = 1, 1
-        i, j = 0, 0  # Pointers into lines1 and lines2
+        rows = self._align_rows(lines1, lines2, matches, moves, anchors)
+        diff = build_compact_diff(lines1, lines2, rows, self.show_full)
+        if self.diff_format == "legacy":
+            return expand_compact_diff(diff)
+        return diff
+    
+    def _attach_diff_view(self, result: Dict[str, Any], lines1: List[str], lines2: List[str],
+                          matches: Optional[List[Tuple[int, int]]] = None,
+                          moves: Optional[List[MovedBlock]] = None,
+                          anchors: Optional[List[Tuple[int, int]]] = None) -> None:
+        """Store the side-by-side view under "diff" (compact) or "diff_lines" (legacy)"""
+        view = self._build_side_by_side(lines1, lines2, matches, moves, anchors)
+        result["diff_lines" if self.diff_format == "legacy" else "diff"] = view
+    
+    def _align_rows(self, lines1: List[str], lines2: List[str],
+                    matches: Optional[List[Tuple[int, int]]] = None,
+                    moves: Optional[List[MovedBlock]] = None,
+                    anchors: Optional[List[Tuple[int, int]]] = None) -> List[Tuple]:
+        """Aligned display rows (kind, i, j, extra) - see diff_view.build_compact_diff
+        
+        anchors (identical line pairs known in advance) replace the anchor search.
+        """
+        rows = []
         
-        for (left_idx, right_idx) in matches:
-            # Output all unmatched lines from left (deleted) before this match
+        # Moved lines -> line number of the block on the other side
+        moved1: Dict[int, int] = {}
+        moved2: Dict[int, int] = {}
+        for block in moves or []:
+            moved1.update((idx, block.j1 + 1) for idx in range(block.i1, block.i2))
+            moved2.update((idx, block.i1 + 1) for idx in range(block.j1, block.j2))
+        
+        # Step 1: Find matching line pairs (anchors first, fuzzy matching inside gaps)
+        # A line "matches" if it's identical or very similar (>=70%)
+        if matches is None:
+            matches = self._find_unmoved_matches(lines1, lines2, set(moved1), set(moved2), anchors)
+        
+        # Step 2: Emit rows - unmatched left lines, unmatched right lines, then the pair
+        # (lines with equal match keys are shown as unchanged, each with its own text)
+        keys1, keys2 = self._line_keys(lines1), self._line_keys(lines2)
+        i, j = 0, 0  # Pointers into lines1 and lines2
+        for (left_idx, right_idx) in matches + [(len(lines1), len(lines2))]:
             while i < left_idx:
-                left.append({
-                    "num": left_num,
-                    "type": "deleted",
-                    "text": lines1[i],
-                    "html": f'<mark class="diff-del">{self._escape(lines1[i])}</mark>'
-                })
-                right.append({
-                    "num": "",
-                    "type": "empty",
-                    "text": "",
-                    "html": ""
-                })
-                left_num += 1
+                rows.append(("moved_out", i, None, moved1[i]) if i in moved1 else ("deleted", i, None, None))
                 i += 1
-            
-            # Output all unmatched lines from right (added) before this match
             while j < right_idx:
-                left.append({
-                    "num": "",
-                    "type": "empty",
-                    "text": "",
-                    "html": ""
-                })
-                right.append({
-                    "num": right_num,
-                    "type": "added",
-                    "text": lines2[j],
-                    "html": f'<mark class="diff-add">{self._escape(lines2[j])}</mark>'
-                })
-                right_num += 1
+                rows.append(("moved_in", None, j, moved2[j]) if j in moved2 else ("added", None, j, None))
                 j += 1
             
-            # Output the matched pair
-            line1 = lines1[left_idx]
-            line2 = lines2[right_idx]
-            
-            if line1 == line2:
-                # Identical lines
-                if self.show_full:
-                    left.append({
-                        "num": left_num,
-                        "type": "unchanged",
-                        "text": line1,
-                        "html": self._escape(line1)
-                    })
-                    right.append({
-                        "num": right_num,
-                        "type": "unchanged",
-                        "text": line2,
-                        "html": self._escape(line2)
-                    })
-                    left_num += 1
-                    right_num += 1
+            if left_idx == len(lines1):
+                break
+            if keys1[left_idx] == keys2[right_idx]:
+                rows.append(("unchanged", left_idx, right_idx, None))
             else:
-                # Similar but not identical - show as modified with inline diff
-                inline = self._compute_inline_diff(line1, line2)
-                left.append({
-                    "num": left_num,
-                    "type": "modified",
-                    "text": line1,
-                    "html": inline["left_html"]
-                })
-                right.append({
-                    "num": right_num,
-                    "type": "modified",
-                    "text": line2,
-                    "html": inline["right_html"]
-                })
-                left_num += 1
-                right_num += 1
-            
-            # Move pointers past the matched lines
+                # Similar but not identical - modified with inline highlight spans
+                rows.append(("modified", left_idx, right_idx, self._inline_spans(lines1[left_idx], lines2[right_idx])))
             i = left_idx + 1
             j = right_idx + 1
         
-        # Output remaining unmatched lines from left (deleted)
-        while i < len(lines1):
-            left.append({
-                "num": left_num,
-                "type": "deleted",
-                "text": lines1[i],
-                "html": f'<mark class="diff-del">{self._escape(lines1[i])}</mark>'
-            })
-            right.append({
-                "num": "",
-                "type": "empty",
-                "text": "",
-                "html": ""
-            })
-            left_num += 1
-            i += 1
-        
-        # Output remaining unmatched lines from right (added)
-        while j < len(lines2):
-            left.append({
-                "num": "",
-                "type": "empty",
-                "text": "",
-                "html": ""
-            })
-            right.append({
-                "num": right_num,
-                "type": "added",
-                "text": lines2[j],
-                "html": f'<mark class="diff-add">{self._escape(lines2[j])}</mark>'
-            })
-            right_num += 1
-            j += 1
-        
-        return {"left": left, "right": right}
-    
-    def _find_line_matches(self, lines1: List[str], lines2: List[str]) -> List[Tuple[int, int]]:
-        """Find matching lines between two documents using LCS (Longest Common Subsequence).
+        return rows
+    
+    def _find_unmoved_matches(self, lines1: List[str], lines2: List[str], moved1: Set[int], moved2: Set[int],
+                              anchors: Optional[List[Tuple[int, int]]] = None) -> List[Tuple[int, int]]:
+        """_find_line_matches() with moved lines kept out of the alignment"""
+        if not moved1 and not moved2:
+            return self._find_line_matches(lines1, lines2, anchors)
+        keep1 = [i for i in range(len(lines1)) if i not in moved1]
+        keep2 = [j for j in range(len(lines2)) if j not in moved2]
+        if anchors is not None:
+            pos1 = {i: a for a, i in enumerate(keep1)}
+            pos2 = {j: b for b, j in enumerate(keep2)}
+            anchors = [(pos1[i], pos2[j]) for i, j in anchors if i in pos1 and j in pos2]
+        return [
+            (keep1[a], keep2[b]) for a, b in
+            self._find_line_matches([lines1[i] for i in keep1], [lines2[j] for j in keep2], anchors)
+        ]
+    
+    def _find_line_matches(self, lines1: List[str], lines2: List[str],
+                           anchors: Optional[List[Tuple[int, int]]] = None) -> List[Tuple[int, int]]:
+        """Find matching lines between two documents.
         
         Returns list of (idx1, idx2) pairs where lines1[idx1] matches lines2[idx2].
         Matches are ordered and non-crossing (if (a,b) and (c,d) are matches and a<c, then b<d).
         
-        A line "matches" if:
-        - It's identical, OR
-        - Similarity ratio >= 0.7 (70%) - high threshold to avoid false matches
+        Algorithm (patience/histogram style):
+        1. Pin anchors - identical lines of the common prefix/suffix and lines that
+           occur exactly once in both documents (longest increasing chain of them)
+        2. Repeat inside every gap between anchors (repeated lines may become unique there)
+        3. Run fuzzy matching + weighted LCS only inside the gaps that are left
+           (skipped below "full" fidelity, for oversized gaps and after the deadline)
+        
+        Steps 1-2 and the exact score of step 3 compare match keys of the
+        normalization profile, so lines differing only in extraction noise
+        pair up without a fuzzy ratio.
+        
+        For mostly unchanged documents the fuzzy step only sees the small regions
+        around real edits, so alignment stays near-linear. Given anchors skip
+        step 1-2 (and are used as is at coarse fidelity).
         """
         n1, n2 = len(lines1), len(lines2)
         if n1 == 0 or n2 == 0:
             return []
         
-        THRESHOLD = 0.7  # High threshold - only match truly similar lines
+        if anchors is None and self.fidelity == "coarse":
+            return [
+                (i1 + k, j1 + k)
+                for tag, i1, i2, j1, j2 in self._paragraph_opcodes(lines1, lines2) if tag == 'equal'
+                for k in range(i2 - i1)
+            ]
         
-        # Build similarity matrix: sim[i][j] = similarity score or 0 if below threshold
-        sim_matrix = []
-        for i, line1 in enumerate(lines1):
-            row = []
-            for j, line2 in enumerate(lines2):
-                if line1 == line2:
-                    row.append(2.0)  # Bonus for exact match
-                elif line1.strip() and line2.strip():
-                    sim = difflib.SequenceMatcher(None, line1, line2).ratio()
-                    if sim >= THRESHOLD:
-                        row.append(sim)
-                    else:
-                        row.append(0)
-                else:
-                    # Empty line matches empty line
-                    if not line1.strip() and not line2.strip():
-                        row.append(1.5)
-                    else:
-                        row.append(0)
-            sim_matrix.append(row)
-        
-        # Use dynamic programming to find optimal alignment (LCS with weights)
-        # dp[i][j] = best score for aligning lines1[:i] with lines2[:j]
-        # We want to maximize total similarity while maintaining order
-        
-        dp = [[0.0] * (n2 + 1) for _ in range(n1 + 1)]
-        parent = [[None] * (n2 + 1) for _ in range(n1 + 1)]
-        
-        for i in range(1, n1 + 1):
-            for j in range(1, n2 + 1):
-                # Option 1: Skip line from lines1 (deletion) - small penalty
-                skip1_score = dp[i-1][j] - 0.01
-                if skip1_score > dp[i][j]:
-                    dp[i][j] = skip1_score
-                    parent[i][j] = (i-1, j, 'skip1')
-                
-                # Option 2: Skip line from lines2 (addition) - small penalty
-                skip2_score = dp[i][j-1] - 0.01
-                if skip2_score > dp[i][j]:
-                    dp[i][j] = skip2_score
-                    parent[i][j] = (i, j-1, 'skip2')
-                
-                # Option 3: Match lines i-1 and j-1 (if similar enough)
-                sim = sim_matrix[i-1][j-1]
-                if sim > 0:
-                    score = dp[i-1][j-1] + sim
-                    if score > dp[i][j]:
-                        dp[i][j] = score
-                        parent[i][j] = (i-1, j-1, 'match')
-        
-        # Backtrack to find the matches
+        keys1, keys2 = self._line_keys(lines1), self._line_keys(lines2)
+        ids1, ids2 = intern_lines(keys1, keys2)
         matches = []
-        i, j = n1, n2
-        while i > 0 and j > 0:
-            if parent[i][j] is None:
-                break
-            pi, pj, action = parent[i][j]
-            if action == 'match':
-                matches.append((i-1, j-1))
-            i, j = pi, pj
+        prev1, prev2 = 0, 0
+        if anchors is None:
+            anchors = self._find_anchors(keys1, keys2)
+        for idx1, idx2 in anchors + [(n1, n2)]:
+            if idx1 > prev1 and idx2 > prev2 and self._can_refine_gap(idx1 - prev1, idx2 - prev2):
+                matches.extend(self._align_gap(lines1, lines2, prev1, idx1, prev2, idx2, ids1, ids2))
+            if idx1 < n1:
+                matches.append((idx1, idx2))
+            prev1, prev2 = idx1 + 1, idx2 + 1
         
-        matches.reverse()
         return matches
     
-    def _classify_change(self, old: str, new: str) -> str:
+    def _find_anchors(self, lines1: List[str], lines2: List[str]) -> List[Tuple[int, int]]:
+        """Find exact anchor pairs: common prefix/suffix and unique-in-both lines.
+        
+        Works on ranges [lo1, hi1) x [lo2, hi2) with an explicit stack, so deep
+        nesting of gaps never hits the recursion limit.
+        """
+        anchors = []
+        stack = [(0, len(lines1), 0, len(lines2))]
+        
+        while stack:
+            lo1, hi1, lo2, hi2 = stack.pop()
+            
+            # Common prefix and suffix are always part of the optimal alignment
+            while lo1 < hi1 and lo2 < hi2 and lines1[lo1] == lines2[lo2]:
+                anchors.append((lo1, lo2))
+                lo1 += 1
+                lo2 += 1
+            while lo1 < hi1 and lo2 < hi2 and lines1[hi1 - 1] == lines2[hi2 - 1]:
+                hi1 -= 1
+                hi2 -= 1
+                anchors.append((hi1, hi2))
+            
+            if lo1 == hi1 or lo2 == hi2:
+                continue
+            
+            chain = unique_line_chain(lines1, lines2, lo1, hi1, lo2, hi2)
+            if not chain:
+                continue
+            anchors.extend(chain)
+            
+            # Gaps between chain entries get their own anchoring pass
+            prev1, prev2 = lo1, lo2
+            for idx1, idx2 in chain + [(hi1, hi2)]:
+                if idx1 > prev1 and idx2 > prev2:
+                    stack.append((prev1, idx1, prev2, idx2))
+                prev1, prev2 = idx1 + 1, idx2 + 1
+        
+        anchors.sort()
+        return anchors
+    
+    def _can_refine_gap(self, size1: int, size2: int) -> bool:
+        """Whether a gap between anchors still gets fuzzy alignment"""
+        if self.fidelity != "full":
+            return False
+        if size1 * size2 > self.MAX_GAP_CELLS:
+            self._degraded = True
+            return False
+        return not self._out_of_time()
+    
+    def _align_gap(self, lines1: List[str], lines2: List[str],
+                   lo1: int, hi1: int, lo2: int, hi2: int,
+                   ids1: List[int], ids2: List[int]) -> List[Tuple[int, int]]:
+        """Align the gap [lo1, hi1) x [lo2, hi2) between two anchors using weighted LCS.
+        
+        A line "matches" if:
+        - It's identical (score 2.0), or both lines are empty (score 1.5), OR
+        - Similarity ratio >= 0.7 (70%) - high threshold to avoid false matches
+        
+        Scores are kept as sparse rows and the DP runs in alignment_kernel
+        (vectorized with NumPy, one int8 direction per cell for backtracking).
+        """
+        THRESHOLD = 0.7  # High threshold - only match truly similar lines
+        
+        rows = gap_similarity_rows(
+            lines1, lines2, ids1, ids2,
+            self._get_signatures(lines1), self._get_signatures(lines2),
+            lo1, hi1, lo2, hi2, THRESHOLD
+        )
+        return [(lo1 + i, lo2 + j) for i, j in weighted_alignment(rows, hi2 - lo2)]
+    
+    def _line_keys(self, lines: List[str]) -> List[str]:
+        """Match keys of a document under the normalization profile, computed once per compare() call"""
+        if self.normalization == "exact":
+            return lines
+        cached = self._key_cache.get(id(lines))
+        if cached is None or cached[0] is not lines:
+            cached = (lines, line_keys(lines, self.normalization))
+            self._key_cache[id(lines)] = cached
+        return cached[1]
+    
+    def _get_signatures(self, lines: List[str]) -> LineSignatures:
+        """Line signatures of a document, computed once per compare() call"""
+        signatures = self._signature_cache.get(id(lines))
+        if signatures is None or signatures.lines is not lines:
+            signatures = LineSignatures(lines)
+            self._signature_cache[id(lines)] = signatures
+        return signatures
+    
+    def _classify_change(self, features: ChangeFeatures) -> str:
         """Classify change type"""
-        old_nums = re.findall(r'\d+[.,]?\d*', old)
-        new_nums = re.findall(r'\d+[.,]?\d*', new)
-        if old_nums != new_nums:
+        if features.old_numbers != features.new_numbers:
             return "NUMERICAL_CHANGE"
-        if re.search(r'\d{1,2}[./]\d{1,2}[./]\d{2,4}', old + new):
+        if features.has_date:
             return "TEMPORAL_CHANGE"
         return "TEXT_CHANGE"
     
-    def _classify_semantic_change(self, old: str, new: str) -> str:
+    def _classify_semantic_change(self, features: ChangeFeatures) -> str:
         """Classify semantic change"""
-        combined = (old + new).lower()
-        if any(kw in combined for kw in ["сумм", "рубл", "платеж", "цен"]):
-            return "FINANCIAL"
-        if any(kw in combined for kw in ["срок", "дат", "период"]):
-            return "TEMPORAL"
-        if any(kw in combined for kw in ["ответственност", "штраф", "обязательств"]):
-            return "LEGAL"
+        for group, semantic_type in (("financial", "FINANCIAL"), ("temporal", "TEMPORAL"), ("legal", "LEGAL")):
+            if group in features.groups:
+                return semantic_type
         return "GENERAL"
     
-    def _detect_meaning_shift(self, old: str, new: str) -> Optional[str]:
+    def _detect_meaning_shift(self, features: ChangeFeatures) -> Optional[str]:
         """Detect if meaning has shifted"""
-        old_nums = [float(n.replace(',', '.')) for n in re.findall(r'\d+[.,]?\d*', old) if n]
-        new_nums = [float(n.replace(',', '.')) for n in re.findall(r'\d+[.,]?\d*', new) if n]
-        
-        if old_nums and new_nums and old_nums != new_nums:
-            diff = new_nums[0] - old_nums[0] if old_nums and new_nums else 0
-            if abs(diff) > 0:
-                return f"Числовое значение изменилось: {old_nums[0]} → {new_nums[0]}"
+        old_nums, new_nums = features.old_values, features.new_values
+        if old_nums and new_nums and old_nums != new_nums and new_nums[0] != old_nums[0]:
+            return f"Числовое значение изменилось: {old_nums[0]} → {new_nums[0]}"
         return None
     
-    def _calculate_severity(self, old: str, new: str) -> str:
+    def _calculate_severity(self, features: ChangeFeatures) -> str:
         """Calculate severity"""
-        combined = (old + new).lower()
-        
         # Number changes
-        old_nums = [float(n.replace(',', '.')) for n in re.findall(r'\d+[.,]?\d*', old) if n]
-        new_nums = [float(n.replace(',', '.')) for n in re.findall(r'\d+[.,]?\d*', new) if n]
+        old_nums, new_nums = features.old_values, features.new_values
         if old_nums and new_nums and old_nums != new_nums:
             return "CRITICAL" if abs(new_nums[0] - old_nums[0]) / max(old_nums[0], 1) > 0.1 else "MAJOR"
         
-        critical_kw = ["ответственност", "штраф", "неустойк", "расторж"]
-        if any(kw in combined for kw in critical_kw):
+        if "critical" in features.groups:
             return "CRITICAL"
-        
-        major_kw = ["сумм", "рубл", "платеж", "срок"]
-        if any(kw in combined for kw in major_kw):
+        if "major" in features.groups:
             return "MAJOR"
-        
         return "MINOR"
     
-    def _calculate_impact(self, old: str, new: str) -> int:
+    def _calculate_impact(self, features: ChangeFeatures) -> int:
         """Calculate impact score"""
         score = 20
-        numbers = re.findall(r'\d+', old + new)
-        if numbers:
-            max_num = max(int(n) for n in numbers if n.isdigit() and len(n) < 10)
-            if max_num > 10000:
-                score += 40
-            elif max_num > 1000:
-                score += 25
+        if features.max_integer > 10000:
+            score += 40
+        elif features.max_integer > 1000:
+            score += 25
         return min(100, score)
     
-    def _generate_summary(self, old: str, new: str, classification: str) -> str:
+    def _generate_summary(self, old: Optional[str], new: Optional[str], classification: str,
+                          features: ChangeFeatures) -> str:
         """Generate summary"""
-        old_nums = re.findall(r'\d+[.,]?\d*', old or "")
-        new_nums = re.findall(r'\d+[.,]?\d*', new or "")
+        old_nums, new_nums = features.old_numbers, features.new_numbers
         
         if classification == "NUMERICAL_CHANGE" and old_nums and new_nums:
             return f"Изменено: {old_nums[0]} → {new_nums[0]}"
@@ -811,17 +1353,20 @@ class DiffEngine:
         
         return clauses
     
-    def _escape(self, text: str) -> str:
-        """Escape HTML"""
-        return (text.replace("&", "&amp;").replace("<", "&lt;")
-                .replace(">", "&gt;").replace('"', "&quot;"))
-    
-    def _build_result(self, changes: List[Dict], text1: str, text2: str) -> Dict[str, Any]:
+    def _build_result(self, changes: List[Dict], text1: str, text2: str,
+                      lines1: Optional[List[str]] = None, lines2: Optional[List[str]] = None,
+                      opcodes: Optional[List[Tuple[str, int, int, int, int]]] = None) -> Dict[str, Any]:
         """Build result"""
         critical = sum(1 for c in changes if c.get("severity") == "CRITICAL")
         major = sum(1 for c in changes if c.get("severity") == "MAJOR")
         minor = sum(1 for c in changes if c.get("severity") == "MINOR")
-        similarity = difflib.SequenceMatcher(None, text1, text2).ratio()
+        if self.exact_similarity:
+            similarity = difflib.SequenceMatcher(None, text1, text2).ratio()
+        else:
+            if lines1 is None or lines2 is None or opcodes is None:
+                lines1, lines2 = self._split_lines(text1), self._split_lines(text2)
+                opcodes = self._line_opcodes(lines1, lines2)
+            similarity = self._estimate_similarity(lines1, lines2, opcodes)
         
         return {
             "summary": {
@@ -834,3 +1379,31 @@ class DiffEngine:
             "changes": changes,
             "financial_impact": []
         }
+    
+    def _estimate_similarity(self, lines1: List[str], lines2: List[str],
+                             opcodes: List[Tuple[str, int, int, int, int]]) -> float:
+        """Estimate the character similarity ratio from an existing line diff.
+        
+        Same scale as SequenceMatcher.ratio(): 2 * matched / total characters.
+        Equal lines count in full (with their newline); replaced lines are paired
+        in order and contribute their trigram similarity. Cost is linear in the
+        size of the changed lines - no character-level pass over the documents.
+        """
+        total = sum(len(line) + 1 for line in lines1) + sum(len(line) + 1 for line in lines2)
+        if total == 0:
+            return 1.0
+        
+        sigs1 = self._get_signatures(lines1)
+        sigs2 = self._get_signatures(lines2)
+        matched = 0.0
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == 'equal':
+                matched += sum(len(line) + 1 for line in lines1[i1:i2])
+            elif tag == 'replace':
+                for offset in range(min(i2 - i1, j2 - j1)):
+                    i, j = i1 + offset, j1 + offset
+                    if lines1[i] and lines2[j]:
+                        pair_size = (len(lines1[i]) + len(lines2[j])) / 2
+                        matched += trigram_similarity(sigs1[i], sigs2[j]) * pair_size
+        
+        return min(1.0, 2.0 * matched / total)
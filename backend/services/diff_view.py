@@ -0,0 +1,149 @@
+"""
+Side-by-Side Diff View
+Compact opcode payload for the side-by-side view and its expansion to per-line rows
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+# "compact" - both texts once plus alignment ops (default)
+# "legacy"  - pre-rendered left/right row dictionaries (diff_lines)
+DIFF_FORMATS = ["compact", "legacy"]
+
+Span = List[int]  # [start, end) character range of a highlighted segment
+
+# Aligned row kinds produced by DiffEngine, and their run-length op codes
+ROW_OPS = {
+    "unchanged": "=",
+    "modified": "~",
+    "deleted": "-",
+    "added": "+",
+    "moved_out": ">",
+    "moved_in": "<",
+}
+
+
+def escape_html(text: str) -> str:
+    """Escape HTML"""
+    return (text.replace("&", "&amp;").replace("<", "&lt;")
+            .replace(">", "&gt;").replace('"', "&quot;"))
+
+
+def mark_spans(text: str, spans: List[Span], css_class: str) -> str:
+    """Escaped text with every span wrapped in <mark class=css_class>"""
+    parts = []
+    pos = 0
+    for start, end in spans:
+        parts.append(escape_html(text[pos:start]))
+        parts.append(f'<mark class="{css_class}">{escape_html(text[start:end])}</mark>')
+        pos = end
+    parts.append(escape_html(text[pos:]))
+    return ''.join(parts)
+
+
+def build_compact_diff(lines1: List[str], lines2: List[str],
+                       rows: List[Tuple], show_full: bool) -> Dict[str, Any]:
+    """Run-length encode aligned rows.
+
+    rows come from DiffEngine in display order as (kind, i, j, extra) where
+    extra is (left_spans, right_spans) for "modified" and the 1-based line
+    number on the other side for moved rows. Ops:
+
+        ["=", i, j, n]                    n unchanged lines
+        ["~", i, j, left_spans, right_spans]  one modified pair
+        ["-", i, n] / ["+", j, n]          deleted / added lines
+        [">", i, n, line] / ["<", j, n, line]  lines moved to / from `line`
+
+    Each line is sent once: right-hand lines of "=" runs are null (they
+    equal the left ones), and without show_full the unchanged lines are
+    not sent at all.
+    """
+    ops: List[List[Any]] = []
+    for kind, i, j, extra in rows:
+        code = ROW_OPS[kind]
+        last = ops[-1] if ops else None
+        if code == "~":
+            ops.append([code, i, j, extra[0], extra[1]])
+        elif code == "=":
+            if last and last[0] == "=" and last[1] + last[3] == i and last[2] + last[3] == j:
+                last[3] += 1
+            else:
+                ops.append([code, i, j, 1])
+        else:
+            start = i if code in ("-", ">") else j
+            if last and last[0] == code and last[1] + last[2] == start and \
+                    (code in ("-", "+") or last[3] == extra):
+                last[2] += 1
+            elif code in ("-", "+"):
+                ops.append([code, start, 1])
+            else:
+                ops.append([code, start, 1, extra])
+
+    left: List[Optional[str]] = list(lines1)
+    right: List[Optional[str]] = list(lines2)
+    for op in ops:
+        if op[0] == "=":
+            _, i, j, n = op
+            right[j:j + n] = [None] * n
+            if not show_full:
+                left[i:i + n] = [None] * n
+
+    return {
+        "format": "compact",
+        "show_full": show_full,
+        "left": left,
+        "right": right,
+        "ops": ops
+    }
+
+
+def expand_compact_diff(diff: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Render a compact diff into the legacy {"left": [...], "right": [...]} rows"""
+    lines1, lines2 = diff["left"], list(diff["right"])
+    show_full = diff.get("show_full", True)
+    left, right = [], []
+    counters = {"left": 1, "right": 1}
+
+    def row(side: str, row_type: str, text: str, html: str, moved_line: Optional[int] = None) -> Dict[str, Any]:
+        item = {"num": counters[side], "type": row_type, "text": text, "html": html}
+        if moved_line is not None:
+            item["moved_line"] = moved_line
+        counters[side] += 1
+        return item
+
+    for op in diff["ops"]:
+        code = op[0]
+        if code == "=":
+            if not show_full:
+                continue
+            _, i, j, n = op
+            lines2[j:j + n] = lines1[i:i + n]
+            for k in range(n):
+                left.append(row("left", "unchanged", lines1[i + k], escape_html(lines1[i + k])))
+                right.append(row("right", "unchanged", lines2[j + k], escape_html(lines2[j + k])))
+        elif code == "~":
+            _, i, j, left_spans, right_spans = op
+            left.append(row("left", "modified", lines1[i], mark_spans(lines1[i], left_spans, "diff-del")))
+            right.append(row("right", "modified", lines2[j], mark_spans(lines2[j], right_spans, "diff-add")))
+        elif code in ("-", ">"):
+            start, n = op[1], op[2]
+            for k in range(n):
+                line = lines1[start + k]
+                if code == "-":
+                    left.append(row("left", "deleted", line, mark_spans(line, [[0, len(line)]], "diff-del")))
+                else:
+                    left.append(row("left", "moved", line, mark_spans(line, [[0, len(line)]], "diff-move"), op[3]))
+                right.append(_empty_row())
+        else:
+            start, n = op[1], op[2]
+            for k in range(n):
+                line = lines2[start + k]
+                left.append(_empty_row())
+                if code == "+":
+                    right.append(row("right", "added", line, mark_spans(line, [[0, len(line)]], "diff-add")))
+                else:
+                    right.append(row("right", "moved", line, mark_spans(line, [[0, len(line)]], "diff-move"), op[3]))
+
+    return {"left": left, "right": right}
+
+
+def _empty_row() -> Dict[str, Any]:
+    return {"num": "", "type": "empty", "text": "", "html": ""}
@@ -0,0 +1,62 @@
+"""
+Line Normalization
+Normalization profiles producing per-line match keys (extraction noise from PDF/DOCX is ignored)
+"""
+import re
+from typing import Callable, Dict, List, Sequence
+
+# Typographic variants -> plain ASCII form
+_TYPOGRAPHY = str.maketrans({
+    "«": '"', "»": '"', "„": '"', "“": '"', "”": '"', "‟": '"', "″": '"',
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'", "`": "'",
+    "‐": "-", "‑": "-", "‒": "-", "–": "-", "—": "-", "―": "-", "−": "-",
+    "…": "...",
+})
+
+# Zero-width characters and soft hyphens left by extraction
+_INVISIBLE_RE = re.compile("[­​‌‍⁠﻿]")
+
+# List markers at the start of a line: "1.", "1.2.3", "2)", "(a)", "а)", "IV.", bullets
+_NUMBERING_RE = re.compile(
+    r"^\s*(?:\(?(?:\d+(?:\.\d+)*|[a-zа-яё]|[ivxlc]+)[.)]|\d+(?:\.\d+)+|[•·▪◦●\-*])\s+",
+    re.IGNORECASE
+)
+
+
+def _whitespace(line: str) -> str:
+    # str.split() without arguments also splits on \xa0 and other Unicode spaces
+    return " ".join(_INVISIBLE_RE.sub("", line).split())
+
+
+def _typography(line: str) -> str:
+    return _whitespace(line.translate(_TYPOGRAPHY))
+
+
+def _loose(line: str) -> str:
+    return _NUMBERING_RE.sub("", _typography(line), count=1).casefold()
+
+
+# Profile name -> key function; "exact" compares lines as they are
+NORMALIZATION_PROFILES: Dict[str, Callable[[str], str]] = {
+    "exact": lambda line: line,
+    "whitespace": _whitespace,
+    "typography": _typography,
+    "loose": _loose,
+}
+
+
+def line_keys(lines: Sequence[str], profile: str) -> Sequence[str]:
+    """Match key of every line under a profile (the lines themselves for "exact")"""
+    if profile not in NORMALIZATION_PROFILES:
+        raise ValueError(f"Unknown normalization profile: {profile}. Allowed: {list(NORMALIZATION_PROFILES)}")
+    if profile == "exact":
+        return lines
+    normalize = NORMALIZATION_PROFILES[profile]
+    keys: List[str] = []
+    seen: Dict[str, str] = {}
+    for line in lines:
+        key = seen.get(line)
+        if key is None:
+            key = seen[line] = normalize(line)
+        keys.append(key)
+    return keys
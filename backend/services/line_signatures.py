@@ -0,0 +1,159 @@
+"""
+Line Signatures for Similarity Pre-filtering
+Cheap per-line fingerprints that reject dissimilar pairs before SequenceMatcher
+"""
+import difflib
+from typing import Dict, List, Optional
+
+from services.myers_diff import get_opcodes
+from services.sentences import split_sentences
+
+
+# Pairs whose trigram overlap is below this floor are treated as dissimilar.
+# Unlike the length and character bounds this is a heuristic: only heavily
+# character-scrambled short lines can reach ratio >= 0.7 below it.
+TRIGRAM_FLOOR = 0.2
+
+# Lines longer than this (typically whole DOCX paragraphs) are compared sentence by sentence
+LONG_LINE_CHARS = 400
+
+
+class LineSignature:
+    """Length, character histogram and bag of trigrams for one line"""
+
+    __slots__ = ("length", "chars", "trigrams", "trigram_total")
+
+    def __init__(self, text: str):
+        self.length = len(text)
+
+        chars: Dict[str, int] = {}
+        for ch in text:
+            chars[ch] = chars.get(ch, 0) + 1
+        self.chars = chars
+
+        # Padding gives short lines (and line edges) trigrams of their own
+        padded = f"  {text} "
+        trigrams: Dict[str, int] = {}
+        for i in range(len(padded) - 2):
+            gram = padded[i:i + 3]
+            trigrams[gram] = trigrams.get(gram, 0) + 1
+        self.trigrams = trigrams
+        self.trigram_total = len(padded) - 2
+
+
+class LineSignatures:
+    """Lazily computed signatures for a list of lines.
+
+    A signature is built the first time a line takes part in a fuzzy comparison,
+    so lines that are matched exactly (anchors) never pay for it.
+    """
+
+    def __init__(self, lines: List[str]):
+        self.lines = lines
+        self._signatures: List[Optional[LineSignature]] = [None] * len(lines)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __getitem__(self, idx: int) -> LineSignature:
+        sig = self._signatures[idx]
+        if sig is None:
+            sig = LineSignature(self.lines[idx])
+            self._signatures[idx] = sig
+        return sig
+
+
+def _overlap(small: Dict[str, int], large: Dict[str, int]) -> int:
+    """Size of the multiset intersection of two histograms"""
+    if len(small) > len(large):
+        small, large = large, small
+    total = 0
+    for key, count in small.items():
+        other = large.get(key)
+        if other:
+            total += count if count < other else other
+    return total
+
+
+def may_reach(sig1: LineSignature, sig2: LineSignature, threshold: float) -> bool:
+    """Check whether a pair can possibly reach the similarity threshold.
+
+    Filters from cheapest to most expensive:
+    1. Length bound - SequenceMatcher.real_quick_ratio()
+    2. Character histogram bound - SequenceMatcher.quick_ratio()
+    3. Trigram Dice coefficient against TRIGRAM_FLOOR
+    """
+    total = sig1.length + sig2.length
+    if total == 0:
+        return True
+
+    if 2.0 * min(sig1.length, sig2.length) / total < threshold:
+        return False
+
+    if 2.0 * _overlap(sig1.chars, sig2.chars) / total < threshold:
+        return False
+
+    return passes_trigram_floor(sig1, sig2)
+
+
+def trigram_similarity(sig1: LineSignature, sig2: LineSignature) -> float:
+    """Trigram Dice coefficient - a bounded-cost estimate of the similarity ratio"""
+    return 2.0 * _overlap(sig1.trigrams, sig2.trigrams) / (sig1.trigram_total + sig2.trigram_total)
+
+
+def passes_trigram_floor(sig1: LineSignature, sig2: LineSignature) -> bool:
+    """Trigram Dice coefficient of the pair reaches TRIGRAM_FLOOR"""
+    shared = _overlap(sig1.trigrams, sig2.trigrams)
+    return 2.0 * shared >= TRIGRAM_FLOOR * (sig1.trigram_total + sig2.trigram_total)
+
+
+def similarity(text1: str, text2: str, threshold: float,
+               sig1: Optional[LineSignature] = None,
+               sig2: Optional[LineSignature] = None, exact: bool = False) -> float:
+    """line_ratio() for pairs that survive pre-filtering, 0.0 otherwise.
+
+    exact uses SequenceMatcher.ratio() for long lines too, instead of the
+    sentence-level estimate (for decisions that must not shift with it).
+    """
+    if text1 == text2:
+        return 1.0
+    if sig1 is None:
+        sig1 = LineSignature(text1)
+    if sig2 is None:
+        sig2 = LineSignature(text2)
+    if not may_reach(sig1, sig2, threshold):
+        return 0.0
+    if exact:
+        return difflib.SequenceMatcher(None, text1, text2).ratio()
+    return line_ratio(text1, text2)
+
+
+def line_ratio(text1: str, text2: str) -> float:
+    """SequenceMatcher ratio for ordinary lines, sentence-level estimate for long ones"""
+    if len(text1) <= LONG_LINE_CHARS and len(text2) <= LONG_LINE_CHARS:
+        return difflib.SequenceMatcher(None, text1, text2).ratio()
+    return sentence_ratio(text1, text2)
+
+
+def sentence_ratio(text1: str, text2: str) -> float:
+    """Similarity of two paragraphs on the ratio() scale, computed over sentences.
+
+    Sentences are aligned first; equal ones count in full and replaced ones
+    are paired in order and contribute their trigram similarity, so the cost
+    stays linear in the paragraph length.
+    """
+    total = len(text1) + len(text2)
+    if total == 0:
+        return 1.0
+    sentences1 = split_sentences(text1)
+    sentences2 = split_sentences(text2)
+
+    matched = 0.0
+    for tag, i1, i2, j1, j2 in get_opcodes(sentences1, sentences2):
+        if tag == 'equal':
+            matched += sum(len(sentence) for sentence in sentences1[i1:i2])
+        elif tag == 'replace':
+            for sentence1, sentence2 in zip(sentences1[i1:i2], sentences2[j1:j2]):
+                pair_size = (len(sentence1) + len(sentence2)) / 2
+                matched += trigram_similarity(LineSignature(sentence1), LineSignature(sentence2)) * pair_size
+    return min(1.0, 2.0 * matched / total)
@@ -2,20 +2,53 @@
 Enterprise Multi-Way Document Merge Engine
 Supports 2-way, 3-way, and N-way merges with conflict detection
 """
-import difflib
 import re
-from typing import List, Dict, Any, Optional, Tuple
-from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+from config import settings
+from services import line_signatures
+from services.diff3 import merge_regions
+from services.myers_diff import get_opcodes
+
+# Slot of an unresolved conflict inside merged_content
+CONFLICT_MARKER_RE = re.compile(r"<<<CONFLICT_(\d+)>>>")
+# Variant contents that stand for "no text"
+EMPTY_VARIANTS = ("(deleted)", "(absent)")
+
+
+def conflict_marker(index: int) -> str:
+    return f"<<<CONFLICT_{index}>>>"
+
+
+def split_segments(merged_content: str) -> List[Union[str, int]]:
+    """merged_content as literal text segments and conflict slots (conflict indices), in order"""
+    parts = CONFLICT_MARKER_RE.split(merged_content or "")
+    # re.split with one group alternates literal text and captured indices
+    return [int(part) if k % 2 else part for k, part in enumerate(parts)]
+
+
+def render_segments(segments: List[Union[str, int]], choices: Dict[int, str]) -> str:
+    """Join segments, filling conflict slots from choices (unchosen slots keep their marker)"""
+    return "".join(
+        choices.get(segment, conflict_marker(segment)) if isinstance(segment, int) else segment
+        for segment in segments
+    )
 
 
 class MergeEngine:
     """Enterprise-grade multi-way document merge engine"""
     
-    def __init__(self):
+    # Two-way merges take the second version of a replaced hunk above this similarity
+    AUTO_RESOLVE_SIMILARITY = 0.85
+    
+    def __init__(self, algorithm: Optional[str] = None):
         self.similarity_threshold = 0.6
+        # Line opcode generator: "myers" or "difflib" (SequenceMatcher without autojunk)
+        self.algorithm = algorithm or settings.DIFF_ALGORITHM
     
     def merge(self, documents: List[Dict[str, Any]], strategy: str = "CONSENSUS", 
-              base_version_id: Optional[str] = None) -> Dict[str, Any]:
+              base_version_id: Optional[str] = None,
+              alignments: Optional[List[List[List[int]]]] = None) -> Dict[str, Any]:
         """
         Merge multiple documents
         
@@ -23,6 +56,8 @@ class MergeEngine:
             documents: List of {"id": str, "content": str, "name": str}
             strategy: CONSENSUS, MOST_RECENT, or MANUAL
             base_version_id: Optional base version for 3-way merge
+            alignments: N-way merge only - matching blocks of every document
+                against the base (see alignment_plan), computed in advance
             
         Returns:
             {
@@ -40,19 +75,42 @@ class MergeEngine:
                 "merge_stats": {"total_blocks": 0, "unchanged": 0, "merged": 0}
             }
         
-        # Find base if specified
-        base_doc = None
-        if base_version_id:
-            base_doc = next((d for d in documents if d["id"] == base_version_id), None)
-            if base_doc:
-                documents = [d for d in documents if d["id"] != base_version_id]
+        base_doc, documents = self._split_base(documents, base_version_id)
         
         if len(documents) == 2 and base_doc:
             return self._three_way_merge(base_doc, documents[0], documents[1], strategy)
         elif len(documents) == 2:
             return self._two_way_merge(documents[0], documents[1], strategy)
         else:
-            return self._multi_way_merge(documents, strategy, base_doc)
+            return self._multi_way_merge(documents, strategy, base_doc, alignments)
+    
+    def alignment_plan(self, documents: List[Dict[str, Any]],
+                       base_version_id: Optional[str] = None) -> Optional[Tuple[str, List[str]]]:
+        """(base text, document texts) whose pairwise alignments an N-way merge needs, else None.
+        
+        Each document is aligned to the base independently, so callers can run
+        the services.diff3.side_blocks calls concurrently and pass the results
+        to merge() as alignments.
+        """
+        if len(documents) < 2:
+            return None
+        base_doc, documents = self._split_base(documents, base_version_id)
+        if len(documents) <= 2:
+            return None
+        if base_doc is None:
+            # Same choice as _multi_way_base: the first document with the most lines
+            base_doc = max(documents, key=lambda doc: len(self._split_into_blocks(doc["content"])))
+        return base_doc["content"], [doc["content"] for doc in documents]
+    
+    def _split_base(self, documents: List[Dict[str, Any]],
+                    base_version_id: Optional[str]) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Find base if specified: (base document or None, the other documents)"""
+        base_doc = None
+        if base_version_id:
+            base_doc = next((d for d in documents if d["id"] == base_version_id), None)
+            if base_doc:
+                documents = [d for d in documents if d["id"] != base_version_id]
+        return base_doc, documents
     
     def _two_way_merge(self, doc1: Dict, doc2: Dict, strategy: str = "MOST_RECENT") -> Dict[str, Any]:
         """Two-way merge with intelligent conflict detection"""
@@ -67,17 +125,17 @@ class MergeEngine:
         # In MANUAL mode, no auto-resolution - user decides everything
         allow_auto_resolve = (strategy != "MANUAL")
         
-        matcher = difflib.SequenceMatcher(None, lines1, lines2, autojunk=False)
+        opcodes = get_opcodes(lines1, lines2, self.algorithm, autojunk=False)
         
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for tag, i1, i2, j1, j2 in opcodes:
             if tag == 'equal':
                 merged_lines.extend(lines1[i1:i2])
             elif tag == 'replace':
                 old_text = "\n".join(lines1[i1:i2])
                 new_text = "\n".join(lines2[j1:j2])
-                similarity = self._calculate_similarity(old_text, new_text)
+                similarity = self._calculate_similarity(old_text, new_text, self.AUTO_RESOLVE_SIMILARITY)
                 
-                if allow_auto_resolve and similarity > 0.85:
+                if allow_auto_resolve and similarity > self.AUTO_RESOLVE_SIMILARITY:
                     merged_lines.extend(lines2[j1:j2])
                     auto_resolved += 1
                 else:
@@ -93,7 +151,7 @@ class MergeEngine:
                         "consensus_variant": None,
                         "analysis": self._analyze_conflict(old_text, new_text)
                     })
-                    merged_lines.append(f"<<<CONFLICT_{conflict_idx}>>>")
+                    merged_lines.append(conflict_marker(conflict_idx))
                     conflict_idx += 1
                     
             elif tag == 'delete':
@@ -111,7 +169,7 @@ class MergeEngine:
                         "consensus_variant": None,
                         "analysis": {"type": "deletion", "significance": "high"}
                     })
-                    merged_lines.append(f"<<<CONFLICT_{conflict_idx}>>>")
+                    merged_lines.append(conflict_marker(conflict_idx))
                     conflict_idx += 1
                 elif allow_auto_resolve:
                     auto_resolved += 1
@@ -148,7 +206,7 @@ class MergeEngine:
                             "consensus_variant": None,
                             "analysis": {"type": "addition", "significance": "medium"}
                         })
-                        merged_lines.append(f"<<<CONFLICT_{conflict_idx}>>>")
+                        merged_lines.append(conflict_marker(conflict_idx))
                         conflict_idx += 1
                 else:
                     merged_lines.extend(lines2[j1:j2])
@@ -161,107 +219,64 @@ class MergeEngine:
             "auto_resolved": auto_resolved,
             "merge_stats": {
                 "total_blocks": len(lines1) + len(lines2),
-                "unchanged": sum(1 for tag, *_ in matcher.get_opcodes() if tag == 'equal'),
+                "unchanged": sum(1 for tag, *_ in opcodes if tag == 'equal'),
                 "merged": auto_resolved,
                 "conflicts": len(conflicts)
             }
         }
     
     def _three_way_merge(self, base: Dict, doc1: Dict, doc2: Dict, strategy: str = "MOST_RECENT") -> Dict[str, Any]:
-        """Three-way merge using common ancestor"""
+        """Three-way merge using common ancestor (diff3 hunks, see services.diff3)
+        
+        Edits on one side only are taken over, identical edits on both sides
+        once; overlapping different edits become one conflict per hunk.
+        MANUAL mode turns every changed hunk into a conflict.
+        """
         base_lines = self._split_into_blocks(base["content"])
         lines1 = self._split_into_blocks(doc1["content"])
         lines2 = self._split_into_blocks(doc2["content"])
         
         merged_lines = []
         conflicts = []
-        conflict_idx = 0
         auto_resolved = 0
+        unchanged = 0
         
         # In MANUAL mode, no auto-resolution
         allow_auto_resolve = (strategy != "MANUAL")
         
-        matcher1 = difflib.SequenceMatcher(None, base_lines, lines1, autojunk=False)
-        matcher2 = difflib.SequenceMatcher(None, base_lines, lines2, autojunk=False)
-        
-        changes1 = self._extract_changes(matcher1.get_opcodes(), base_lines, lines1)
-        changes2 = self._extract_changes(matcher2.get_opcodes(), base_lines, lines2)
-        
-        i = 0
-        while i < len(base_lines):
-            change1 = changes1.get(i)
-            change2 = changes2.get(i)
+        for region in merge_regions(base_lines, [lines1, lines2], self.algorithm):
+            (a1, a2), (b1, b2) = region.sides
+            if region.stable:
+                merged_lines.extend(base_lines[region.o1:region.o2])
+                unchanged += region.o2 - region.o1
+                continue
             
-            if not change1 and not change2:
-                merged_lines.append(base_lines[i])
-                i += 1
-            elif change1 and not change2:
-                if allow_auto_resolve:
-                    if change1["type"] == "delete":
-                        i += change1["length"]
-                    else:
-                        merged_lines.append(change1["content"])
-                        i += 1
-                    auto_resolved += 1
-                else:
-                    # MANUAL: create conflict
-                    conflicts.append({
-                        "index": conflict_idx,
-                        "location": f"line {i+1}",
-                        "type": "THREE_WAY",
-                        "variants": [
-                            {"source": "Base", "content": base_lines[i], "line_count": 1},
-                            {"source": doc1["name"], "content": change1.get("content", ""), "line_count": 1}
-                        ],
-                        "consensus_variant": None
-                    })
-                    merged_lines.append(f"<<<CONFLICT_{conflict_idx}>>>")
-                    conflict_idx += 1
-                    i += 1
-            elif change2 and not change1:
-                if allow_auto_resolve:
-                    if change2["type"] == "delete":
-                        i += change2["length"]
-                    else:
-                        merged_lines.append(change2["content"])
-                        i += 1
-                    auto_resolved += 1
-                else:
-                    # MANUAL: create conflict
-                    conflicts.append({
-                        "index": conflict_idx,
-                        "location": f"line {i+1}",
-                        "type": "THREE_WAY",
-                        "variants": [
-                            {"source": "Base", "content": base_lines[i], "line_count": 1},
-                            {"source": doc2["name"], "content": change2.get("content", ""), "line_count": 1}
-                        ],
-                        "consensus_variant": None
-                    })
-                    merged_lines.append(f"<<<CONFLICT_{conflict_idx}>>>")
-                    conflict_idx += 1
-                    i += 1
-            else:
-                if allow_auto_resolve and change1["content"] == change2["content"]:
-                    merged_lines.append(change1["content"])
-                    auto_resolved += 1
-                else:
-                    conflicts.append({
-                        "index": conflict_idx,
-                        "location": f"line {i+1}",
-                        "type": "THREE_WAY",
-                        "variants": [
-                            {"source": "Base", "content": base_lines[i], "line_count": 1},
-                            {"source": doc1["name"], "content": change1["content"], "line_count": 1},
-                            {"source": doc2["name"], "content": change2["content"], "line_count": 1}
-                        ],
-                        "similarity": self._calculate_similarity(change1["content"], change2["content"]),
-                        "consensus_variant": None,
-                        "analysis": self._analyze_conflict(change1["content"], change2["content"])
-                    })
-                    merged_lines.append(f"<<<CONFLICT_{conflict_idx}>>>")
-                    conflict_idx += 1
-                i += 1
+            base_part = base_lines[region.o1:region.o2]
+            part1, part2 = lines1[a1:a2], lines2[b1:b2]
+            changed1, changed2 = part1 != base_part, part2 != base_part
+            if allow_auto_resolve and (not changed1 or not changed2 or part1 == part2):
+                merged_lines.extend(part1 if changed1 else part2)
+                auto_resolved += 1
+                continue
+            
+            variants = [self._hunk_variant("Base", base_part, "(absent)")]
+            if changed1:
+                variants.append(self._hunk_variant(doc1["name"], part1, "(deleted)"))
+            if changed2:
+                variants.append(self._hunk_variant(doc2["name"], part2, "(deleted)"))
+            conflict = {
+                "index": len(conflicts),
+                "location": self._hunk_location(region.o1, region.o2),
+                "type": "THREE_WAY",
+                "variants": variants,
+                "consensus_variant": None
+            }
+            if changed1 and changed2:
+                text1, text2 = "\n".join(part1), "\n".join(part2)
+                conflict["similarity"] = self._calculate_similarity(text1, text2)
+                conflict["analysis"] = self._analyze_conflict(text1, text2)
+            conflicts.append(conflict)
+            merged_lines.append(conflict_marker(conflict["index"]))
         
         return {
             "merged_content": "\n".join(merged_lines),
@@ -269,104 +284,142 @@ class MergeEngine:
             "auto_resolved": auto_resolved,
             "merge_stats": {
                 "total_blocks": len(base_lines),
-                "unchanged": len(base_lines) - len(changes1) - len(changes2),
+                "unchanged": unchanged,
                 "merged": auto_resolved,
                 "conflicts": len(conflicts)
             }
         }
     
+    def _hunk_location(self, o1: int, o2: int) -> str:
+        """Human-readable base range of a hunk"""
+        if o2 == o1:
+            return f"after line {o1}"
+        if o2 == o1 + 1:
+            return f"line {o2}"
+        return f"lines {o1 + 1}-{o2}"
+    
+    def _hunk_variant(self, source: str, lines: List[str], empty: str) -> Dict[str, Any]:
+        """Conflict variant for a hunk; an empty hunk is shown as the given placeholder"""
+        return {"source": source, "content": "\n".join(lines) if lines else empty, "line_count": len(lines)}
+    
     def _multi_way_merge(self, documents: List[Dict], strategy: str, 
-                         base_doc: Optional[Dict] = None) -> Dict[str, Any]:
-        """Multi-way merge - MOST_RECENT auto-resolves, MANUAL requires user decision"""
-        all_lines = [self._split_into_blocks(doc["content"]) for doc in documents]
+                         base_doc: Optional[Dict] = None,
+                         alignments: Optional[List[List[List[int]]]] = None) -> Dict[str, Any]:
+        """Multi-way merge over hunks aligned to a common base (services.diff3)
         
-        if base_doc:
-            base_lines = self._split_into_blocks(base_doc["content"])
-        else:
-            base_idx = max(range(len(all_lines)), key=lambda i: len(all_lines[i]))
-            base_lines = all_lines[base_idx]
+        Every document is aligned to the base (the given base document, else
+        the longest document), so an insertion in one document no longer
+        shifts the others. Hunks where the documents disagree are resolved by
+        strategy: MOST_RECENT takes the last document, CONSENSUS the variant
+        of a strict majority of documents; the rest become one conflict per
+        hunk with a vote count per variant. With a base document an edit made
+        in one variant only is taken over as in a three-way merge (except in
+        MANUAL mode).
+        """
+        all_lines = [self._split_into_blocks(doc["content"]) for doc in documents]
+        base_lines = self._multi_way_base(all_lines, base_doc)
         
         merged_lines = []
         conflicts = []
-        conflict_idx = 0
         auto_resolved = 0
+        unchanged = 0
         
-        max_lines = max(len(lines) for lines in all_lines)
-        
-        for line_num in range(max_lines):
-            variants = {}
-            for i, lines in enumerate(all_lines):
-                if line_num < len(lines):
-                    line = lines[line_num]
-                    if line not in variants:
-                        variants[line] = []
-                    variants[line].append(i)
+        for region in merge_regions(base_lines, all_lines, self.algorithm, alignments):
+            if region.stable:
+                merged_lines.extend(base_lines[region.o1:region.o2])
+                unchanged += region.o2 - region.o1
+                continue
+            
+            # Distinct variants of the hunk -> indices of the documents voting for them
+            base_part = base_lines[region.o1:region.o2]
+            parts = [all_lines[k][start:end] for k, (start, end) in enumerate(region.sides)]
+            variants: Dict[Tuple[str, ...], List[int]] = {}
+            for k, part in enumerate(parts):
+                variants.setdefault(tuple(part), []).append(k)
             
             if len(variants) == 1:
                 # All documents agree - no conflict
-                merged_lines.append(list(variants.keys())[0])
+                merged_lines.extend(parts[0])
+                continue
+            
+            chosen = None
+            changed = [variant for variant in variants if list(variant) != base_part]
+            if strategy == "MANUAL":
+                pass
+            elif base_doc and len(changed) == 1:
+                chosen = changed[0]
             elif strategy == "MOST_RECENT":
                 # Auto-resolve: use most recent document's version
-                last_doc_lines = all_lines[-1]
-                if line_num < len(last_doc_lines):
-                    merged_lines.append(last_doc_lines[line_num])
-                else:
-                    merged_lines.append(base_lines[line_num] if line_num < len(base_lines) else "")
+                chosen = tuple(parts[-1])
+            elif strategy == "CONSENSUS":
+                leader = max(variants, key=lambda variant: len(variants[variant]))
+                if 2 * len(variants[leader]) > len(documents):
+                    chosen = leader
+            
+            if chosen is not None:
+                merged_lines.extend(chosen)
                 auto_resolved += 1
-                
-            else:
-                # MANUAL mode: user must decide every difference
-                conflicts.append({
-                    "index": conflict_idx,
-                    "location": f"line {line_num + 1}",
-                    "type": "MANUAL",
-                    "variants": [
-                        {
-                            "source": documents[indices[0]]["name"],
-                            "content": line,
-                            "line_count": 1
-                        }
-                        for line, indices in variants.items()
-                    ],
-                    "consensus_variant": None,
-                    "analysis": {"type": "manual_review_required"}
-                })
-                merged_lines.append(f"<<<CONFLICT_{conflict_idx}>>>")
-                conflict_idx += 1
+                continue
+            
+            empty = "(deleted)" if base_part else "(absent)"
+            conflict = {
+                "index": len(conflicts),
+                "location": self._hunk_location(region.o1, region.o2),
+                "type": "MANUAL",
+                "variants": [
+                    dict(self._hunk_variant(documents[indices[0]]["name"], list(variant), empty),
+                         votes=len(indices))
+                    for variant, indices in variants.items()
+                ],
+                "consensus_variant": None,
+                "analysis": {"type": "manual_review_required"}
+            }
+            conflicts.append(conflict)
+            merged_lines.append(conflict_marker(conflict["index"]))
         
         return {
             "merged_content": "\n".join(merged_lines),
             "conflicts": conflicts,
             "auto_resolved": auto_resolved,
             "merge_stats": {
-                "total_blocks": max_lines,
+                "total_blocks": len(base_lines),
                 "documents_count": len(documents),
+                "unchanged": unchanged,
                 "merged": auto_resolved,
                 "conflicts": len(conflicts)
             }
         }
     
+    def _multi_way_base(self, all_lines: List[List[str]], base_doc: Optional[Dict]) -> List[str]:
+        """Lines every document is aligned to: the base document, else the longest document"""
+        if base_doc:
+            return self._split_into_blocks(base_doc["content"])
+        return max(all_lines, key=len)
+    
     def apply_resolutions(self, merged_content: str, conflicts: List[Dict], 
                           resolutions: List[Dict]) -> str:
-        """Apply conflict resolutions to merged content"""
-        result = merged_content
+        """Apply conflict resolutions to merged content in one pass over the text
         
+        Later resolutions of the same conflict win; conflicts without a valid
+        resolution keep their marker.
+        """
+        by_index = {conflict["index"]: conflict for conflict in conflicts}
+        choices = {}
         for resolution in resolutions:
-            conflict_idx = resolution["conflict_index"]
-            chosen_variant = resolution["chosen_variant_index"]
-            
-            conflict = next((c for c in conflicts if c["index"] == conflict_idx), None)
-            if conflict and chosen_variant < len(conflict["variants"]):
-                replacement = conflict["variants"][chosen_variant]["content"]
-                if replacement in ["(deleted)", "(absent)"]:
-                    replacement = ""
-                result = result.replace(f"<<<CONFLICT_{conflict_idx}>>>", replacement)
-        
-        return result
+            conflict = by_index.get(resolution["conflict_index"])
+            if conflict and resolution["chosen_variant_index"] < len(conflict["variants"]):
+                choices[conflict["index"]] = self.variant_text(conflict, resolution["chosen_variant_index"])
+        return render_segments(split_segments(merged_content), choices)
+    
+    def variant_text(self, conflict: Dict, variant_index: int) -> str:
+        """Text a conflict slot takes when the variant is chosen"""
+        content = conflict["variants"][variant_index].get("content", "")
+        return "" if content in EMPTY_VARIANTS else content
     
-    def preview_merge(self, documents: List[Dict], strategy: str) -> Dict[str, Any]:
-        """Preview merge without saving"""
-        result = self.merge(documents, strategy)
+    def preview_merge(self, documents: List[Dict], strategy: str, base_version_id: Optional[str] = None,
+                      alignments: Optional[List[List[List[int]]]] = None) -> Dict[str, Any]:
+        """Preview merge without saving (the full merge result plus preview fields)"""
+        result = self.merge(documents, strategy, base_version_id, alignments)
         
         result["preview"] = True
         result["estimated_conflicts"] = len(result["conflicts"])
@@ -381,11 +434,20 @@ class MergeEngine:
             return []
         return text.splitlines()
     
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
-        """Calculate similarity ratio between two texts"""
+    def _calculate_similarity(self, text1: str, text2: str, threshold: Optional[float] = None) -> float:
+        """Calculate similarity ratio between two texts.
+        
+        With a threshold, pairs that cannot reach it are rejected by the line
+        signature filters and reported as 0.0 without running SequenceMatcher;
+        use it only where the result is compared against that threshold. The
+        compared value is the exact ratio; without a threshold long paragraphs
+        get the sentence-level estimate (line_signatures.line_ratio).
+        """
         if not text1 or not text2:
             return 0.0
-        return difflib.SequenceMatcher(None, text1.lower(), text2.lower()).ratio()
+        if threshold is not None:
+            return line_signatures.similarity(text1.lower(), text2.lower(), threshold, exact=True)
+        return line_signatures.line_ratio(text1.lower(), text2.lower())
     
     def _is_significant_content(self, text: str) -> bool:
         """Check if content is significant"""
@@ -417,23 +479,6 @@ class MergeEngine:
         
         return analysis
     
-    def _extract_changes(self, opcodes: List, base: List[str], modified: List[str]) -> Dict[int, Dict]:
-        """Extract changes from opcodes for 3-way merge"""
-        changes = {}
-        for tag, i1, i2, j1, j2 in opcodes:
-            if tag == 'replace':
-                for idx in range(i1, i2):
-                    offset = idx - i1
-                    if j1 + offset < j2:
-                        changes[idx] = {"type": "replace", "content": modified[j1 + offset], "length": 1}
-            elif tag == 'delete':
-                for idx in range(i1, i2):
-                    changes[idx] = {"type": "delete", "content": "", "length": i2 - i1}
-            elif tag == 'insert':
-                if i1 > 0:
-                    changes[i1 - 1] = {"type": "insert", "content": "\n".join(modified[j1:j2]), "length": j2 - j1}
-        return changes
-    
     def _get_merge_recommendation(self, result: Dict) -> str:
         """Get merge recommendation based on analysis"""
         conflicts = result["conflicts"]
@@ -0,0 +1,65 @@
+"""
+Merge Preview Cache
+Short-lived in-process cache of merge previews, promoted by the create-merge call that follows
+"""
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from services.comparison_cache import text_hash
+
+
+class MergePreviewCache:
+    """Full merge results of recent previews keyed by source content hashes.
+
+    The UI previews a merge and then creates it with the same documents
+    and strategy; create_merge looks the result up here instead of merging
+    again. Entries expire after ttl seconds, so a preview never outlives
+    the user's decision by much, and any edit of a source text changes the
+    key. Results are deep-copied on the way in and out.
+    """
+
+    def __init__(self, ttl: float = settings.MERGE_PREVIEW_TTL,
+                 capacity: int = settings.MERGE_PREVIEW_CACHE_SIZE):
+        self.ttl = ttl
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_key(self, documents: List[Dict[str, Any]], strategy: str,
+                 base_version_id: Optional[str] = None) -> str:
+        """Key from every source (id, name and text hash, in order), the strategy and the base id"""
+        payload = json.dumps({
+            "documents": [[doc["id"], doc.get("name"), text_hash(doc.get("content") or "")] for doc in documents],
+            "strategy": strategy,
+            "base": base_version_id,
+        }, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached merge result or None (expired entries are dropped)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            return copy.deepcopy(result)
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        stored = copy.deepcopy(result)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+merge_preview_cache = MergePreviewCache()
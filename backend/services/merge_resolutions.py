@@ -0,0 +1,108 @@
+"""
+Merge Resolutions
+Per-conflict resolution rows and incremental counters of merges
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.comparison import DocumentMerge, MergeConflictState, MergeProgress
+
+
+class MergeResolutions:
+    """Resolution state of merge conflicts, one indexed row per conflict.
+
+    Resolving a conflict updates its row by primary key (merge_id,
+    conflict_index) and adjusts the merge's counters in SQL, so a click
+    costs the same for 5 or 500 conflicts; neither the conflict list nor
+    earlier resolutions are loaded. A row counts as newly resolved only
+    for the UPDATE that moves it from unresolved, so concurrent
+    resolutions of one conflict (e.g. from two workers) count it once.
+    Merges created before the table existed get their rows from the JSON
+    columns on first access.
+    """
+
+    def create(self, db: Session, merge_id: str, conflicts: List[Dict[str, Any]]) -> MergeProgress:
+        """Rows and counters for a new merge (added to the session, not committed)"""
+        db.add_all(MergeConflictState(
+            merge_id=merge_id,
+            conflict_index=conflict["index"],
+            needs_resolution=conflict.get("consensus_variant") is None
+        ) for conflict in conflicts)
+        progress = MergeProgress(
+            merge_id=merge_id,
+            open_conflicts=sum(1 for conflict in conflicts if conflict.get("consensus_variant") is None),
+            resolved_count=0
+        )
+        db.add(progress)
+        return progress
+
+    def progress(self, db: Session, merge: DocumentMerge) -> MergeProgress:
+        """Counters of a merge (built from the legacy JSON columns if missing)"""
+        progress = db.get(MergeProgress, merge.id)
+        if progress is None:
+            progress = self.create(db, merge.id, merge.conflicts or [])
+            db.flush()
+            self.resolve(db, merge, [
+                (r["conflict_index"], r["chosen_variant_index"]) for r in (merge.resolved_conflicts or [])
+            ], progress)
+        return progress
+
+    def resolve(self, db: Session, merge: DocumentMerge, resolutions: Iterable[Tuple[int, int]],
+                progress: Optional[MergeProgress] = None) -> MergeProgress:
+        """Set (or change) the chosen variant of conflicts; unknown indices are ignored"""
+        progress = progress or self.progress(db, merge)
+        chosen = dict(resolutions)
+        if not chosen:
+            return progress
+        by_variant: Dict[int, List[int]] = {}
+        for conflict_index, variant in chosen.items():
+            by_variant.setdefault(variant, []).append(conflict_index)
+
+        now = datetime.utcnow()
+        newly_resolved = newly_closed = 0
+        for variant, indices in by_variant.items():
+            rows = db.query(MergeConflictState).filter(
+                MergeConflictState.merge_id == merge.id,
+                MergeConflictState.conflict_index.in_(indices)
+            )
+            values = {MergeConflictState.chosen_variant_index: variant, MergeConflictState.resolved_at: now}
+            # Claim unresolved rows with a conditional UPDATE: of concurrent resolutions
+            # of one conflict only the one that changes the row counts it
+            for needs_resolution in (True, False):
+                claimed = rows.filter(
+                    MergeConflictState.chosen_variant_index.is_(None),
+                    MergeConflictState.needs_resolution == needs_resolution
+                ).update(values, synchronize_session=False)
+                newly_resolved += claimed
+                newly_closed += claimed if needs_resolution else 0
+            # Already resolved rows only change their variant
+            rows.filter(
+                MergeConflictState.chosen_variant_index.isnot(None),
+                MergeConflictState.chosen_variant_index != variant
+            ).update(values, synchronize_session=False)
+
+        if newly_resolved:
+            db.query(MergeProgress).filter(MergeProgress.merge_id == merge.id).update({
+                MergeProgress.resolved_count: MergeProgress.resolved_count + newly_resolved,
+                MergeProgress.open_conflicts: MergeProgress.open_conflicts - newly_closed
+            }, synchronize_session=False)
+        db.flush()
+        db.refresh(progress)
+        return progress
+
+    def resolutions(self, db: Session, merge: DocumentMerge) -> List[Dict[str, int]]:
+        """Chosen variants as [{"conflict_index", "chosen_variant_index"}], in conflict order"""
+        self.progress(db, merge)
+        rows = db.query(MergeConflictState.conflict_index, MergeConflictState.chosen_variant_index).filter(
+            MergeConflictState.merge_id == merge.id,
+            MergeConflictState.chosen_variant_index.isnot(None)
+        ).order_by(MergeConflictState.conflict_index).all()
+        return [
+            {"conflict_index": conflict_index, "chosen_variant_index": chosen_variant_index}
+            for conflict_index, chosen_variant_index in rows
+        ]
+
+
+merge_resolutions = MergeResolutions()
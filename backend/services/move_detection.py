@@ -0,0 +1,135 @@
+"""
+Moved Block Detection
+Rabin-Karp over normalized line windows to find relocated text blocks
+"""
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from services import line_signatures
+
+
+# Seed size in non-blank lines and the smallest block worth reporting
+MOVE_WINDOW = 2
+MOVE_MIN_CHARS = 40
+# Lines inside a block may differ slightly (near-exact moves)
+NEAR_EXACT_THRESHOLD = 0.9
+
+_MODULUS = (1 << 61) - 1
+_BASE = 1_000_003
+
+
+class MovedBlock(NamedTuple):
+    """Lines [i1, i2) of the first document reappear as [j1, j2) in the second"""
+    i1: int
+    i2: int
+    j1: int
+    j2: int
+    exact: bool
+
+
+def normalize_line(line: str) -> str:
+    """Case- and whitespace-insensitive form of a line used for move hashing"""
+    return " ".join(line.lower().split()).rstrip(" .;,")
+
+
+def find_moved_blocks(lines1: Sequence[str], lines2: Sequence[str],
+                      opcodes: List[Tuple[str, int, int, int, int]],
+                      window: int = MOVE_WINDOW, min_chars: int = MOVE_MIN_CHARS,
+                      threshold: float = NEAR_EXACT_THRESHOLD) -> List[MovedBlock]:
+    """Find blocks deleted in one place and inserted in another.
+
+    Only lines that the line diff already reports as removed (side 1) or
+    inserted (side 2) take part. Windows of `window` consecutive non-blank
+    normalized lines are hashed with a rolling polynomial hash; a hit that
+    verifies is extended while the neighbouring lines stay near-equal.
+    Returns blocks ordered by their position in the first document.
+    """
+    ops1, runs1 = _changed_runs(lines1, opcodes, side=1)
+    ops2, runs2 = _changed_runs(lines2, opcodes, side=2)
+    if not runs1 or not runs2:
+        return []
+
+    norm1 = {i: normalize_line(lines1[i]) for run in runs1 for i in run}
+    norm2 = {j: normalize_line(lines2[j]) for run in runs2 for j in run}
+
+    table: Dict[int, List[Tuple[int, int]]] = {}
+    for r, run in enumerate(runs1):
+        for pos, h in _rolling_hashes([norm1[i] for i in run], window):
+            table.setdefault(h, []).append((r, pos))
+
+    used1 = [bytearray(len(run)) for run in runs1]
+    blocks: List[MovedBlock] = []
+
+    for op2, run2 in zip(ops2, runs2):
+        keys2 = [norm2[j] for j in run2]
+        used2 = bytearray(len(run2))
+        for pos2, h in _rolling_hashes(keys2, window):
+            if any(used2[pos2:pos2 + window]):
+                continue
+            for r, pos1 in table.get(h, ()):
+                run1 = runs1[r]
+                if ops1[r] == op2 or any(used1[r][pos1:pos1 + window]):
+                    continue  # same hunk: an in-place edit, not a move
+                if any(norm1[run1[pos1 + k]] != keys2[pos2 + k] for k in range(window)):
+                    continue  # hash collision
+
+                # Grow the verified seed in both directions over near-equal lines
+                size = window
+                while (pos1 + size < len(run1) and pos2 + size < len(run2)
+                       and not used1[r][pos1 + size] and not used2[pos2 + size]
+                       and _near_equal(norm1[run1[pos1 + size]], keys2[pos2 + size], threshold)):
+                    size += 1
+                while (pos1 > 0 and pos2 > 0 and not used1[r][pos1 - 1] and not used2[pos2 - 1]
+                       and _near_equal(norm1[run1[pos1 - 1]], keys2[pos2 - 1], threshold)):
+                    pos1 -= 1
+                    pos2 -= 1
+                    size += 1
+
+                i1, i2 = run1[pos1], run1[pos1 + size - 1] + 1
+                j1, j2 = run2[pos2], run2[pos2 + size - 1] + 1
+                if sum(len(norm1[run1[pos1 + k]]) for k in range(size)) < min_chars:
+                    continue
+
+                used1[r][pos1:pos1 + size] = b"\x01" * size
+                used2[pos2:pos2 + size] = b"\x01" * size
+                exact = list(lines1[i1:i2]) == list(lines2[j1:j2])
+                blocks.append(MovedBlock(i1, i2, j1, j2, exact))
+                break
+
+    blocks.sort()
+    return blocks
+
+
+def _changed_runs(lines: Sequence[str], opcodes: List[Tuple[str, int, int, int, int]],
+                  side: int) -> Tuple[List[int], List[List[int]]]:
+    """Indices of non-blank removed (side 1) or inserted (side 2) lines, one list per opcode"""
+    ops, runs = [], []
+    for op, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == 'equal' or (side == 1 and tag == 'insert') or (side == 2 and tag == 'delete'):
+            continue
+        lo, hi = (i1, i2) if side == 1 else (j1, j2)
+        run = [idx for idx in range(lo, hi) if lines[idx].strip()]
+        if run:
+            ops.append(op)
+            runs.append(run)
+    return ops, runs
+
+
+def _rolling_hashes(keys: List[str], window: int):
+    """Yield (start, hash) for every window of consecutive keys"""
+    if len(keys) < window:
+        return
+    values = [hash(key) & _MODULUS for key in keys]
+    top = pow(_BASE, window - 1, _MODULUS)
+    h = 0
+    for k in range(window):
+        h = (h * _BASE + values[k]) % _MODULUS
+    yield 0, h
+    for start in range(1, len(keys) - window + 1):
+        h = ((h - values[start - 1] * top) * _BASE + values[start + window - 1]) % _MODULUS
+        yield start, h
+
+
+def _near_equal(key1: str, key2: str, threshold: float) -> bool:
+    if key1 == key2:
+        return True
+    return line_signatures.similarity(key1, key2, threshold) >= threshold
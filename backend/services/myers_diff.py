@@ -0,0 +1,280 @@
+"""
+Myers O(ND) Line Diff
+Linear-space Myers diff that emits difflib-compatible opcodes
+"""
+import bisect
+import difflib
+import time
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Supported opcode generators: "myers" (default) or "difflib" (SequenceMatcher)
+DIFF_ALGORITHMS = ["myers", "difflib"]
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+def get_opcodes(a: Sequence[Hashable], b: Sequence[Hashable], algorithm: str = "myers",
+                autojunk: bool = True, deadline: Optional[float] = None) -> List[Opcode]:
+    """Opcodes (tag, i1, i2, j1, j2) turning a into b.
+
+    The result has the same shape as difflib.SequenceMatcher.get_opcodes(),
+    so callers can switch algorithms freely. autojunk only affects "difflib",
+    deadline (a time.monotonic() value) only affects "myers".
+    """
+    if algorithm == "difflib":
+        return difflib.SequenceMatcher(None, a, b, autojunk=autojunk).get_opcodes()
+    if algorithm != "myers":
+        raise ValueError(f"Unknown diff algorithm: {algorithm}. Allowed: {DIFF_ALGORITHMS}")
+    return opcodes_from_blocks(myers_matching_blocks(a, b, deadline), len(a), len(b))
+
+
+def myers_matching_blocks(a: Sequence[Hashable], b: Sequence[Hashable],
+                          deadline: Optional[float] = None) -> List[Tuple[int, int, int]]:
+    """Matching blocks (i, j, size) of a shortest edit script, in increasing order.
+
+    Elements are interned to integers first; subproblems are split at the
+    Myers middle snake and processed with an explicit stack. Runtime is
+    O((N + M) * D) where D is the number of differing lines, so typical
+    revisions of long documents cost little more than a linear scan.
+    Once the deadline passes, remaining subproblems only get their common
+    prefix and suffix matched (a valid but longer edit script).
+    """
+    ids: Dict[Hashable, int] = {}
+    a_ids = [ids.setdefault(x, len(ids)) for x in a]
+    b_ids = [ids.setdefault(x, len(ids)) for x in b]
+
+    blocks: List[Tuple[int, int, int]] = []
+    stack = [(0, len(a_ids), 0, len(b_ids))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+
+        # Common prefix and suffix
+        size = 0
+        while alo + size < ahi and blo + size < bhi and a_ids[alo + size] == b_ids[blo + size]:
+            size += 1
+        if size:
+            blocks.append((alo, blo, size))
+            alo += size
+            blo += size
+        size = 0
+        while alo < ahi - size and blo < bhi - size and a_ids[ahi - 1 - size] == b_ids[bhi - 1 - size]:
+            size += 1
+        if size:
+            blocks.append((ahi - size, bhi - size, size))
+            ahi -= size
+            bhi -= size
+
+        if alo == ahi or blo == bhi:
+            continue
+        if deadline is not None and time.monotonic() > deadline:
+            continue
+
+        split = _middle_snake(a_ids, alo, ahi, b_ids, blo, bhi)
+        if split is None:
+            continue
+        x, y = split
+        stack.append((alo + x, ahi, blo + y, bhi))
+        stack.append((alo, alo + x, blo, blo + y))
+
+    blocks.sort()
+
+    # Merge adjacent blocks produced by neighbouring subproblems
+    merged: List[Tuple[int, int, int]] = []
+    for i, j, size in blocks:
+        if merged:
+            pi, pj, psize = merged[-1]
+            if pi + psize == i and pj + psize == j:
+                merged[-1] = (pi, pj, psize + size)
+                continue
+        merged.append((i, j, size))
+    return merged
+
+
+def _middle_snake(a: List[int], alo: int, ahi: int,
+                  b: List[int], blo: int, bhi: int) -> Optional[Tuple[int, int]]:
+    """Split point (x, y) relative to (alo, blo) on the middle snake of the edit graph.
+
+    Returns None when the ranges have nothing in common. After max_cost
+    rounds the furthest forward point is used instead (as in git's xdiff),
+    which keeps pathological inputs bounded at the price of a slightly
+    longer edit script.
+    """
+    n, m = ahi - alo, bhi - blo
+    max_d = (n + m + 1) // 2
+    max_cost = max(256, int((n + m) ** 0.5))
+    offset = max_d + 1
+    size = 2 * max_d + 3
+    forward = [-1] * size
+    backward = [-1] * size
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+
+    for d in range(max_d + 1):
+        if d > max_cost:
+            return _furthest_forward(forward, offset, d, n, m)
+
+        # Forward path
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and forward[k1_offset - 1] < forward[k1_offset + 1]):
+                x1 = forward[k1_offset + 1]
+            else:
+                x1 = forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < size and backward[k2_offset] != -1:
+                    if x1 >= n - backward[k2_offset]:
+                        return x1, y1
+
+        # Reverse path
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and backward[k2_offset - 1] < backward[k2_offset + 1]):
+                x2 = backward[k2_offset + 1]
+            else:
+                x2 = backward[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - 1 - x2] == b[bhi - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            backward[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < size and forward[k1_offset] != -1:
+                    x1 = forward[k1_offset]
+                    y1 = offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return x1, y1
+
+    return None
+
+
+def _furthest_forward(forward: List[int], offset: int, d: int, n: int, m: int) -> Optional[Tuple[int, int]]:
+    """Forward point with the largest x + y, used when max_cost is exceeded"""
+    best = None
+    best_sum = 0
+    for k in range(-d + 1, d, 2):
+        x = forward[offset + k]
+        if x < 0:
+            continue
+        x = min(x, n)
+        y = x - k
+        if 0 <= y <= m and x + y > best_sum and (x, y) != (n, m):
+            best, best_sum = (x, y), x + y
+    return best
+
+
+def opcodes_from_blocks(blocks: List[Tuple[int, int, int]], len_a: int, len_b: int) -> List[Opcode]:
+    """Convert matching blocks into opcodes, the same way SequenceMatcher does"""
+    opcodes: List[Opcode] = []
+    i = j = 0
+    for ai, bj, size in blocks + [(len_a, len_b, 0)]:
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+
+def blocks_from_opcodes(opcodes: List[Opcode]) -> List[Tuple[int, int, int]]:
+    """Matching blocks (i, j, size) of the 'equal' opcodes - inverse of opcodes_from_blocks()"""
+    return [(i1, j1, i2 - i1) for tag, i1, i2, j1, j2 in opcodes if tag == 'equal']
+
+
+def compose_blocks(ab: Sequence[Sequence[int]], bc: Sequence[Sequence[int]]) -> List[Tuple[int, int, int]]:
+    """Matching blocks of a -> c from the matching blocks of a -> b and b -> c.
+
+    A line of a stays matched when it is carried unchanged through b into c.
+    Linear in the number of blocks; the result is a common subsequence of a
+    and c, not necessarily the longest (a line removed in b and restored in
+    c is reported as changed).
+    """
+    composed: List[Tuple[int, int, int]] = []
+    x = y = 0
+    while x < len(ab) and y < len(bc):
+        ai, bj, size1 = ab[x]
+        bk, cl, size2 = bc[y]
+        lo, hi = max(bj, bk), min(bj + size1, bk + size2)
+        if lo < hi:
+            i, k, size = ai + lo - bj, cl + lo - bk, hi - lo
+            if composed and composed[-1][0] + composed[-1][2] == i and composed[-1][1] + composed[-1][2] == k:
+                i, k, size = composed[-1][0], composed[-1][1], composed.pop()[2] + size
+            composed.append((i, k, size))
+        if bj + size1 <= bk + size2:
+            x += 1
+        else:
+            y += 1
+    return composed
+
+
+def unique_line_chain(lines1: Sequence[str], lines2: Sequence[str],
+                      lo1: int, hi1: int, lo2: int, hi2: int) -> List[Tuple[int, int]]:
+    """Longest increasing chain of non-empty lines that occur once on each side of the range"""
+    counts1: Dict[str, int] = {}
+    positions1: Dict[str, int] = {}
+    for i in range(lo1, hi1):
+        line = lines1[i]
+        counts1[line] = counts1.get(line, 0) + 1
+        positions1[line] = i
+
+    counts2: Dict[str, int] = {}
+    positions2: Dict[str, int] = {}
+    for j in range(lo2, hi2):
+        line = lines2[j]
+        counts2[line] = counts2.get(line, 0) + 1
+        positions2[line] = j
+
+    pairs = sorted(
+        (positions1[line], positions2[line])
+        for line, count in counts1.items()
+        if count == 1 and counts2.get(line) == 1 and line.strip()
+    )
+    if not pairs:
+        return []
+
+    # Patience sorting: longest increasing subsequence by the second index
+    tails: List[int] = []       # tails[k] = index in pairs of the smallest tail of a chain of length k+1
+    tail_values: List[int] = []
+    back: List[int] = [-1] * len(pairs)
+    for p, (_, idx2) in enumerate(pairs):
+        k = bisect.bisect_left(tail_values, idx2)
+        if k > 0:
+            back[p] = tails[k - 1]
+        if k == len(tails):
+            tails.append(p)
+            tail_values.append(idx2)
+        else:
+            tails[k] = p
+            tail_values[k] = idx2
+
+    chain = []
+    p = tails[-1]
+    while p != -1:
+        chain.append(pairs[p])
+        p = back[p]
+    chain.reverse()
+    return chain
@@ -0,0 +1,26 @@
+"""
+Sentence Splitting
+Lossless sentence segmentation for long paragraph lines
+"""
+import re
+from typing import List
+
+
+# Sentence end: terminal punctuation, whitespace, then something that can start a sentence.
+# "г. москва" or "т.е. оплата" stay together because a lowercase letter follows.
+_SENTENCE_END = re.compile(r'(?<=[.!?…;])\s+(?=[«"(\[A-ZА-ЯЁ0-9])')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences; trailing whitespace stays with its sentence.
+
+    The split is lossless: "".join(split_sentences(text)) == text.
+    """
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
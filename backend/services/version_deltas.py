@@ -0,0 +1,119 @@
+"""
+Version Deltas
+Stored parent -> child line deltas of document versions, composed to diff any two versions of a chain
+"""
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models.document import DocumentVersion, VersionDelta
+from services.compute_pool import compute_pool
+from services import compute_tasks
+from services.myers_diff import compose_blocks
+from services.version_store import version_store
+
+logger = logging.getLogger(__name__)
+
+Block = Tuple[int, int, int]
+
+
+class VersionDeltas:
+    """Parent deltas of document versions.
+
+    Every version with a parent gets its delta (matching blocks of identical
+    lines) computed on the compute pool after it is created; the change
+    counts of that diff are written to the version as a by-product, and
+    its content is replaced by the encoded delta (version_store). Two
+    versions of one chain are then aligned by composing the stored deltas
+    between them instead of diffing the texts from scratch.
+    """
+
+    def __init__(self, max_chain: int = settings.VERSION_DELTA_MAX_CHAIN):
+        self.max_chain = max_chain
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, version_id: str) -> None:
+        """Compute the parent delta of a version in the background"""
+        task = asyncio.create_task(self.compute(version_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def compute(self, version_id: str) -> bool:
+        """Diff a version against its parent, store the delta and the change counts"""
+        db = SessionLocal()
+        try:
+            version = db.query(DocumentVersion).filter(DocumentVersion.id == version_id).first()
+            if version is None or not version.parent_version_id:
+                return False
+            parent = db.query(DocumentVersion).filter(DocumentVersion.id == version.parent_version_id).first()
+            if parent is None:
+                return False
+
+            text = version.content or ""
+            delta = await compute_pool.run(compute_tasks.version_delta, parent.content or "", text)
+
+            db.merge(VersionDelta(
+                version_id=version.id,
+                parent_version_id=parent.id,
+                document_id=version.document_id,
+                parent_lines=delta["parent_lines"],
+                child_lines=delta["child_lines"],
+                blocks=delta["blocks"]
+            ))
+            summary = delta["summary"]
+            version.change_count = summary["total_changes"]
+            version.critical_changes = summary["critical_changes"]
+            version.major_changes = summary["major_changes"]
+            version.minor_changes = summary["minor_changes"]
+            version_store.compact(version, text, delta["content_delta"])
+            db.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Version delta of {version_id} failed: {e}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def alignment(self, db: Session, version1: DocumentVersion,
+                  version2: DocumentVersion) -> Optional[List[Block]]:
+        """Matching blocks of version1 -> version2 composed from stored deltas.
+
+        None when the versions are not on one parent chain, a delta on the
+        way is missing (still being computed), the chain exceeds max_chain,
+        or composing would touch more blocks than a fresh diff reads lines.
+        """
+        if version1.document_id != version2.document_id or version1.id == version2.id:
+            return None
+        forward = version1.version_number < version2.version_number
+        older, newer = (version1, version2) if forward else (version2, version1)
+
+        # Walk the deltas back from the newer version (rows only, no version content)
+        chain: List[VersionDelta] = []
+        current_id = newer.id
+        while current_id != older.id:
+            if len(chain) >= self.max_chain:
+                return None
+            delta = db.query(VersionDelta).filter(VersionDelta.version_id == current_id).first()
+            if delta is None:
+                return None
+            chain.append(delta)
+            current_id = delta.parent_version_id
+        chain.reverse()
+
+        if sum(len(delta.blocks) for delta in chain) >= chain[0].parent_lines + chain[-1].child_lines:
+            return None
+
+        blocks: List[Block] = [tuple(block) for block in chain[0].blocks]
+        for delta in chain[1:]:
+            blocks = compose_blocks(blocks, delta.blocks)
+        if not forward:
+            blocks = [(j, i, size) for i, j, size in blocks]
+        return blocks
+
+
+version_deltas = VersionDeltas()
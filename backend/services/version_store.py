@@ -0,0 +1,173 @@
+"""
+Version Store
+Version content as periodic full snapshots plus forward line deltas against the parent version
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from config import settings
+
+# Prefix of a delta stored in DocumentVersion.content (anything else is a full snapshot)
+DELTA_PREFIX = "delta:"
+
+# Delta op: [parent_line, count] copies parent lines, a string is inserted as is
+DeltaOp = Union[List[int], str]
+
+
+def is_delta(stored: Optional[str]) -> bool:
+    return bool(stored) and stored.startswith(DELTA_PREFIX)
+
+
+def encode_delta(parent_text: str, text: str, blocks: Sequence[Sequence[int]]) -> str:
+    """Delta turning parent_text into text, from matching blocks of their splitlines().
+
+    Lines keep their terminators, so apply_delta() restores text exactly;
+    a matched line whose terminator differs is stored as an insertion.
+    """
+    parent_lines = parent_text.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops: List[DeltaOp] = []
+
+    def insert(line: str) -> None:
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += line
+        else:
+            ops.append(line)
+
+    j = 0
+    for i1, j1, size in list(blocks) + [(len(parent_lines), len(lines), 0)]:
+        for line in lines[j:j1]:
+            insert(line)
+        for k in range(size):
+            if parent_lines[i1 + k] != lines[j1 + k]:
+                insert(lines[j1 + k])
+            elif ops and isinstance(ops[-1], list) and sum(ops[-1]) == i1 + k:
+                ops[-1][1] += 1
+            else:
+                ops.append([i1 + k, 1])
+        j = j1 + size
+    return DELTA_PREFIX + json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_delta(parent_text: str, stored: str) -> str:
+    """Text of a version from its parent's text and its stored delta"""
+    parent_lines = parent_text.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(stored[len(DELTA_PREFIX):]):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(parent_lines[op[0]:op[0] + op[1]])
+    return "".join(parts)
+
+
+class VersionStore:
+    """Materializes delta-encoded version content, with an LRU of recent texts.
+
+    A version is stored in full when it has no parent or when its parent is
+    snapshot_interval - 1 deltas away from the last full snapshot; otherwise
+    version_deltas replaces its full text with a delta once computed. Reads
+    apply the deltas from the nearest snapshot or cached ancestor forward.
+    Version content never changes, so cached texts need no invalidation;
+    the cache is bounded by the total number of characters it holds.
+    """
+
+    def __init__(self, snapshot_interval: int = settings.VERSION_SNAPSHOT_INTERVAL,
+                 cache_chars: int = settings.VERSION_CACHE_CHARS):
+        self.snapshot_interval = snapshot_interval
+        self.cache_chars = cache_chars
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cached_chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, version: Any) -> Optional[str]:
+        """Full text of a version (an object with id, stored_content and parent_version)"""
+        stored = version.stored_content
+        if not is_delta(stored):
+            return stored
+        text = self._cached(version.id)
+        if text is not None:
+            return text
+
+        # Collect deltas back to the nearest full snapshot or cached text
+        chain = [version]
+        current = version.parent_version
+        while True:
+            if current is None:
+                raise ValueError(f"Version {chain[-1].id} is stored as a delta but has no parent")
+            if not is_delta(current.stored_content):
+                text = current.stored_content or ""
+                break
+            text = self._cached(current.id)
+            if text is not None:
+                break
+            chain.append(current)
+            current = current.parent_version
+
+        for delta_version in reversed(chain):
+            text = apply_delta(text, delta_version.stored_content)
+        self._remember(version.id, text)
+        return text
+
+    def compact(self, version: Any, text: str, delta: str) -> bool:
+        """Store version as delta (from encode_delta) unless it is due for a full snapshot"""
+        if is_delta(version.stored_content) or len(delta) >= len(text):
+            return False
+        if self.depth(version.parent_version) + 1 >= self.snapshot_interval:
+            return False
+        version.stored_content = delta
+        self._remember(version.id, text)
+        return True
+
+    def depth(self, version: Any) -> int:
+        """Number of deltas between a version and its full snapshot"""
+        depth = 0
+        while version is not None and is_delta(version.stored_content):
+            depth += 1
+            version = version.parent_version
+        return depth
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._cached_chars = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "chars": self._cached_chars,
+                "max_chars": self.cache_chars,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _cached(self, version_id: str) -> Optional[str]:
+        with self._lock:
+            text = self._cache.get(version_id)
+            if text is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(version_id)
+            self.hits += 1
+            return text
+
+    def _remember(self, version_id: str, text: str) -> None:
+        if len(text) > self.cache_chars:
+            return
+        with self._lock:
+            if version_id in self._cache:
+                self._cache.move_to_end(version_id)
+                return
+            self._cache[version_id] = text
+            self._cached_chars += len(text)
+            while self._cached_chars > self.cache_chars:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_chars -= len(evicted)
+
+
+version_store = VersionStore()
@@ -11,6 +11,7 @@ let state = {
     currentTool: null,
     lastMergedDocumentId: null,
     currentUser: null,
+    aiSummaryComparisonId: null, // comparison whose AI summary is being polled
     toolsFile: null // shared file for tools section
 };
 
@@ -680,7 +681,9 @@ async function runComparison() {
 
         // Логирование результатов AI
         if (state.selectedMode === 'semantic') {
-            if (result.ai_enhanced) {
+            if (result.ai_summary_status === 'pending') {
+                addInlineLog(progressId, '⏳ AI резюме формируется, различия уже готовы', 'ai');
+            } else if (result.ai_enhanced) {
                 addInlineLog(progressId, '✅ AI анализ выполнен успешно (GPT)', 'ai');
             } else {
                 addInlineLog(progressId, '⚠️ AI недоступен, использован автоматический анализ', 'warning');
@@ -728,12 +731,29 @@ function renderResults(result) {
     document.getElementById('diffFilename1').textContent = doc1Name;
     document.getElementById('diffFilename2').textContent = doc2Name;
 
-    // AI Summary
+    renderAiSummary(result);
+    state.aiSummaryComparisonId = null;
+    if (result.ai_summary_status === 'pending') {
+        pollAiSummary(result.id);
+    }
+
+    renderSideBySideDiff(result);
+
+    // Прокрутка к результатам
+    document.getElementById('resultsPanel').scrollIntoView({ behavior: 'smooth' });
+}
+
+function renderAiSummary(result) {
     const aiSummarySection = document.getElementById('aiSummarySection');
     const aiSummaryContent = document.getElementById('aiSummaryContent');
     const aiBadge = document.getElementById('aiBadge');
 
-    if (aiSummarySection && result.ai_summary) {
+    if (aiSummarySection && result.ai_summary_status === 'pending') {
+        aiSummaryContent.innerHTML = '<em>AI резюме формируется...</em>';
+        aiBadge.textContent = '...';
+        aiBadge.classList.add('fallback');
+        aiSummarySection.classList.remove('hidden');
+    } else if (aiSummarySection && result.ai_summary) {
         let formattedSummary = result.ai_summary
             .replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>')
             .replace(/`(.+?)`/g, '<code>$1</code>')
@@ -753,11 +773,27 @@ function renderResults(result) {
     } else {
         aiSummarySection?.classList.add('hidden');
     }
+}
 
-    renderSideBySideDiff(result);
-
-    // Прокрутка к результатам
-    document.getElementById('resultsPanel').scrollIntoView({ behavior: 'smooth' });
+// AI резюме приходит после различий - опрашиваем, пока не будет готово
+async function pollAiSummary(comparisonId) {
+    state.aiSummaryComparisonId = comparisonId;
+    for (let attempt = 0; attempt < 90; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        // Пользователь уже запустил другое сравнение
+        if (state.aiSummaryComparisonId !== comparisonId) return;
+        try {
+            const response = await fetch(`${API_BASE}/compare/${comparisonId}/ai-summary`);
+            if (!response.ok) return;
+            const summary = await response.json();
+            if (summary.status !== 'pending') {
+                renderAiSummary({ ai_summary: summary.ai_summary, ai_enhanced: summary.ai_enhanced });
+                return;
+            }
+        } catch (error) {
+            return;
+        }
+    }
 }
 
 function renderSideBySideDiff(result) {
@@ -767,9 +803,11 @@ function renderSideBySideDiff(result) {
     const leftPane = document.getElementById('diffLeft');
     const rightPane = document.getElementById('diffRight');
 
-    if (result.diff_lines) {
-        const leftLines = result.diff_lines.left;
-        const rightLines = result.diff_lines.right;
+    const alignedLines = result.diff_lines || (result.diff ? expandCompactDiff(result.diff) : null);
+
+    if (alignedLines) {
+        const leftLines = alignedLines.left;
+        const rightLines = alignedLines.right;
 
         // Use table for synchronized row heights
         if (diffBody) {
@@ -873,6 +911,68 @@ function renderSideBySideDiff(result) {
     }
 }
 
+// Развернуть компактный diff (тексты + операции выравнивания) в строки left/right
+function expandCompactDiff(diff) {
+    const linesLeft = diff.left;
+    const linesRight = diff.right.slice();
+    const left = [];
+    const right = [];
+    let leftNum = 1;
+    let rightNum = 1;
+    const empty = () => ({ num: '', type: 'empty', text: '', html: '' });
+    const whole = line => [[0, line.length]];
+
+    diff.ops.forEach(op => {
+        const code = op[0];
+        if (code === '=') {
+            if (!diff.show_full) return;
+            const [, i, j, n] = op;
+            for (let k = 0; k < n; k++) {
+                const line = linesLeft[i + k];
+                linesRight[j + k] = line;
+                left.push({ num: leftNum++, type: 'unchanged', text: line, html: escapeHtml(line) });
+                right.push({ num: rightNum++, type: 'unchanged', text: line, html: escapeHtml(line) });
+            }
+        } else if (code === '~') {
+            const [, i, j, leftSpans, rightSpans] = op;
+            left.push({ num: leftNum++, type: 'modified', text: linesLeft[i], html: markSpans(linesLeft[i], leftSpans, 'diff-del') });
+            right.push({ num: rightNum++, type: 'modified', text: linesRight[j], html: markSpans(linesRight[j], rightSpans, 'diff-add') });
+        } else if (code === '-' || code === '>') {
+            const [, start, n, movedLine] = op;
+            for (let k = 0; k < n; k++) {
+                const line = linesLeft[start + k];
+                left.push(code === '-'
+                    ? { num: leftNum++, type: 'deleted', text: line, html: markSpans(line, whole(line), 'diff-del') }
+                    : { num: leftNum++, type: 'moved', text: line, html: markSpans(line, whole(line), 'diff-move'), moved_line: movedLine });
+                right.push(empty());
+            }
+        } else {
+            const [, start, n, movedLine] = op;
+            for (let k = 0; k < n; k++) {
+                const line = linesRight[start + k];
+                left.push(empty());
+                right.push(code === '+'
+                    ? { num: rightNum++, type: 'added', text: line, html: markSpans(line, whole(line), 'diff-add') }
+                    : { num: rightNum++, type: 'moved', text: line, html: markSpans(line, whole(line), 'diff-move'), moved_line: movedLine });
+            }
+        }
+    });
+
+    return { left, right };
+}
+
+// Обернуть диапазоны [start, end) строки в <mark class="...">
+function markSpans(text, spans, cssClass) {
+    let html = '';
+    let pos = 0;
+    spans.forEach(([start, end]) => {
+        html += escapeHtml(text.slice(pos, start));
+        html += `<mark class="${cssClass}">${escapeHtml(text.slice(start, end))}</mark>`;
+        pos = end;
+    });
+    return html + escapeHtml(text.slice(pos));
+}
+
 function buildDiffLines(changes) {
     const left = [];
     const right = [];
@@ -896,6 +996,16 @@ function buildDiffLines(changes) {
                 left.push({ num: '', type: 'empty', html: '' });
                 right.push({ num: rightNum++, type: 'added', html: highlightText(line, 'added') });
             });
+        } else if (type === 'MOVED') {
+            // Moved block - source position on the left, new position on the right
+            originalLines.forEach(line => {
+                left.push({ num: leftNum++, type: 'moved', html: escapeHtml(line) });
+                right.push({ num: '', type: 'empty', html: '' });
+            });
+            newLines.forEach(line => {
+                left.push({ num: '', type: 'empty', html: '' });
+                right.push({ num: rightNum++, type: 'moved', html: escapeHtml(line) });
+            });
         } else if (type === 'MODIFIED' || type === 'REWORDED') {
             const maxLen = Math.max(originalLines.length, newLines.length);
             for (let i = 0; i < maxLen; i++) {